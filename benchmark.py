@@ -0,0 +1,564 @@
+""" This script runs micro benchmarks for the data processing pipeline
+
+It is used to measure how changes to the data processing affect its performance.
+The benchmarks work on synthetic data, such that they can be run without the data
+recorded in the experiment
+
+There are the following benchmarks available
+    accumulation
+        collects the frames of a synthetic long clip once by growing a numpy
+        array with np.concatenate for every frame, as it was done before, and
+        once with the preallocated FrameBuffer. It reports the time and the
+        number of bytes copied for both
+    pipeline
+        extracts the faces from a synthetic video once without and once with
+        the decoding pipeline of the VideoHandler for different numbers of
+        extraction threads. It reports the frames per second together with the
+        queue depths and stall times, which can be used to tune the pipeline.
+        It needs the face detection model in the resources directory
+    detection
+        runs the face detection of the FaceExtractor on synthetic frames with
+        different numbers of frames per forward pass of the network. It reports
+        the frames per second for every batch size. It needs the face detection
+        model in the resources directory
+    tracking
+        finds the face in every frame of a video once by running the face
+        detection on every frame and once with the FaceTracker for different
+        detection intervals. It reports how many detections the tracker needed,
+        the frames per second and how well the tracked boxes agree with the
+        detected ones (intersection over union). It needs the face detection
+        model in the resources directory and is only meaningful with a video
+        of a real face
+    detectors
+        runs every face detection backend over a video. It reports the frames
+        per second, the share of frames a face was found in and how well the
+        boxes agree with the ones of the SSD network at 300x300 (intersection
+        over union) in the frames it found a face in. Backends whose models or
+        libraries are missing are skipped. It is only meaningful with a video
+        of a real face
+    flow
+        computes the optical flow between consecutive frames of a video,
+        converted to greyscale and resized to the crop size like the faces,
+        with every optical flow backend and with a few faster settings of
+        Farneback's algorithm (l: levels, w: winsize, i: iterations). It reports the frame pairs per second and how
+        far the flow fields are from the ones of Farneback's algorithm with
+        its default settings (mean endpoint error in pixels). On crops below
+        about 100 pixels DIS computes the ultrafast and fast presets at full
+        resolution, so they can be slower than the medium one
+    flowengine
+        computes the optical flow images of consecutive frames once by
+        allocating every array for every pair and stacking the images, as it
+        was done before, and once with the buffers of the OpticalFlow writing
+        into a preallocated array, with and without the previous flow as the
+        initial guess, for Farneback's algorithm and DIS at its medium preset.
+        It reports the frame pairs per second and how much the images differ
+        from the allocating version
+    flowworkers
+        computes the optical flow images of consecutive frames once frame by
+        frame and once with parallel_optical_flow for different numbers of
+        worker processes, up to the number of cores. It reports the frame pairs
+        per second, the speedup over the single process, the speedup per worker
+        and whether the images are the same
+
+...
+
+Arguments:
+    Benchmark (str):
+        One of 'accumulation', 'pipeline', 'detection', 'tracking', 'detectors',
+        'flow', 'flowengine', 'flowworkers'
+    --frames, -f (optional, int):
+        Number of frames of the synthetic clip
+        default: 5400 (3 minutes at 30 fps)
+    --crop, -c (optional, int):
+        The crop size of the synthetic frames
+        default: 64
+    --queue-size, -qs (optional, int):
+        The queue size of the decoding pipeline
+        default: 32
+    --video, -v (optional, str):
+        A recorded video to run the tracking, detectors and flow benchmarks on
+        instead of the synthetic one. At most --frames frames of it are used
+    --batch-size, -bs (optional, int):
+        Number of frames handed to a backend at once in the detectors benchmark
+        default: 1
+    --drift-threshold, -dt (optional, float):
+        The drift threshold of the FaceTracker
+        default: 8.0
+    --iou (optional, float):
+        Intersection over union above which a tracked box counts as matching
+        the detected one
+        default: 0.8
+"""
+
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from lib.dataprocessing import FrameBuffer
+from lib.dataprocessing import FrameIndex
+from lib.dataprocessing import VideoHandler
+from lib.dataprocessing.facedetect import DETECTORS
+from lib.dataprocessing.faceextract import FaceExtractor
+from lib.dataprocessing.facetrack import FaceTracker
+from lib.dataprocessing.opticalflow import FLOW_BACKENDS, OpticalFlow, flow_image, parallel_optical_flow
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('Benchmark',
+                     choices=['accumulation', 'pipeline', 'detection', 'tracking', 'detectors', 'flow', 'flowengine',
+                              'flowworkers'],
+                     help='The benchmark to run')
+parser.add_argument('--frames', '-f',
+                     default=5400,
+                     help='Number of frames of the synthetic clip')
+parser.add_argument('--crop', '-c',
+                     default=64,
+                     help='The crop size of the synthetic frames')
+parser.add_argument('--queue-size', '-qs',
+                     default=32,
+                     help='The queue size of the decoding pipeline')
+parser.add_argument('--video', '-v',
+                     help='A recorded video to run the tracking, detectors\
+                           and flow benchmarks on')
+parser.add_argument('--batch-size', '-bs',
+                     default=1,
+                     help='Number of frames handed to a detection backend at once')
+parser.add_argument('--drift-threshold', '-dt',
+                     default=8.0,
+                     help='The drift threshold of the face tracker')
+parser.add_argument('--iou',
+                     default=0.8,
+                     help='Intersection over union above which a tracked box\
+                           matches the detected one')
+arguments = parser.parse_args()
+
+
+benchmark = arguments.Benchmark
+n_frames  = int(arguments.frames)
+cropsize  = int(arguments.crop)
+queuesize = int(arguments.queue_size)
+video     = arguments.video
+batchsize = int(arguments.batch_size)
+drift     = float(arguments.drift_threshold)
+min_iou   = float(arguments.iou)
+
+assert n_frames > 0
+assert cropsize > 0
+assert queuesize > 0
+assert video is None or os.path.isfile(video)
+assert batchsize > 0
+assert drift > 0
+assert 0 < min_iou <= 1
+
+
+
+def accumulation():
+    """Compares growing an array frame by frame to the preallocated FrameBuffer"""
+
+    frame       = np.random.randint(0, 256, (cropsize, cropsize), dtype=np.uint8)
+    frame_bytes = frame.nbytes
+
+    # growing the array with np.concatenate copies the whole array every time
+    copied = 0
+    start  = time.perf_counter()
+    frames = np.zeros([1, cropsize, cropsize], dtype=np.uint8)
+    for _ in range(n_frames):
+        copied += frames.nbytes + frame_bytes
+        frames  = np.concatenate((frames, np.expand_dims(frame, axis=0)), axis=0)
+    frames = frames[1:,...]
+    concat_time = time.perf_counter() - start
+
+    # the frame buffer copies every frame once
+    start  = time.perf_counter()
+    buffer = FrameBuffer(n_frames, (cropsize, cropsize))
+    for _ in range(n_frames):
+        buffer.append(frame)
+    buffered = buffer.data()
+    buffer_time   = time.perf_counter() - start
+    buffer_copied = n_frames * frame_bytes
+
+    assert frames.shape == buffered.shape
+
+    print('{:<15}{:>12}{:>18}'.format('', 'time (s)', 'copied (MB)'))
+    print('{:<15}{:>12.3f}{:>18.1f}'.format('np.concatenate', concat_time, copied / 1e6))
+    print('{:<15}{:>12.3f}{:>18.1f}'.format('FrameBuffer', buffer_time, buffer_copied / 1e6))
+
+
+
+def synthetic_video(directory: str, fps: int = 30):
+    """Writes a synthetic video with a moving bright ellipse on a noisy background
+
+    Parameters:
+        directory (str):
+            directory to write the video to
+        fps (int):
+            frame rate of the video
+            default: 30
+
+    Returns:
+        str, datetime: path to the video and its starting time
+    """
+
+    start = datetime.datetime(2019, 1, 1, 12, 0, 0)
+    path  = os.path.join(directory, '{}.mp4'.format(start.strftime('%Y-%m-%d_%H-%M-%S')))
+
+    # a fixed background with a little sensor noise, like a fixed webcam
+    background = np.random.randint(0, 64, (480, 640, 3), dtype=np.uint8)
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (640, 480))
+    for i in range(n_frames):
+        frame = cv2.add(background, np.random.randint(0, 4, (480, 640, 3), dtype=np.uint8))
+        center = (320 + int(40 * np.sin(i / 20)), 240)
+        cv2.ellipse(frame, center, (90, 120), 0, 0, 360, (170, 190, 220), -1)
+        writer.write(frame)
+    writer.release()
+
+    return path, start
+
+
+
+def read_frames(path: str):
+    """Generator that reads the first frames of a video
+
+    Parameters:
+        path (str):
+            path to the video
+
+    Yields:
+        ndarray: up to --frames frames
+    """
+
+    capture = cv2.VideoCapture(path)
+    for _ in range(n_frames):
+        success, frame = capture.read()
+        if not success:
+            break
+        yield frame
+    capture.release()
+
+
+
+def box_iou(a: np.ndarray, b: np.ndarray):
+    """Computes the intersection over union of two face boxes
+
+    Parameters:
+        a, b (np.ndarray):
+            (x1, y1, x2, y2, confidence) boxes, a confidence of 0 means that
+            no face was found
+
+    Returns:
+        float: the intersection over union, 1 if both found no face and 0 if
+            only one of them found a face
+    """
+
+    # both found no face, which is as good as the same box
+    if a[4] <= 0 and b[4] <= 0:
+        return 1.0
+    if a[4] <= 0 or b[4] <= 0:
+        return 0.0
+    w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - w * h
+    return w * h / union if union > 0 else 0.0
+
+
+
+def pipeline():
+    """Compares the sequential extraction to the decoding pipeline"""
+
+    with tempfile.TemporaryDirectory() as directory:
+        path, start = synthetic_video(directory)
+        end = start + datetime.timedelta(days=1)
+        # build the frame index up front, such that it isn't part of the timing
+        FrameIndex(path)
+
+        print('{:<10}{:>10}{:>12}{:>16}{:>16}'.format('threads', 'fps', 'max depth', 'decoder stall', 'extract stall'))
+        for threads in [0, 1, 2, 4]:
+            handler = VideoHandler(path, pipeline_threads=threads, queue_size=queuesize)
+
+            begin  = time.perf_counter()
+            handler.get_interval_frames([(start, end)], cropsize, 'face')
+            fps    = n_frames / (time.perf_counter() - begin)
+
+            stats = handler.get_pipeline_stats()
+            if stats is None:
+                print('{:<10}{:>10.1f}{:>12}{:>16}{:>16}'.format('none', fps, '-', '-', '-'))
+            else:
+                print('{:<10}{:>10.1f}{:>12}{:>15.2f}s{:>15.2f}s'.format(
+                    threads, fps, stats['max_queue_depth'],
+                    stats['decoder_stall'], sum(stats['processor_stall']) / threads))
+
+
+
+def detection():
+    """Compares the face detection for different batch sizes"""
+
+    # a few distinct frames are enough, the network takes the same time for
+    # every frame
+    frames = []
+    for i in range(64):
+        frame = np.random.randint(0, 64, (480, 640, 3), dtype=np.uint8)
+        cv2.ellipse(frame, (320 + int(40 * np.sin(i / 20)), 240), (90, 120), 0, 0, 360, (170, 190, 220), -1)
+        frames.append(frame)
+
+    extractor = FaceExtractor()
+    # the first forward pass initialises the network
+    extractor.extract_faces(frames[:1], cropsize)
+
+    print('{:<12}{:>10}{:>12}'.format('batch size', 'fps', 'speedup'))
+    baseline = None
+    for batch_size in [1, 2, 4, 8, 16, 32]:
+        begin = time.perf_counter()
+        for first in range(0, n_frames, batch_size):
+            batch = [frames[i % len(frames)] for i in range(first, min(first + batch_size, n_frames))]
+            extractor.extract_faces(batch, cropsize)
+        fps = n_frames / (time.perf_counter() - begin)
+
+        baseline = baseline or fps
+        print('{:<12}{:>10.1f}{:>11.2f}x'.format(batch_size, fps, fps / baseline))
+
+
+
+def tracking():
+    """Compares the FaceTracker to the detection of the face in every frame"""
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = video if video is not None else synthetic_video(directory)[0]
+
+        # the boxes of the detection in every frame are the reference
+        extractor = FaceExtractor()
+        begin     = time.perf_counter()
+        detected  = np.concatenate([extractor.detect_faces([frame]) for frame in read_frames(path)])
+        fps       = len(detected) / (time.perf_counter() - begin)
+
+        print('{:<10}{:>12}{:>10}{:>10}{:>10}{:>10}{:>12}'.format('interval', 'detections', 'saved', 'fps', 'mean iou', 'min iou', 'iou >= {}'.format(min_iou)))
+        print('{:<10}{:>12}{:>9.1f}x{:>10.1f}{:>10}{:>10}{:>12}'.format('every', len(detected), 1.0, fps, '-', '-', '-'))
+
+        for interval in [5, 10, 20, 30]:
+            tracker = FaceTracker(extractor, interval, drift)
+            begin   = time.perf_counter()
+            tracked = np.concatenate([tracker.detect_faces([frame]) for frame in read_frames(path)])
+            fps     = len(tracked) / (time.perf_counter() - begin)
+
+            ious       = np.array([box_iou(a, b) for a, b in zip(detected, tracked)])
+            detections = tracker.stats()['detections']
+            print('{:<10}{:>12}{:>9.1f}x{:>10.1f}{:>10.3f}{:>10.3f}{:>11.1f}%'.format(
+                interval, detections, len(tracked) / detections, fps,
+                ious.mean(), ious.min(), 100 * (ious >= min_iou).mean()))
+
+
+
+def detectors():
+    """Compares the face detection backends to the SSD network at 300x300"""
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = video if video is not None else synthetic_video(directory)[0]
+
+        print('{:<12}{:>10}{:>12}{:>10}{:>12}'.format('detector', 'fps', 'detected', 'mean iou', 'iou >= {}'.format(min_iou)))
+
+        reference = None
+        for name in ['ssd'] + sorted(set(DETECTORS) - {'ssd'}):
+            # backends whose models or libraries are missing are skipped
+            try:
+                detector = DETECTORS[name]()
+            except Exception as error:
+                print('{:<12}not available: {}'.format(name, str(error).strip().splitlines()[0]))
+                continue
+
+            frames = list(read_frames(path))
+            begin  = time.perf_counter()
+            boxes  = np.concatenate([
+                detector.detect_faces(frames[first:first + batchsize])
+                for first in range(0, len(frames), batchsize)
+            ])
+            fps    = len(boxes) / (time.perf_counter() - begin)
+
+            if reference is None:
+                reference, reference_name = boxes, name
+            # agreement with the reference, on the frames it found a face in
+            found = reference[:, 4] > 0
+            ious  = np.array([box_iou(a, b) for a, b in zip(reference[found], boxes[found])])
+
+            print('{:<12}{:>10.1f}{:>11.1f}%{:>10.3f}{:>11.1f}%'.format(
+                name, fps, 100 * (boxes[:, 4] > 0).mean(),
+                ious.mean() if len(ious) else float('nan'),
+                100 * (ious >= min_iou).mean() if len(ious) else float('nan')))
+
+        if reference is not None:
+            print('')
+            print('The boxes are compared to the ones of {}'.format(reference_name))
+
+
+
+def flow():
+    """Compares the optical flow backends to Farneback's algorithm"""
+
+    with tempfile.TemporaryDirectory() as directory:
+        path   = video if video is not None else synthetic_video(directory)[0]
+        frames = [
+            cv2.cvtColor(cv2.resize(frame, (cropsize, cropsize)), cv2.COLOR_BGR2GRAY)
+            for frame in read_frames(path)
+        ]
+    pairs = list(zip(frames[:-1], frames[1:]))
+    assert len(pairs) > 0
+
+    # the workers of the batch script run OpenCV on a single thread, on small
+    # images its threads mostly add overhead
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(1)
+
+    # the default settings first, they are the reference
+    settings = [('farneback', {})] + [
+        ('farneback', {'levels': levels, 'winsize': winsize, 'iterations': iterations})
+        for levels, winsize, iterations in [(3, 9, 2), (2, 9, 1), (1, 5, 1)]
+    ] + [(backend, {}) for backend in FLOW_BACKENDS if backend != 'farneback']
+
+    print('{:<24}{:>12}{:>10}{:>12}'.format('backend', 'pairs/s', 'speedup', 'epe (px)'))
+
+    reference = None
+    for backend, options in settings:
+        of = OpticalFlow(backend, **options)
+        # the first call allocates the buffers of the backend
+        of.flow(*pairs[0])
+
+        # the fastest of a few runs, the pairs are computed quickly
+        pps = 0
+        for _ in range(3):
+            begin  = time.perf_counter()
+            fields = [of.flow(prev, curr) for prev, curr in pairs]
+            pps    = max(pps, len(pairs) / (time.perf_counter() - begin))
+
+        if reference is None:
+            reference, reference_pps = fields, pps
+        # mean length of the difference between the flow vectors
+        epe = np.mean([np.linalg.norm(a - b, axis=2).mean() for a, b in zip(reference, fields)])
+
+        name = backend + ''.join(' {}={}'.format(key[0], value) for key, value in options.items())
+        print('{:<24}{:>12.1f}{:>9.2f}x{:>12.3f}'.format(name, pps, pps / reference_pps, epe))
+
+    print('')
+    print('Mean flow of the reference: {:.3f} px'.format(
+        np.mean([np.linalg.norm(field, axis=2).mean() for field in reference])))
+
+    cv2.setNumThreads(threads)
+
+
+
+def flowengine():
+    """Compares allocating the optical flow images to the reused buffers"""
+
+    # a textured face that moves a little from frame to frame
+    texture = cv2.GaussianBlur(np.random.randint(0, 256, (2 * cropsize, 2 * cropsize), dtype=np.uint8), (7, 7), 0)
+    frames  = [
+        np.ascontiguousarray(texture[
+            cropsize // 2 + int(4 * np.sin(i / 10)):, cropsize // 2 + int(4 * np.cos(i / 7)):
+        ][:cropsize, :cropsize])
+        for i in range(n_frames)
+    ]
+    pairs = list(zip(frames[:-1], frames[1:]))
+
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(1)
+
+    print('{:<28}{:>12}{:>10}{:>14}'.format('', 'pairs/s', 'speedup', 'difference'))
+
+    for backend in ['farneback', 'dis-medium']:
+        # every array is allocated for every pair and the images are stacked
+        if backend == 'farneback':
+            compute = lambda prev, curr: cv2.calcOpticalFlowFarneback(prev, curr, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        else:
+            dis     = cv2.DISOpticalFlow_create(FLOW_BACKENDS[backend])
+            compute = lambda prev, curr: dis.calc(prev, curr, None)
+        # the fastest of a few runs
+        allocating = 0
+        for _ in range(3):
+            begin      = time.perf_counter()
+            reference  = np.stack([flow_image(compute(prev, curr)) for prev, curr in pairs])
+            allocating = max(allocating, len(pairs) / (time.perf_counter() - begin))
+
+        print('{:<28}{:>12.1f}{:>9.2f}x{:>14.3f}'.format(backend + ' allocating', allocating, 1.0, 0.0))
+
+        for name, initial_flow in [('buffers', False), ('initial flow', True)]:
+            images = np.empty([len(pairs), cropsize, cropsize, 3], dtype=np.uint8)
+
+            pps = 0
+            for _ in range(3):
+                of    = OpticalFlow(backend, initial_flow=initial_flow)
+                begin = time.perf_counter()
+                for i, (prev, curr) in enumerate(pairs):
+                    of.optical_flow(prev, curr, images[i])
+                pps = max(pps, len(pairs) / (time.perf_counter() - begin))
+
+            # mean absolute difference of the images
+            difference = np.abs(images.astype(np.int16) - reference).mean()
+            print('{:<28}{:>12.1f}{:>9.2f}x{:>14.3f}'.format(backend + ' ' + name, pps, pps / allocating, difference))
+
+    cv2.setNumThreads(threads)
+
+
+
+def flowworkers():
+    """Compares computing the optical flow frame by frame to the worker processes"""
+
+    # the same moving texture as in the flowengine benchmark
+    texture = cv2.GaussianBlur(np.random.randint(0, 256, (2 * cropsize, 2 * cropsize), dtype=np.uint8), (7, 7), 0)
+    frames  = np.stack([
+        texture[
+            cropsize // 2 + int(4 * np.sin(i / 10)):, cropsize // 2 + int(4 * np.cos(i / 7)):
+        ][:cropsize, :cropsize]
+        for i in range(n_frames)
+    ])
+
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(1)
+
+    print('{:<12}{:>12}{:>10}{:>14}{:>8}'.format('workers', 'pairs/s', 'speedup', 'per worker', 'same'))
+
+    # a single process on a single thread
+    of        = OpticalFlow()
+    reference = np.empty([len(frames) - 1, cropsize, cropsize, 3], dtype=np.uint8)
+    begin     = time.perf_counter()
+    for i in range(1, len(frames)):
+        of.optical_flow(frames[i-1], frames[i], reference[i-1])
+    serial = (len(frames) - 1) / (time.perf_counter() - begin)
+
+    print('{:<12}{:>12.1f}{:>9.2f}x{:>13.2f}x{:>8}'.format('serial', serial, 1.0, 1.0, 'yes'))
+
+    cores   = os.cpu_count()
+    counts  = sorted({2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores} | {cores})
+    for workers in counts:
+        begin  = time.perf_counter()
+        images = parallel_optical_flow([frames], workers)[0]
+        pps    = (len(frames) - 1) / (time.perf_counter() - begin)
+
+        same = 'yes' if np.array_equal(images, reference) else 'no'
+        print('{:<12}{:>12.1f}{:>9.2f}x{:>13.2f}x{:>8}'.format(workers, pps, pps / serial, pps / serial / workers, same))
+
+    cv2.setNumThreads(threads)
+
+
+
+benchmarks = {
+    'accumulation': accumulation,
+    'pipeline': pipeline,
+    'detection': detection,
+    'tracking': tracking,
+    'detectors': detectors,
+    'flow': flow,
+    'flowengine': flowengine,
+    'flowworkers': flowworkers
+}
+
+print('')
+print('Benchmark: {}'.format(benchmark))
+print('Frames: {}'.format(n_frames))
+print('Cropsize: {}'.format(cropsize))
+print('')
+
+benchmarks[benchmark]()
@@ -0,0 +1,142 @@
+""" This script computes the optical flow data from the face data that was already
+extracted, without decoding the videos again
+
+The optical flow is computed between consecutive face images. If the face data
+of the participants was extracted before, e.g. with
+'process_data_batch.py -m face', the '{n}-{i}-face.npy' files already contain
+those images. This script reads them memory mapped and writes the matching
+'{n}-{i}-opticalflow.npy' files, together with a copy of the ground truth .json
+file, which takes seconds instead of a pass over the whole video. Faces of
+multiple crop sizes, like '{n}-{i}-face_64x64.npy', give the optical flow of
+every size, like '{n}-{i}-opticalflow_64x64.npy'. The frames are
+the same as the ones of the 'opticalflow' method of process_data_raw.py with the
+same optical flow options.
+
+The participants are distributed over a pool of worker processes. Outputs that
+are up to date according to the manifest of a participant are skipped. If the
+face data is up to date in the manifest, the optical flow is recorded such that
+process_data_raw.py with the same options skips it as well.
+
+...
+
+Arguments:
+
+    ProcessedDataRoot:
+        path to the output directory of process_data_batch.py, that contains
+        one directory with the face .npy files per participant, or the output
+        directory of a single participant
+    --workers, -w (optional, int):
+        number of worker processes the participants are distributed over
+        default: number of cores
+    --flow-workers, -fw (optional, int):
+        if larger than 1, the participants are derived one after another and
+        the frame pairs of every face file are split between this many worker
+        processes instead, which share the frames and the flow in shared
+        memory. Use it when there are fewer participants than cores
+        default: 1
+    --flow-backend, -fb (optional, str):
+        the optical flow backend, either 'farneback' or the DIS optical flow at
+        one of its presets 'dis-ultrafast', 'dis-fast' and 'dis-medium', see
+        process_data_raw.py
+        default: 'farneback'
+    --flow-levels, --flow-winsize, --flow-iterations (optional, int):
+        number of pyramid levels, size of the averaging window and number of
+        iterations of Farneback's algorithm
+        default: 3, 15, 3
+    --flow-initial (optional, flag):
+        if this flag is set, the optical flow of the previous frame pair is the
+        initial guess for the next one
+    --flow-format, -ff (optional, str):
+        the format the optical flow is stored in, 'image', 'float16' or 'int8',
+        see process_data_raw.py
+        default: 'image'
+    --force (optional, flag):
+        if this flag is set, all the optical flow data is computed again, even
+        if it is up to date
+"""
+
+
+
+import argparse
+import os
+import re
+
+import lib.dataprocessing as dp
+
+
+# the worker processes may import this script, so only the main process runs it
+if __name__ == '__main__':
+
+    # Argument Parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ProcessedDataRoot',
+                         help='The directory that holds one directory with the\
+                               face data per participant')
+    parser.add_argument('--workers', '-w',
+                         default=os.cpu_count(),
+                         help='Number of worker processes')
+    parser.add_argument('--flow-workers', '-fw',
+                         default=1,
+                         help='Number of worker processes the pairs of a face\
+                               file are split between')
+    dp.add_flow_arguments(parser)
+    parser.add_argument('--force',
+                         default=False,
+                         action='store_true',
+                         help='If set outputs that are up to date are computed again')
+    arguments = parser.parse_args()
+
+
+    # Argument Processing
+    root_path = os.path.abspath(arguments.ProcessedDataRoot)
+    workers   = int(arguments.workers)
+    resume    = not arguments.force
+
+    # options of the optical flow, the same as the ones of the video handler
+    flow_settings = dp.flow_settings(arguments)
+    flow_settings['flow_workers'] = int(arguments.flow_workers)
+
+
+    # Assertion Checks
+    assert os.path.exists(root_path) and os.path.isdir(root_path)
+
+    assert workers > 0
+    assert flow_settings['flow_workers'] > 0
+
+    # every directory with face data in it is the data of one participant
+    def has_faces(path):
+        return any([re.fullmatch(r'(\d+-\d+-face(_\d+x\d+)?|face(_\d+x\d+)?_lecture_video)(_step\d+-\d+)?\.npy', file) for file in os.listdir(path)])
+
+    participant_paths = [root_path] if has_faces(root_path) else sorted([
+        os.path.join(root_path, directory)
+        for directory in os.listdir(root_path)
+        if os.path.isdir(os.path.join(root_path, directory))
+        and has_faces(os.path.join(root_path, directory))
+    ])
+
+
+    print('')
+    print('Processed Data: {}'.format(root_path))
+    print('Participants: {}'.format(len(participant_paths)))
+    print('Optical Flow: {} ({})'.format(flow_settings['flow_backend'], flow_settings['flow_format']))
+    print('Workers: {}'.format(workers if flow_settings['flow_workers'] == 1 else '{} flow workers'.format(flow_settings['flow_workers'])))
+    print('')
+
+    failed = []
+    results = dp.derive_participants(participant_paths, workers, resume, **flow_settings)
+    for done, (participant_path, frame_counts, skipped, duration, error) in enumerate(results, start=1):
+        participant = os.path.basename(participant_path)
+
+        if error is None:
+            print('[{}/{}] {}: {} files ({} up to date), {} frames in {:.1f}s'.format(
+                done, len(participant_paths), participant,
+                len(frame_counts), len(skipped), sum(frame_counts.values()), duration))
+        else:
+            failed.append(participant)
+            print('[{}/{}] {}: FAILED after {:.1f}s'.format(done, len(participant_paths), participant, duration))
+            print(error)
+
+    print('')
+    print('Output written to {}'.format(root_path))
+    if failed:
+        print('Failed participants: {}'.format(', '.join(failed)))
@@ -12,16 +12,113 @@ Classes:
         Handles the JSON file created by the n-back experiment implemented in
         JsPsych. Processes the data and offers various method to access the
         relevant information
+    FaceBoxes
+        Bounding boxes of the face in the processed frames of a video, stored
+        next to the video, to crop the faces again without detecting them
+    FaceLandmarks
+        Facial landmarks of the processed frames of a video, stored next to the
+        video, to crop the eye again without searching the landmarks
+    FrameBuffer
+        Preallocated buffer that frames are written into in place, instead of
+        growing a numpy array frame by frame
+    FrameIndex
+        Index of the timestamps of every frame of a video, stored next to the
+        video, to look up frame numbers without seeking
+    Manifest
+        Records the outputs written for a participant together with their
+        inputs and checksums, to skip the outputs that are up to date
+    NpyWriter
+        Writes frames into a memory mapped .npy file one by one as they are
+        processed, without holding all of them in memory
     Statistic
         Computes various statistics about the experiment data, such as average
         score and so on
     VideoHandler
         Handles the video recorded during the experiment and is able to extract
         the frames needed for the data
+
+Variables:
+    DETECTORS
+        The face detection backends that can be used for the extraction of the
+        faces, by name
+    FLOW_BACKENDS
+        The optical flow backends that can be used for the optical flow images,
+        by name
+    FLOW_FORMATS
+        The formats the optical flow can be stored in, the rgb 'image' or the
+        raw flow field as 'float16' or 'int8', by name
+    METHODS
+        The processing methods, 'face', 'opticalflow' and every region of the
+        face
+    REGIONS
+        The regions of the face that can be cropped from the facial landmarks,
+        like the right eye 'eye', by name
+
+Functions:
+    add_flow_arguments(parser)
+        adds the command line arguments of the optical flow to a parser
+    add_processing_arguments(parser)
+        adds the command line arguments of the video processing, shared by the
+        processing scripts, to a parser
+    flow_settings(arguments)
+        returns the settings of the optical flow of the parsed arguments
+    handler_options(arguments)
+        returns the options of the VideoHandler of the parsed arguments
+    crop_sizes(arguments), frame_offsets(arguments)
+        return the crop sizes and the frame offsets of the parsed arguments
+    decode_flow(flow)
+        converts stored optical flow fields back to float32 pixels
+    flow_image(flow)
+        renders an optical flow field as an rgb image
+    parallel_optical_flow(sequences, workers, backend, output)
+        computes the optical flow between consecutive frames of sequences in
+        worker processes that share the frames and the flow in shared memory
+    process_participant(exp_data_path, output_path, methods, crop, lecture_video,
+                        workers, resume, frame_offsets)
+        processes the video of a single participant into .npy files, optionally
+        splitting the trials between multiple worker processes and skipping
+        the trials that are up to date
+    process_participants(exp_data_paths, output_path, methods, crop,
+                         lecture_video, workers, resume, frame_offsets)
+        processes multiple participants in parallel using a process pool
+    derive_optical_flow(participant_path, resume, flow_backend, flow_options,
+                        flow_format, flow_workers)
+        computes the optical flow .npy files of a participant from the face
+        .npy files of an earlier run, without decoding the video
+    derive_participants(participant_paths, workers, resume, flow_backend,
+                        flow_options, flow_format, flow_workers)
+        derives the optical flow of multiple participants in parallel using a
+        process pool
 """
 
 from .datahandler    import DataHandler
 from .experimentdata import ExperimentData
+from .faceboxes      import FaceBoxes
+from .framebuffer    import FrameBuffer
+from .frameindex     import FrameIndex
+from .landmarks      import FaceLandmarks
+from .manifest       import Manifest
+from .npywriter      import NpyWriter
 from .video          import VideoHandler
 
+from .facedetect  import DETECTORS
+from .opticalflow import FLOW_BACKENDS
+from .opticalflow import FLOW_FORMATS
+from .processing import METHODS
+from .regions    import REGIONS
+
+from .arguments   import add_flow_arguments
+from .arguments   import add_processing_arguments
+from .arguments   import flow_settings
+from .arguments   import handler_options
+from .arguments   import crop_sizes
+from .arguments   import frame_offsets
+from .opticalflow import decode_flow
+from .opticalflow import flow_image
+from .opticalflow import parallel_optical_flow
+from .processing import process_participant
+from .processing import process_participants
+from .processing import derive_optical_flow
+from .processing import derive_participants
+
 from .util import *
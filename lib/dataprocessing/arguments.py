@@ -0,0 +1,249 @@
+"""Command line arguments shared by the scripts that process the video data
+
+process_data_raw.py and process_data_batch.py process the video with the same
+options, and face_to_optical_flow.py computes the optical flow with the same
+options as they do. The arguments are defined and converted here once, such
+that the scripts can't drift apart.
+
+Functions:
+    add_flow_arguments(parser)
+        adds the arguments of the optical flow to a parser
+    add_processing_arguments(parser)
+        adds the arguments of the video processing, including the ones of the
+        optical flow, to a parser
+    flow_settings(arguments)
+        returns the flow_backend, flow_options and flow_format of the parsed
+        arguments
+    handler_options(arguments)
+        returns the keyword arguments for the VideoHandler of the parsed
+        arguments
+    crop_sizes(arguments)
+        returns the list of crop sizes of the parsed arguments
+    frame_offsets(arguments)
+        returns the list of frame offsets of the parsed arguments
+"""
+
+import argparse
+
+from .facedetect import DETECTORS
+from .opticalflow import FLOW_BACKENDS, FLOW_FORMATS
+
+
+def add_flow_arguments(parser: argparse.ArgumentParser):
+    """Adds the arguments of the optical flow to a parser
+
+    Parameters:
+        parser (argparse.ArgumentParser):
+            the parser of the script
+    """
+
+    parser.add_argument('--flow-backend', '-fb',
+                         default='farneback',
+                         choices=sorted(FLOW_BACKENDS),
+                         help='The optical flow backend')
+    parser.add_argument('--flow-levels',
+                         help='Number of pyramid levels of Farneback\'s algorithm')
+    parser.add_argument('--flow-winsize',
+                         help='Size of the averaging window of Farneback\'s\
+                               algorithm')
+    parser.add_argument('--flow-iterations',
+                         help='Number of iterations of Farneback\'s algorithm')
+    parser.add_argument('--flow-initial',
+                         default=False,
+                         action='store_true',
+                         help='If set the optical flow of the previous pair is\
+                               the initial guess for the next one')
+    parser.add_argument('--flow-format', '-ff',
+                         default='image',
+                         choices=sorted(FLOW_FORMATS),
+                         help='The format the optical flow is stored in')
+
+
+
+def add_processing_arguments(parser: argparse.ArgumentParser):
+    """Adds the arguments of the video processing to a parser
+
+    These are the crop sizes, the options of the VideoHandler, including the
+    ones of the optical flow, the frame offsets, --lecture-video and --force.
+    The methods, the output and the workers are up to the script
+
+    Parameters:
+        parser (argparse.ArgumentParser):
+            the parser of the script
+    """
+
+    parser.add_argument('--crop', '-c',
+                         default=64,
+                         help='The crop size for the frames, or a comma\
+                               separated list of crop sizes, e.g. 32,64')
+    parser.add_argument('--pipeline-threads', '-pt',
+                         default=0,
+                         help='Number of extraction threads running concurrently\
+                               to the decoding of the video')
+    parser.add_argument('--queue-size', '-qs',
+                         default=32,
+                         help='Maximum number of decoded frames waiting for the\
+                               extraction threads')
+    parser.add_argument('--batch-size', '-bs',
+                         default=1,
+                         help='Number of frames the face detection network is\
+                               run on in a single forward pass')
+    parser.add_argument('--detector', '-d',
+                         default='ssd',
+                         choices=sorted(DETECTORS),
+                         help='The face detection backend')
+    parser.add_argument('--detect-interval', '-di',
+                         default=1,
+                         help='Number of frames between two face detections,\
+                               the face is tracked in between')
+    parser.add_argument('--drift-threshold', '-dt',
+                         default=8.0,
+                         help='Grey value difference inside the face above which\
+                               a tracked face is detected again')
+    parser.add_argument('--cache-faces', '-cf',
+                         default=False,
+                         action='store_true',
+                         help='If set the face boxes are stored next to the video\
+                               and reused by later runs')
+    parser.add_argument('--eye-from-face', '-ef',
+                         default=False,
+                         action='store_true',
+                         help='If set the eye is searched in the box of the\
+                               face detector')
+    parser.add_argument('--cache-landmarks', '-cl',
+                         default=False,
+                         action='store_true',
+                         help='If set the facial landmarks are stored next to\
+                               the video and reused by later runs')
+    add_flow_arguments(parser)
+    parser.add_argument('--frame-step', '-fs',
+                         default=1,
+                         help='Only every n-th frame is extracted')
+    parser.add_argument('--target-fps',
+                         help='Number of frames per second that are extracted,\
+                               instead of the frame step')
+    parser.add_argument('--frame-offsets', '-fo',
+                         default='0',
+                         help='Comma separated offsets of the first extracted\
+                               frame of a trial, one file per offset')
+    parser.add_argument('--lecture-video', '-lv',
+                         default=False,
+                         action='store_true',
+                         help='If set the frames for the lecture video are\
+                               extracted as well, in the same pass as the trials')
+    parser.add_argument('--force',
+                         default=False,
+                         action='store_true',
+                         help='If set trials that are up to date are computed again')
+
+
+
+def flow_settings(arguments: argparse.Namespace):
+    """Returns the settings of the optical flow of the parsed arguments
+
+    Parameters:
+        arguments (argparse.Namespace):
+            the arguments parsed by a parser with add_flow_arguments
+
+    Returns:
+        dict: the flow_backend, the flow_options and the flow_format, as they
+            are passed to the VideoHandler
+    """
+
+    settings = {
+        'flow_backend': arguments.flow_backend,
+        # only the parameters of Farneback's algorithm that were given
+        'flow_options': {
+            key: int(getattr(arguments, 'flow_' + key))
+            for key in ['levels', 'winsize', 'iterations']
+            if getattr(arguments, 'flow_' + key) is not None
+        },
+        'flow_format': arguments.flow_format
+    }
+    # the previous flow as initial guess works with every backend
+    if arguments.flow_initial:
+        settings['flow_options']['initial_flow'] = True
+
+    assert all([settings['flow_options'].get(key, 1) > 0 for key in ['levels', 'winsize', 'iterations']])
+    assert settings['flow_backend'] == 'farneback' or not set(settings['flow_options']) - {'initial_flow'}
+
+    return settings
+
+
+
+def handler_options(arguments: argparse.Namespace):
+    """Returns the options of the VideoHandler of the parsed arguments
+
+    Parameters:
+        arguments (argparse.Namespace):
+            the arguments parsed by a parser with add_processing_arguments
+
+    Returns:
+        dict: keyword arguments for the VideoHandler
+    """
+
+    options = {
+        'pipeline_threads': int(arguments.pipeline_threads),
+        'queue_size': int(arguments.queue_size),
+        'batch_size': int(arguments.batch_size),
+        'detect_interval': int(arguments.detect_interval),
+        'drift_threshold': float(arguments.drift_threshold),
+        'cache_faces': arguments.cache_faces,
+        'detector': arguments.detector,
+        'eye_from_face': arguments.eye_from_face,
+        'cache_landmarks': arguments.cache_landmarks,
+        **flow_settings(arguments),
+        'frame_step': int(arguments.frame_step),
+        'target_fps': float(arguments.target_fps) if arguments.target_fps else None
+    }
+
+    assert options['pipeline_threads'] >= 0
+    assert options['queue_size'] > 0
+    assert options['batch_size'] > 0
+    assert options['detect_interval'] > 0
+    assert options['detect_interval'] == 1 or options['pipeline_threads'] <= 1
+    assert options['drift_threshold'] > 0
+    assert options['frame_step'] > 0
+    assert options['target_fps'] is None or options['target_fps'] > 0
+    assert options['frame_step'] == 1 or options['target_fps'] is None
+
+    return options
+
+
+
+def crop_sizes(arguments: argparse.Namespace):
+    """Returns the crop sizes of the parsed arguments
+
+    Parameters:
+        arguments (argparse.Namespace):
+            the arguments parsed by a parser with add_processing_arguments
+
+    Returns:
+        list: the crop sizes, see process_participant
+    """
+
+    sizes = [int(size) for size in str(arguments.crop).split(',')]
+
+    assert all([size > 0 for size in sizes]) and len(set(sizes)) == len(sizes)
+
+    return sizes
+
+
+
+def frame_offsets(arguments: argparse.Namespace):
+    """Returns the frame offsets of the parsed arguments
+
+    Parameters:
+        arguments (argparse.Namespace):
+            the arguments parsed by a parser with add_processing_arguments
+
+    Returns:
+        list: the offsets of the first extracted frame of a trial, see
+            process_participant
+    """
+
+    offsets = [int(offset) for offset in arguments.frame_offsets.split(',')]
+
+    assert all([offset >= 0 for offset in offsets]) and len(set(offsets)) == len(offsets)
+
+    return offsets
@@ -1,4 +1,3 @@
-import math
 import os
 
 import numpy as np
@@ -14,6 +13,9 @@ class DataHandler:
         add_frames(frames, label)
             adds frames to the data, it groups them into chunks of windowsize
             and adds a label for each chunk
+        add_phases(phases, label)
+            adds the phases of a time series that was subsampled already, e.g.
+            during the extraction, like the phases add_frames builds
         get_data()
             returns data and labels
         write(path, name)
@@ -22,26 +24,29 @@ class DataHandler:
     """
 
 
-    def __init__(self, shape: tuple, subsample: int = 1):
+    def __init__(self, shape: tuple, subsample: int = 1, dtype: type = np.uint8):
         """
         Parameters:
             shape (tuple): the shape of the data image data without the
                 the axis that corresponds to the amount of data
             subsample (int): how many frames to subsample the time series by
                 default: 1 (no subsampling at all)
+            dtype (type): data type of the frames, e.g. float16 for optical
+                flow fields
+                default: np.uint8
         """
         # subsample rate
         self.__subsample = subsample
 
         # the numpy array to store all the frames in
-        self.__data   = np.zeros([1, *shape], dtype=np.uint8)
+        self.__data   = np.zeros([1, *shape], dtype=dtype)
         # the numpy array to hold the labels
         self.__labels = np.zeros(1, dtype=np.uint8)
 
 
 
 
-    def add_frames(self, frames: np, ground_truth: int):
+    def add_frames(self, frames, ground_truth: int):
         """Adds frames in chunks of the windowsize to the data with the label
 
         The frames given are split into chunks of windowsize, with the last frames
@@ -49,39 +54,111 @@ class DataHandler:
 
         For each chunks one label is added to the label array of the class
 
+        The frames can be given as a single numpy array or as an iterable of
+        consecutive numpy arrays, such as the generator returned by
+        VideoHandler.iter_frames. The windows are added offset by offset, so
+        they are only added once all the chunks are read and the frames of the
+        windows are kept in memory until then. The chunks don't have to be
+        joined into one array beforehand though
+
+        Parameters:
+            frames (ndarray or iterable):
+                numpy array of frames or iterable of numpy arrays of frames
+            ground_truth (int):
+                ground truth value for the frames
+        """
+
+        # get the windowsize
+        windowsize = self.__data.shape[1]
+
+        # a single numpy array is one big chunk
+        chunks = [frames] if isinstance(frames, np.ndarray) else frames
+
+        # frames that don't fill a window yet, for each subsample offset
+        pending  = [None] * self.__subsample
+        # complete windows for each subsample offset
+        segments = [[] for _ in range(self.__subsample)]
+        # index of the first frame of the current chunk
+        offset   = 0
+
+        for chunk in chunks:
+            # the frames have the shape of a frame of the windows, grayscale
+            # frames may lack the channel axis of the windows
+            assert chunk.shape[1:] == self.__data.shape[2:] or (*chunk.shape[1:], 1) == self.__data.shape[2:]
+
+            for x in range(0, self.__subsample):
+                # subsample the frames using numpy magic, continuing where
+                # the last chunk stopped
+                subsampled_frames = chunk[(x - offset) % self.__subsample::self.__subsample]
+                if pending[x] is not None:
+                    subsampled_frames = np.concatenate((pending[x], subsampled_frames), axis=0)
+
+                # split off as many complete windows as possible
+                complete = (subsampled_frames.shape[0] // windowsize) * windowsize
+                if complete > 0:
+                    segments[x].append(subsampled_frames[:complete])
+                pending[x] = subsampled_frames[complete:]
+
+            offset += chunk.shape[0]
+
+        # the windows are added offset by offset
+        self.__add_windows([segment for offset_segments in segments for segment in offset_segments], ground_truth)
+
+
+
+    def add_phases(self, phases: list, ground_truth: int):
+        """Adds the phases of a subsampled time series in chunks of the windowsize
+
+        The phases are the frames add_frames builds with the subsampling of this
+        DataHandler, frames[x::subsample] for the offset x, but subsampled
+        already, e.g. by extracting only every n-th frame of the video. Every
+        phase is split into chunks of windowsize on its own, with the last
+        frames possibly omitted, and the windows are added phase by phase
+
         Parameters:
-            frames (ndarray):
-                numpy array of frames
+            phases (list):
+                numpy arrays of the frames of every phase, at most subsample of
+                them, in the order of their offsets
             ground_truth (int):
                 ground truth value for the frames
         """
 
+        assert len(phases) <= self.__subsample
+
         # get the windowsize
         windowsize = self.__data.shape[1]
 
-        for x in range(0, self.__subsample):
-            # subsample the frames using numpy magic
-            subsampled_frames = frames[x::self.__subsample]
-            # see how many frames we need to drop in the end to get chunks
-            # of the windowsize
-            diff = subsampled_frames.shape[0] % windowsize
-            # get the number of chunks
-            chunks = math.floor(subsampled_frames.shape[0] / windowsize)
-
-            # if chunk is 0 there aren't even enough frames to fill one window
-            if chunks > 0:
-                # split the frames into segments of windowsize
-                segments = np.split(subsampled_frames[:-diff,...], chunks, axis=0) \
-                    if diff > 0 \
-                    else np.split(subsampled_frames, chunks, axis=0)
-
-                # add the segments to the data
-                for segment in segments:
-                    # reshape to the right dimension if needed
-                    segment  = np.reshape(segment, self.__data.shape[1:])
-
-                    self.__data   = np.concatenate((self.__data, np.expand_dims(segment, axis=0)), axis=0)
-                    self.__labels = np.append(self.__labels, np.expand_dims(ground_truth, axis=0))
+        segments = []
+        for frames in phases:
+            assert frames.shape[1:] == self.__data.shape[2:] or (*frames.shape[1:], 1) == self.__data.shape[2:]
+
+            # as many complete windows as possible
+            complete = (frames.shape[0] // windowsize) * windowsize
+            if complete > 0:
+                segments.append(frames[:complete])
+
+        self.__add_windows(segments, ground_truth)
+
+
+
+    def __add_windows(self, segments: list, ground_truth: int):
+        """Adds segments of complete windows to the data with the label
+
+        Parameters:
+            segments (list):
+                numpy arrays of frames, whose length is a multiple of the
+                windowsize
+            ground_truth (int):
+                ground truth value for the windows
+        """
+
+        # if there are no segments there weren't even enough frames to fill one window
+        if segments:
+            # reshape to the right dimension
+            windows = np.reshape(np.concatenate(segments, axis=0), [-1, *self.__data.shape[1:]])
+
+            self.__data   = np.concatenate((self.__data, windows.astype(self.__data.dtype)), axis=0)
+            self.__labels = np.append(self.__labels, np.full(windows.shape[0], ground_truth))
 
         assert self.__data.shape[0] == self.__labels.shape[0]
 
@@ -2,31 +2,61 @@ import os
 
 import cv2
 import numpy as np
-import openface
+
+from .regions import crop_region
 
 
 class EyeExtractor:
     """Class representing a module to extract the right eye from images
 
     This classes uses OpenFace to find facial landmarks and then extracts the
-    right eye from the image
+    right eye from the image. Other regions of the face, like the left eye or
+    the mouth, can be cropped from the same landmarks, see regions.REGIONS
+
+    The face the landmarks are searched in is either found by dlib's HOG face
+    detector, which runs on the whole frame, or given as the box of a face that
+    was already found, e.g. by the FaceExtractor. In the latter case the
+    landmarks are searched in a region around the face that is downscaled such
+    that the face is about LANDMARK_SIZE pixels wide, which is a lot faster.
+    The eye is always cropped from the frame in its full resolution.
 
     It requires the 'shape_predictor_68_face_landmarks.dat' file from dlib
 
     Methods:
-        extractEye(frame, size)
+        extractEye(frame, size, face)
             extracts the face from a frame resize to (size, size, 3)
+        extract_regions(frame, regions, size, face)
+            extracts multiple regions of the face from a frame, each resized
+            to (size, size, 3)
+        find_landmarks(frame, face)
+            returns the 68 facial landmarks of the face in a frame
     """
 
+    # width in pixels the face is scaled down to for the landmark detection
+    LANDMARK_SIZE = 160
+    # margin around the face box that is part of the region the landmarks are
+    # searched in, relative to the width of the face
+    MARGIN = 0.25
+
+
+
     def __init__(self):
 
+        # OpenFace is only imported once an EyeExtractor is needed, such that
+        # the other methods can be used without it
+        import dlib
+        import openface
+
+        self.__rectangle = dlib.rectangle
+
         # path of this file
         file_path  = os.path.dirname(os.path.realpath(__file__))
         # load the dlib model for facial landmarks
         self.__align = openface.AlignDlib(os.path.join(file_path, '..', '..', 'resources', 'shape_predictor_68_face_landmarks.dat'))
 
 
-    def extractEye(self, frame: np.ndarray, crop: int):
+
+    def extractEye(self, frame: np.ndarray, crop: int, face: np.ndarray = None):
         """Extracts the right eye from an image
 
         Using OpenFace this method finds facial landmarks and extracts the right
@@ -37,6 +67,9 @@ class EyeExtractor:
                 the video frame that should be processed
             crop (int):
                 final crop size for the eye image
+            face (np.ndarray, optional):
+                the (x1, y1, x2, y2) box of the face in pixels. If given, the
+                face isn't searched with dlib's face detector
 
         Returns:
             bool, np.ndarray: the bool indicates wether the eye was found and if
@@ -44,30 +77,115 @@ class EyeExtractor:
                 eye image and is None otherwise
         """
 
-        # find the face and then get the landmarks
-        bb = self.__align.getLargestFaceBoundingBox(frame)
+        landmarks = self.find_landmarks(frame, face)
 
-        # if a face bounding box was found extract the eye
-        if(bb):
-            # get the facial landmarks
-            landmarks = self.__align.findLandmarks(frame,bb)
+        # if a face was found extract the eye
+        if landmarks is not None:
+            return True, crop_eye(frame, landmarks, crop)
 
-            # relevant landmarks for the right eye
-            right_eye_outer = landmarks[36]
-            right_eye_inner = landmarks[39]
+        # return None if no face was found in the frame
+        else:
+            return False, None
 
-            # compute the x center of the eye
-            middle_x = int(np.abs(right_eye_inner[0]-right_eye_outer[0])/2)
-            center_x = int(right_eye_outer[0]+ middle_x)
-            # compute the y center of the eye
-            middle_y = int(np.abs(right_eye_inner[1]-right_eye_outer[1])/2)
-            center_y = int(right_eye_inner[1]+middle_y) if right_eye_inner[1] < right_eye_outer[1] else int(right_eye_outer[1]+middle_y)
 
-            # extract the eye from the frame
-            eye_img = frame[int(center_y-middle_x*1.5):int(center_y+middle_x*1.5),int(center_x-middle_x*1.5):int(center_x+middle_x*1.5),...]
-            
-            return True, cv2.resize(eye_img, (crop, crop))
 
-        # return None if no face was found in the frame
-        else:
+    def extract_regions(self, frame: np.ndarray, regions: list, crop: int, face: np.ndarray = None):
+        """Extracts multiple regions of the face from an image
+
+        The landmarks are searched once and all the regions are cropped from
+        them
+
+        Parameters:
+            frame (np.ndarray):
+                the video frame that should be processed
+            regions (list):
+                names of the regions, keys of regions.REGIONS
+            crop (int):
+                final crop size for the region images
+            face (np.ndarray, optional):
+                the (x1, y1, x2, y2) box of the face in pixels, see extractEye
+
+        Returns:
+            bool, dict: the bool indicates wether the face was found and if so
+                the dictionary maps every region to its image of size
+                (crop, crop, 3) and is None otherwise
+        """
+
+        landmarks = self.find_landmarks(frame, face)
+
+        if landmarks is None:
             return False, None
+
+        return True, {region: crop_region(frame, landmarks, region, crop) for region in regions}
+
+
+
+    def find_landmarks(self, frame: np.ndarray, face: np.ndarray = None):
+        """Finds the 68 facial landmarks of the largest face in a frame
+
+        Parameters:
+            frame (np.ndarray):
+                the video frame that should be processed
+            face (np.ndarray, optional):
+                the (x1, y1, x2, y2) box of the face in pixels, see extractEye
+
+        Returns:
+            np.ndarray: (68, 2) int array with the x and y coordinates of the
+                landmarks in the frame, or None if no face was found
+        """
+
+        if face is None:
+            # find the face and then get the landmarks
+            bb = self.__align.getLargestFaceBoundingBox(frame)
+
+            # no face bounding box was found
+            if not bb:
+                return None
+
+            return np.array(self.__align.findLandmarks(frame, bb), dtype=np.int64)
+
+        # region around the face, within the frame
+        h, w  = frame.shape[:2]
+        x1, y1, x2, y2 = [float(v) for v in face[:4]]
+        margin = self.MARGIN * (x2 - x1)
+        left   = int(max(x1 - margin, 0))
+        top    = int(max(y1 - margin, 0))
+        right  = int(min(x2 + margin, w))
+        bottom = int(min(y2 + margin, h))
+
+        if right - left < 2 or bottom - top < 2:
+            return None
+
+        # scale the region down such that the face is LANDMARK_SIZE pixels wide
+        scale  = min(1.0, self.LANDMARK_SIZE / max(x2 - x1, 1.0))
+        region = frame[top:bottom, left:right]
+        if scale < 1.0:
+            region = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        bb = self.__rectangle(
+            int(round((x1 - left) * scale)), int(round((y1 - top) * scale)),
+            int(round((x2 - left) * scale)), int(round((y2 - top) * scale))
+        )
+        landmarks = np.array(self.__align.findLandmarks(region, bb), dtype=np.float64)
+
+        # back to the coordinates of the frame
+        return np.round(landmarks / scale + [left, top]).astype(np.int64)
+
+
+
+def crop_eye(frame: np.ndarray, landmarks: np.ndarray, crop: int):
+    """Crops a squared image around the right eye
+
+    Parameters:
+        frame (np.ndarray):
+            the video frame
+        landmarks (np.ndarray):
+            the 68 facial landmarks of the face in the frame
+        crop (int):
+            final crop size for the eye image
+
+    Returns:
+        np.ndarray: the eye image of size (crop, crop, 3)
+    """
+
+    return crop_region(frame, landmarks, 'eye', crop)
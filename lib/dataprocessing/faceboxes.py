@@ -0,0 +1,155 @@
+import os
+import threading
+import zipfile
+
+import numpy as np
+
+
+class FaceBoxes:
+    """Class representing the bounding boxes of the face in the frames of a video
+
+    The face detection is the most expensive part of processing a video, but
+    the boxes don't depend on the crop size or on the processing method. So the
+    box of every frame that was processed once is stored next to the video in
+    the file '<video>.faceboxes.npz', and later runs only decode the frames and
+    crop them again.
+
+    The file holds an (N, 6) float32 array with one row (frame number, x1, y1,
+    x2, y2, confidence) per frame that was searched for a face, with the corners
+    in pixels. Frames without a face have a confidence of 0. Together with the
+    boxes, the size and modification time of the video and a description of the
+    detector are stored. If either of them changes, the boxes are discarded.
+
+    Boxes can be added from multiple threads. When saving, the boxes are merged
+    with the ones stored in the meantime by other processes.
+
+    Methods:
+        lookup(positions)
+            returns the boxes of frames if they are known
+        add(positions, boxes)
+            adds the boxes of frames
+        save()
+            stores the boxes next to the video
+    """
+
+
+
+    def __init__(self, video_path: str, detector: str):
+        """
+        Parameters:
+            video_path (str):
+                path to the video file
+            detector (str):
+                description of the detector and its settings, boxes of other
+                detectors are not used
+        """
+
+        self.__path     = '{}.faceboxes.npz'.format(video_path)
+        self.__detector = detector
+
+        # size and modification time identify the version of the video
+        stat = os.stat(video_path)
+        self.__key = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+        # box of every known frame and whether there are unsaved ones
+        self.__boxes    = self.__load()
+        self.__modified = False
+        self.__lock     = threading.Lock()
+
+
+
+    def __len__(self):
+        return len(self.__boxes)
+
+
+
+    def lookup(self, positions: list):
+        """Returns the boxes of frames if they are known
+
+        Parameters:
+            positions (list):
+                the frame numbers
+
+        Returns:
+            ndarray, ndarray: whether the box of every frame is known and the
+                (x1, y1, x2, y2, confidence) boxes, zero for unknown frames
+        """
+
+        known = np.array([position in self.__boxes for position in positions], dtype=bool)
+        boxes = np.zeros((len(positions), 5), dtype=np.float32)
+
+        for i, position in enumerate(positions):
+            if known[i]:
+                boxes[i] = self.__boxes[position]
+
+        return known, boxes
+
+
+
+    def add(self, positions: list, boxes: np.ndarray):
+        """Adds the boxes of frames
+
+        Parameters:
+            positions (list):
+                the frame numbers
+            boxes (np.ndarray):
+                one (x1, y1, x2, y2, confidence) row per frame
+        """
+
+        with self.__lock:
+            for position, box in zip(positions, boxes):
+                self.__boxes[int(position)] = np.asarray(box[:5], dtype=np.float32)
+            self.__modified = self.__modified or len(positions) > 0
+
+
+
+    def save(self):
+        """Stores the boxes next to the video, if new boxes were added"""
+
+        with self.__lock:
+            if not self.__modified:
+                return
+
+            # keep the boxes other processes stored in the meantime
+            boxes = self.__load()
+            boxes.update(self.__boxes)
+            self.__boxes = boxes
+
+            positions = sorted(boxes)
+            track = np.zeros((len(positions), 6), dtype=np.float32)
+            track[:, 0]  = positions
+            track[:, 1:] = [boxes[position] for position in positions]
+
+            # the boxes are only a cache, so it is fine if they can't be stored
+            temp_path = '{}.{}.tmp'.format(self.__path, os.getpid())
+            try:
+                with open(temp_path, 'wb') as boxes_file:
+                    np.savez(boxes_file, key=self.__key, detector=np.array(self.__detector), boxes=track)
+                os.replace(temp_path, self.__path)
+            except OSError:
+                pass
+
+            self.__modified = False
+
+
+
+    def __load(self):
+        """Loads the stored boxes, if they belong to the video and the detector
+
+        Returns:
+            dict: the (x1, y1, x2, y2, confidence) box of every frame number
+        """
+
+        if not os.path.isfile(self.__path):
+            return {}
+
+        try:
+            with np.load(self.__path) as stored:
+                if not np.array_equal(stored['key'], self.__key) or str(stored['detector']) != self.__detector:
+                    return {}
+                track = stored['boxes']
+        # a file that can't be read is rebuilt
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return {}
+
+        return {int(row[0]): row[1:] for row in track}
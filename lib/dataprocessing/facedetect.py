@@ -0,0 +1,247 @@
+import os
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+
+# directory with the model files
+RESOURCES = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'resources')
+
+
+
+class FaceDetector(ABC):
+    """Class representing the interface of a face detection backend
+
+    A backend finds the face in video frames and returns its bounding box.
+    The FaceExtractor uses one of the backends in DETECTORS.
+
+    Methods:
+        detect_faces(frames)
+            returns the bounding box of the face in multiple frames
+    """
+
+
+
+    @abstractmethod
+    def detect_faces(self, frames: list):
+        """Detects the face in multiple frames
+
+        Parameters:
+            frames (list): the frames, all of the same shape
+
+        Returns:
+            ndarray: one row (x1, y1, x2, y2, confidence) per frame with the
+                corners of the face in pixels. The confidence is 0 for frames
+                without a face
+        """
+
+
+
+class SSDDetector(FaceDetector):
+    """Class representing the res10 SSD face detection network of OpenCV
+
+    The frames are resized to a square input of input_size pixels before they
+    are fed to the network. The network was trained on 300x300 images, smaller
+    inputs are faster but miss smaller faces. Multiple frames are fed to the
+    network in a single forward pass.
+
+    It requires the model and config file for the caffe model
+    """
+
+
+
+    def __init__(self, input_size: int = 300, confidence_threshold: float = 0.4):
+        """
+        Parameters:
+            input_size (int): width and height of the network input
+                default: 300
+            confidence_threshold (float): minimum confidence of a detection
+                default: 0.4
+        """
+
+        assert input_size > 0
+
+        # Caffe moodel files
+        modelFile  = os.path.join(RESOURCES, 'res10_300x300_ssd_iter_140000_fp16.caffemodel')
+        configFile = os.path.join(RESOURCES, 'deploy.prototxt')
+
+        # load the deep neural network pretrained for face detection
+        self.__cnn = cv2.dnn.readNetFromCaffe(configFile, modelFile)
+
+        self.__input_size           = input_size
+        self.__confidence_threshold = confidence_threshold
+
+
+
+    def detect_faces(self, frames: list):
+        """Detects the face in multiple frames in a single forward pass
+
+        If a frame holds more than one face, the first one the network returns
+        is used
+
+        Parameters:
+            frames (list): the frames, all of the same shape
+
+        Returns:
+            ndarray: see FaceDetector.detect_faces
+        """
+
+        boxes = np.zeros((len(frames), 5), dtype=np.float32)
+
+        if len(frames) == 0:
+            return boxes
+
+        size = (self.__input_size, self.__input_size)
+        # transform them to a batch of blobs
+        blob = cv2.dnn.blobFromImages([cv2.resize(frame, size) for frame in frames], 1.0, size, (104.0, 117.0, 123.0))
+        # feed it to the network
+        self.__cnn.setInput(blob)
+        # one row per detection: image id, label, confidence, x1, y1, x2, y2
+        detections = self.__cnn.forward()[0, 0]
+
+        # face detections with a high enough confidence
+        detections = detections[detections[:, 2] > self.__confidence_threshold]
+        # the first face detected in every frame, the detections are grouped
+        # by frame
+        ids, first = np.unique(detections[:, 0].astype(np.int64), return_index=True)
+
+        # height and width of the frames
+        h,w = frames[0].shape[:2]
+
+        boxes[ids, :4] = detections[first, 3:7] * np.array([w, h, w, h], dtype=np.float32)
+        boxes[ids, 4]  = detections[first, 2]
+
+        return boxes
+
+
+
+class HaarDetector(FaceDetector):
+    """Class representing OpenCV's Haar cascade for frontal faces
+
+    The frames are downscaled before the detection, the participants sit close
+    to the webcam, so their faces are large. The cascade doesn't rate its
+    detections, so every face has a confidence of 1.
+
+    It uses the cascade that ships with opencv-python, or the file
+    'haarcascade_frontalface_default.xml' in the resources directory
+    """
+
+
+
+    def __init__(self, scale: float = 0.5):
+        """
+        Parameters:
+            scale (float): factor the frames are resized by before the detection
+                default: 0.5
+        """
+
+        assert scale > 0
+
+        cascade_file = 'haarcascade_frontalface_default.xml'
+        cascade_path = os.path.join(RESOURCES, cascade_file)
+        # opencv-python ships the cascades
+        if hasattr(cv2, 'data') and os.path.isfile(os.path.join(cv2.data.haarcascades, cascade_file)):
+            cascade_path = os.path.join(cv2.data.haarcascades, cascade_file)
+
+        self.__cascade = cv2.CascadeClassifier(cascade_path)
+        assert not self.__cascade.empty(), 'could not load {}'.format(cascade_path)
+
+        self.__scale = scale
+
+
+
+    def detect_faces(self, frames: list):
+        """Detects the largest face in every frame
+
+        Parameters:
+            frames (list): the frames, all of the same shape
+
+        Returns:
+            ndarray: see FaceDetector.detect_faces
+        """
+
+        boxes = np.zeros((len(frames), 5), dtype=np.float32)
+
+        for i, frame in enumerate(frames):
+            grey  = cv2.cvtColor(cv2.resize(frame, None, fx=self.__scale, fy=self.__scale), cv2.COLOR_BGR2GRAY)
+            faces = self.__cascade.detectMultiScale(grey, scaleFactor=1.1, minNeighbors=5, minSize=(grey.shape[0] // 8, grey.shape[0] // 8))
+
+            if len(faces) > 0:
+                x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+                boxes[i] = [x / self.__scale, y / self.__scale, (x + w) / self.__scale, (y + h) / self.__scale, 1.0]
+
+        return boxes
+
+
+
+class HOGDetector(FaceDetector):
+    """Class representing dlib's HOG face detector
+
+    It is the detector OpenFace uses in AlignDlib.getLargestFaceBoundingBox,
+    which the EyeExtractor runs. The frames can be downscaled before the
+    detection, and upsampled by dlib to find smaller faces.
+
+    It requires dlib
+    """
+
+
+
+    def __init__(self, scale: float = 1.0, upsample: int = 1):
+        """
+        Parameters:
+            scale (float): factor the frames are resized by before the detection
+                default: 1.0
+            upsample (int): number of times dlib upsamples the frames
+                default: 1 (as in OpenFace)
+        """
+
+        assert scale > 0
+        assert upsample >= 0
+
+        # dlib is only needed for this backend
+        import dlib
+
+        self.__detector = dlib.get_frontal_face_detector()
+        self.__scale    = scale
+        self.__upsample = upsample
+
+
+
+    def detect_faces(self, frames: list):
+        """Detects the largest face in every frame
+
+        Parameters:
+            frames (list): the frames, all of the same shape
+
+        Returns:
+            ndarray: see FaceDetector.detect_faces, the confidence is the score
+                of dlib's detector
+        """
+
+        boxes = np.zeros((len(frames), 5), dtype=np.float32)
+
+        for i, frame in enumerate(frames):
+            rgb = cv2.cvtColor(cv2.resize(frame, None, fx=self.__scale, fy=self.__scale), cv2.COLOR_BGR2RGB)
+            rects, scores, _ = self.__detector.run(rgb, self.__upsample, 0)
+
+            if len(rects) > 0:
+                rect, score = max(zip(rects, scores), key=lambda face: face[0].area())
+                boxes[i] = [
+                    rect.left() / self.__scale, rect.top() / self.__scale,
+                    rect.right() / self.__scale, rect.bottom() / self.__scale,
+                    # a score of 0 is still a face
+                    max(score, 1e-3)
+                ]
+
+        return boxes
+
+
+
+# the available backends by name, 'ssd' is the detector used so far
+DETECTORS = {
+    'ssd': lambda: SSDDetector(300),
+    'ssd-small': lambda: SSDDetector(150),
+    'haar': lambda: HaarDetector(0.5),
+    'hog': lambda: HOGDetector(1.0, 1)
+}
@@ -1,43 +1,47 @@
-import os
-
 import cv2
 import numpy as np
 
+from .facedetect import DETECTORS
+
 
 class FaceExtractor:
     """Class representing a module to extract faces from images
 
-    This class uses opencv's dnn module with a pretrained caffe model to find
-    faces in the frames from the videos recorded in the experiment.
+    This class uses one of the face detection backends in DETECTORS to find
+    faces in the frames from the videos recorded in the experiment. By default
+    it uses opencv's dnn module with a pretrained caffe model.
 
-    It requires the model and config file for the caffe model
+    It requires the model files of the backend
 
     Methods:
         extractFace(frame, size)
             extracts the face from a frame resize to (size, size, 3)
+        extract_faces(frames, size)
+            extracts the faces from multiple frames at once
+        detect_faces(frames)
+            returns the bounding box of the face in multiple frames
     """
 
 
-    def __init__(self):
-        # path of this file
-        file_path  = os.path.dirname(os.path.realpath(__file__))
-        # Caffe moodel files
-        modelFile  = os.path.join(file_path, '..', '..', 'resources', 'res10_300x300_ssd_iter_140000_fp16.caffemodel')
-        configFile = os.path.join(file_path, '..', '..', 'resources', 'deploy.prototxt')
+    def __init__(self, detector: str = 'ssd'):
+        """
+        Parameters:
+            detector (str): name of the face detection backend, one of the keys
+                of DETECTORS
+                default: 'ssd' (the res10 SSD network at 300x300)
+        """
 
-        # load the deep neural network pretrained for face detection
-        self.__cnn = cv2.dnn.readNetFromCaffe(configFile, modelFile)
+        assert detector in DETECTORS
 
-        # confidence threshold for the face detection
-        self.__confidence_threshold = 0.4
+        self.__detector = DETECTORS[detector]()
 
 
 
     def extractFace(self, frame: np, size: int):
         """Extracts the face in a frame
 
-        Given a numpy array of a frame, it will use opencv's dnn module to extract
-        the face from the image and resize it to a squared image of dimension
+        Given a numpy array of a frame, it will use the face detection backend to
+        extract the face from the image and resize it to a squared image of dimension
         (size, size, 3), if a face was found
 
         Parameters:
@@ -51,50 +55,97 @@ class FaceExtractor:
                 if found or will be None otherwise
         """
 
-        # transform it to a 300x300 blob
-        blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0, (300, 300), (104.0, 117.0, 123.0))
-        # feed it to the network
-        self.__cnn.setInput(blob)
-        detections = self.__cnn.forward()
-
-         # list with face detections with a high enough confidence
-        detections = [detections[0, 0, i] for i in range(detections.shape[2]) if detections[0, 0, i, 2] > self.__confidence_threshold]
-        # only extract a face if there was any face found
-        if(len(detections) > 0):
-            # height and width of the frame
-            h,w = frame.shape[:2]
-
-            detect = detections[0]
-             # get the corner coordinates for the rectangle
-            x1 = int(detect[3] * w)
-            y1 = int(detect[4] * h)
-            x2 = int(detect[5] * w)
-            y2 = int(detect[6] * h)
-
-            # compute width and height of the face frame
-            width  = np.abs(x2-x1)
-            height = np.abs(y2-y1)
-
-            # make the image squared
-            diff = np.abs(height-width)
-            if height > width:
-                x1 -= int(np.floor(diff/2.0))
-                x2 += int(np.ceil(diff/2.0))
-            else:
-                y1 -= int(np.floor(diff/2.0))
-                y2 += int(np.ceil(diff/2.0))
-
-            # crop the image
-            cropped_image = frame[y1:y2, x1:x2]
-            c_h, c_w = cropped_image.shape[:2]
-
-            assert c_h == c_w
-
-            # resize the image to 128 pixels
-            cropped_image = cv2.resize(cropped_image, (size, size))
-
-            return (True, cropped_image)
-
-        # no face was found
-        else:
-            return (False, None)
+        return self.extract_faces([frame], size)[0]
+
+
+
+    def extract_faces(self, frames: list, size: int, positions: list = None):
+        """Extracts the faces in multiple frames at once
+
+        Works like extractFace, but all the frames are handed to the detection
+        backend at once. The SSD backend feeds them to the network in a single
+        forward pass, which saves the overhead of running the network for every
+        frame on its own
+
+        Parameters:
+            frames (list): the frames from the videos recorded in the
+                experiments, all of the same shape
+            size (int): size (width & height) the face images should be cropped
+                to
+            positions (list, optional): the frame numbers of the frames, see
+                detect_faces
+
+        Returns:
+            list: one (bool, ndarray) tuple per frame, as returned by extractFace
+        """
+
+        return [
+            (True, crop_face(frame, box, size)) if box[4] > 0 else (False, None)
+            for frame, box in zip(frames, self.detect_faces(frames))
+        ]
+
+
+
+    def detect_faces(self, frames: list, positions: list = None):
+        """Detects the faces in multiple frames
+
+        Parameters:
+            frames (list): the frames from the videos recorded in the
+                experiments, all of the same shape
+            positions (list, optional): the frame numbers of the frames. They
+                are not needed for the detection, but allow the detector to be
+                used in place of a FaceTracker
+
+        Returns:
+            ndarray: one row (x1, y1, x2, y2, confidence) per frame with the
+                corners of the first face found in pixels. The confidence is 0
+                for frames without a face
+        """
+
+        return self.__detector.detect_faces(frames)
+
+
+
+def crop_face(frame: np.ndarray, box: np.ndarray, size: int):
+    """Crops a squared image around a face
+
+    The box is made squared by growing its shorter side around its center
+
+    Parameters:
+        frame (np.ndarray): the frame the face was found in
+        box (np.ndarray): the corners (x1, y1, x2, y2) of the face in pixels,
+            further values are ignored
+        size (int): size (width & height) the face image should be resized
+            to
+
+    Returns:
+        ndarray: the face in dimension (size, size, 3)
+    """
+
+    # get the corner coordinates for the rectangle
+    x1 = int(box[0])
+    y1 = int(box[1])
+    x2 = int(box[2])
+    y2 = int(box[3])
+
+    # compute width and height of the face frame
+    width  = np.abs(x2-x1)
+    height = np.abs(y2-y1)
+
+    # make the image squared
+    diff = np.abs(height-width)
+    if height > width:
+        x1 -= int(np.floor(diff/2.0))
+        x2 += int(np.ceil(diff/2.0))
+    else:
+        y1 -= int(np.floor(diff/2.0))
+        y2 += int(np.ceil(diff/2.0))
+
+    # crop the image
+    cropped_image = frame[y1:y2, x1:x2]
+    c_h, c_w = cropped_image.shape[:2]
+
+    assert c_h == c_w
+
+    # resize the image to 128 pixels
+    return cv2.resize(cropped_image, (size, size))
@@ -0,0 +1,221 @@
+import cv2
+import numpy as np
+
+from .faceextract import FaceExtractor, crop_face
+
+
+class FaceTracker:
+    """Class representing a face tracker, that runs the face detection only now
+    and then
+
+    The participants sit in front of a fixed webcam, so the face barely moves
+    from one frame to the next. Instead of detecting the face in every frame,
+    the face is detected only in every detect_interval-th frame and followed
+    with sparse optical flow in between. The bounding box is moved by the
+    median motion of a few corner points inside of it.
+
+    The face is detected again before the interval is over if
+        - the mean difference of the grey values inside the face box between
+          two consecutive frames exceeds the drift threshold, i.e. the face
+          moved noticeably
+        - too few points could be followed into the current frame
+        - the frame is more than frame_step frames after the previous one, or
+          not after it at all
+        - there was no face in the previous frame
+
+    The frames have to be handed to the tracker in the order of the video, so
+    a tracker can't be shared between threads. If only every frame_step-th
+    frame is extracted, the face is tracked from one extracted frame to the
+    next, and detect_interval counts the extracted frames.
+
+    Methods:
+        extract_faces(frames, size, positions)
+            extracts the faces from consecutive frames
+        detect_faces(frames, positions)
+            returns the bounding box of the face in consecutive frames
+        reset()
+            forgets the face, the next frame is detected
+        stats()
+            returns the number of frames and detections since the last reset
+    """
+
+    # minimum number of points that have to be followed to trust the motion
+    MIN_POINTS = 5
+    # maximum number of points followed inside the face box
+    MAX_POINTS = 40
+
+
+
+    def __init__(self, extractor: FaceExtractor, detect_interval: int = 10, drift_threshold: float = 8.0, frame_step: int = 1):
+        """
+        Parameters:
+            extractor (FaceExtractor):
+                the face extractor used for the detections
+            detect_interval (int):
+                maximum number of frames between two detections
+                default: 10
+            drift_threshold (float):
+                mean absolute grey value difference inside the face box between
+                two consecutive frames, above which the face is detected again
+                default: 8.0
+            frame_step (int):
+                largest difference of the positions of two consecutive frames
+                the face is tracked across
+                default: 1
+        """
+
+        assert detect_interval > 0
+        assert drift_threshold > 0
+        assert frame_step > 0
+
+        self.__extractor       = extractor
+        self.__detect_interval = detect_interval
+        self.__drift_threshold = drift_threshold
+        self.__frame_step      = frame_step
+
+        self.reset()
+
+
+
+    def reset(self):
+        """Forgets the tracked face, such that the next frame is detected"""
+
+        # box of the last frame, its grey image and its position
+        self.__box      = None
+        self.__previous = None
+        self.__position = None
+        # frames since the last detection
+        self.__age      = 0
+
+        self.__frames     = 0
+        self.__detections = 0
+
+
+
+    def stats(self):
+        """Returns statistics about the frames tracked since the last reset
+
+        Returns:
+            dict: the number of frames and the number of detections
+        """
+
+        return {
+            'frames': self.__frames,
+            'detections': self.__detections
+        }
+
+
+
+    def extract_faces(self, frames: list, size: int, positions: list = None):
+        """Extracts the faces from consecutive frames
+
+        Parameters:
+            frames (list):
+                the frames in the order of the video
+            size (int):
+                size (width & height) the face images should be cropped to
+            positions (list, optional):
+                the frame numbers of the frames, the face is detected in frames
+                that don't follow their predecessor. If not given, the frames
+                are treated as consecutive
+
+        Returns:
+            list: one (bool, ndarray) tuple per frame, as returned by
+                FaceExtractor.extractFace
+        """
+
+        return [
+            (True, crop_face(frame, box, size)) if box[4] > 0 else (False, None)
+            for frame, box in zip(frames, self.detect_faces(frames, positions))
+        ]
+
+
+
+    def detect_faces(self, frames: list, positions: list = None):
+        """Finds the faces in consecutive frames, tracking them where possible
+
+        Parameters:
+            frames (list):
+                the frames in the order of the video
+            positions (list, optional):
+                the frame numbers of the frames, see extract_faces
+
+        Returns:
+            ndarray: one row (x1, y1, x2, y2, confidence) per frame as returned
+                by FaceExtractor.detect_faces. Tracked boxes have the confidence
+                of the detection they were tracked from
+        """
+
+        if positions is None:
+            positions = [None] * len(frames)
+
+        boxes = np.zeros((len(frames), 5), dtype=np.float32)
+
+        for i, (frame, position) in enumerate(zip(frames, positions)):
+            grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+            box = None
+            if self.__box is not None and self.__age < self.__detect_interval \
+                and (position is None or self.__position is None or 0 < position - self.__position <= self.__frame_step):
+                box = self.__track(grey)
+
+            if box is None:
+                box = self.__extractor.detect_faces([frame])[0]
+                self.__detections += 1
+                self.__age = 0
+
+            self.__frames  += 1
+            self.__age     += 1
+            self.__box      = box if box[4] > 0 else None
+            self.__previous = grey
+            self.__position = position
+
+            boxes[i] = box
+
+        return boxes
+
+
+
+    def __track(self, grey: np.ndarray):
+        """Follows the face box of the previous frame into the current frame
+
+        Parameters:
+            grey (np.ndarray):
+                the current frame as grayscale image
+
+        Returns:
+            ndarray: the moved box (x1, y1, x2, y2, confidence) or None if the
+                face has to be detected again
+        """
+
+        h, w = grey.shape
+        x1, y1, x2, y2 = [int(v) for v in np.clip(self.__box[:4], 0, [w, h, w, h])]
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return None
+
+        # the face moved too much since the last frame
+        difference = cv2.absdiff(self.__previous[y1:y2, x1:x2], grey[y1:y2, x1:x2])
+        if difference.mean() > self.__drift_threshold:
+            return None
+
+        # corner points inside the face box of the previous frame
+        points = cv2.goodFeaturesToTrack(self.__previous[y1:y2, x1:x2], self.MAX_POINTS, 0.01, 3)
+        if points is None or len(points) < self.MIN_POINTS:
+            return None
+        points = points + np.array([x1, y1], dtype=np.float32)
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self.__previous, grey, points, None, winSize=(15, 15), maxLevel=2)
+        found = status.ravel() == 1
+        if found.sum() < self.MIN_POINTS:
+            return None
+
+        # move the box by the median motion of the points
+        dx, dy = np.median((moved - points)[found].reshape(-1, 2), axis=0)
+        box = self.__box.copy()
+        box[:4] += np.array([dx, dy, dx, dy], dtype=np.float32)
+
+        # the face left the frame
+        if box[0] < 0 or box[1] < 0 or box[2] > w or box[3] > h:
+            return None
+
+        return box
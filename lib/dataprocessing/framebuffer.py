@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class FrameBuffer:
+    """Class representing a preallocated buffer to collect frames in
+
+    The buffer is allocated once for the number of frames that is expected and
+    the frames are written into it in place. The unused part at the end is
+    trimmed once when the data is retrieved. If more frames than expected are
+    added, the buffer doubles its size.
+
+    Methods:
+        append(frame)
+            adds a single frame to the buffer
+        data()
+            returns the frames added so far, trimmed to their actual number
+    """
+
+
+
+    def __init__(self, capacity: int, shape: tuple, dtype: type = np.uint8):
+        """
+        Parameters:
+            capacity (int):
+                the number of frames expected, usually the length of the frame
+                range that is processed
+            shape (tuple):
+                the shape of a single frame
+            dtype (type):
+                the data type of the frames
+                default: np.uint8
+        """
+
+        # the preallocated frames
+        self.__frames = np.empty([max(int(capacity), 1), *shape], dtype=dtype)
+        # number of frames added so far
+        self.__length = 0
+
+
+
+    def __len__(self):
+        return self.__length
+
+
+
+    def append(self, frame: np.ndarray):
+        """Adds a single frame to the buffer
+
+        Parameters:
+            frame (np.ndarray):
+                the frame to add, must be of the shape given to the buffer
+        """
+
+        # grow the buffer if the capacity was too small
+        if self.__length == self.__frames.shape[0]:
+            self.__frames = np.concatenate((self.__frames, np.empty_like(self.__frames)), axis=0)
+
+        self.__frames[self.__length] = frame
+        self.__length += 1
+
+
+
+    def data(self):
+        """Returns the frames added to the buffer
+
+        Returns:
+            ndarray: numpy array of the shape (frames, *shape)
+        """
+
+        # no need to copy if the buffer was filled completely
+        if self.__length == self.__frames.shape[0]:
+            return self.__frames
+
+        return self.__frames[:self.__length].copy()
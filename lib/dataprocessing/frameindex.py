@@ -0,0 +1,122 @@
+import os
+
+import cv2
+import numpy as np
+
+
+class FrameIndex:
+    """Class representing an index of the presentation timestamps of a video
+
+    The timestamp of every frame is read once by grabbing the whole video
+    without decoding the images. The index is stored next to the video as a
+    numpy int64 array in the file '<video>.frameindex.npy'. The first two
+    entries hold the size and modification time of the video the index was
+    built for, the remaining entries the timestamps in microseconds. If the
+    video changes, the index is rebuilt.
+
+    With the index, a position in the video is turned into a frame number with
+    a binary search instead of seeking the video, which is faster and also
+    correct for videos with a variable frame rate.
+
+    Methods:
+        frame_number(msec)
+            returns the number of the frame closest to a timestamp
+        timestamps()
+            returns the timestamps of all the frames
+    """
+
+
+
+    def __init__(self, video_path: str):
+        """
+        Parameters:
+            video_path (str): path to the video file
+        """
+
+        self.__index_path = '{}.frameindex.npy'.format(video_path)
+
+        # size and modification time identify the version of the video
+        stat = os.stat(video_path)
+        key  = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+        index = np.load(self.__index_path) if os.path.isfile(self.__index_path) else None
+
+        # build the index if there is none or it belongs to an older video
+        if index is None or index.shape[0] < 2 or not np.array_equal(index[:2], key):
+            index = np.concatenate((key, self.__build(video_path)))
+            # the index is only a cache, so it is fine if it can't be stored
+            try:
+                np.save(self.__index_path, index)
+            except OSError:
+                pass
+
+        # timestamps of the frames in microseconds
+        self.__timestamps = index[2:]
+
+
+
+    def __len__(self):
+        return self.__timestamps.shape[0]
+
+
+
+    def frame_number(self, msec: float):
+        """Returns the number of the frame closest to a timestamp
+
+        Parameters:
+            msec (float):
+                position in the video in milliseconds
+
+        Returns:
+            int: the number of the frame whose timestamp is closest to the
+                given one. If it lies exactly between two frames, the later
+                one is returned
+        """
+
+        if len(self) == 0:
+            return 0
+
+        usec = msec * 1000
+        # first frame at or after the timestamp
+        i = int(np.searchsorted(self.__timestamps, usec, side='left'))
+
+        # the frame before might be closer
+        if i == len(self) or (i > 0 and usec - self.__timestamps[i-1] < self.__timestamps[i] - usec):
+            i -= 1
+
+        return i
+
+
+
+    def timestamps(self):
+        """Returns the timestamps of all the frames
+
+        Returns:
+            ndarray: int64 array with the timestamps in microseconds
+        """
+
+        return self.__timestamps
+
+
+
+    def __build(self, video_path: str):
+        """Reads the timestamp of every frame in the video
+
+        Parameters:
+            video_path (str):
+                path to the video file
+
+        Returns:
+            ndarray: int64 array with the timestamps in microseconds
+        """
+
+        cap = cv2.VideoCapture(video_path)
+
+        timestamps = []
+        # grab the frames without decoding them into images
+        while cap.grab():
+            timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+
+        cap.release()
+
+        return np.round(np.array(timestamps, dtype=np.float64) * 1000).astype(np.int64)
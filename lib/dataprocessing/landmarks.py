@@ -0,0 +1,204 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+class FaceLandmarks:
+    """Class representing the 68 facial landmarks of every frame of a video
+
+    Finding the facial landmarks is the expensive part of extracting the eye,
+    but they are tiny compared to the frames and don't depend on the crop size.
+    So the landmarks of every frame that was processed once are stored next to
+    the video, and later runs only decode the frames and crop them again.
+
+    The landmarks are stored in the file '<video>.landmarks.npy' as a numpy
+    array with one record per frame of the video, that can be memory mapped:
+        timestamp (int64): the timestamp of the frame in microseconds
+        found (int8): 1 if a face was found, 0 if not and -1 if the frame
+            wasn't searched yet
+        landmarks (int16, (68, 2)): the x and y coordinates of the landmarks
+            in pixels
+    As in the FrameIndex, the first two records hold the size and modification
+    time of the video in their timestamp. If the video changes, the landmarks
+    are discarded.
+
+    Landmarks that were found in the boxes of a face detector instead of with
+    dlib's face detector are stored in a file of their own, whose name contains
+    a hash of the source, e.g. '<video>.landmarks-1a2b3c4d.npy'.
+
+    Frames of the same video can be added by multiple threads and processes,
+    they are written into the memory mapped file directly.
+
+    Methods:
+        lookup(positions)
+            returns the landmarks of frames if they are known
+        add(positions, landmarks)
+            adds the landmarks of frames
+        records(first, last)
+            returns the records of a range of frames
+        save()
+            writes the added landmarks to the file
+    """
+
+    # number of landmarks per face
+    POINTS = 68
+    # a record per frame
+    DTYPE  = np.dtype([('timestamp', '<i8'), ('found', 'i1'), ('landmarks', '<i2', (68, 2))])
+    # records in front of the frames that identify the video
+    HEADER = 2
+
+
+
+    def __init__(self, video_path: str, timestamps: np.ndarray, source: str = None):
+        """
+        Parameters:
+            video_path (str):
+                path to the video file
+            timestamps (np.ndarray):
+                the timestamps of the frames of the video in microseconds, see
+                FrameIndex
+            source (str, optional):
+                description of the face boxes the landmarks are searched in,
+                landmarks of other sources are not used
+                default: None (dlib's face detector on the whole frame)
+        """
+
+        if source is None:
+            self.__path = '{}.landmarks.npy'.format(video_path)
+        else:
+            self.__path = '{}.landmarks-{}.npy'.format(video_path, hashlib.sha1(source.encode()).hexdigest()[:8])
+
+        # size and modification time identify the version of the video
+        stat = os.stat(video_path)
+        key  = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+        self.__records = self.__load(key, len(timestamps))
+
+        # create the file if there is none or it belongs to an older video
+        if self.__records is None:
+            records = np.zeros(self.HEADER + len(timestamps), dtype=self.DTYPE)
+            records['timestamp'][:self.HEADER] = key
+            records['timestamp'][self.HEADER:] = timestamps
+            records['found'][self.HEADER:]     = -1
+
+            # the landmarks are only a cache, so they are kept in memory if
+            # they can't be stored
+            temp_path = '{}.{}.tmp'.format(self.__path, os.getpid())
+            try:
+                with open(temp_path, 'wb') as records_file:
+                    np.save(records_file, records)
+                os.replace(temp_path, self.__path)
+                self.__records = self.__load(key, len(timestamps))
+            except OSError:
+                pass
+
+            if self.__records is None:
+                self.__records = records
+
+        self.__frames = self.__records[self.HEADER:]
+
+
+
+    def __len__(self):
+        return self.__frames.shape[0]
+
+
+
+    def lookup(self, positions: list):
+        """Returns the landmarks of frames if they are known
+
+        Parameters:
+            positions (list):
+                the frame numbers
+
+        Returns:
+            ndarray, list: whether the frames were searched already and for
+                every frame its (68, 2) landmarks, or None if there was no face
+                or the frame wasn't searched yet
+        """
+
+        records = self.__frames[np.asarray(positions, dtype=np.int64)]
+
+        known     = records['found'] >= 0
+        landmarks = [
+            record['landmarks'].astype(np.int64) if record['found'] == 1 else None
+            for record in records
+        ]
+
+        return known, landmarks
+
+
+
+    def add(self, positions: list, landmarks: list):
+        """Adds the landmarks of frames
+
+        Parameters:
+            positions (list):
+                the frame numbers
+            landmarks (list):
+                the (68, 2) landmarks of every frame, None if there is no face
+        """
+
+        for position, points in zip(positions, landmarks):
+            if points is None:
+                self.__frames['found'][position] = 0
+            else:
+                self.__frames['landmarks'][position] = points
+                self.__frames['found'][position]     = 1
+
+
+
+    def records(self, first: int, last: int):
+        """Returns the records of a range of frames
+
+        Parameters:
+            first (int):
+                frame number of the first frame
+            last (int):
+                frame number of the last frame (inclusive)
+
+        Returns:
+            ndarray: the records of the frames with the fields timestamp, found
+                and landmarks, see the class description
+        """
+
+        return self.__frames[first:last+1]
+
+
+
+    def save(self):
+        """Writes the added landmarks to the file"""
+
+        if isinstance(self.__records, np.memmap):
+            self.__records.flush()
+
+
+
+    def __load(self, key: np.ndarray, frames: int):
+        """Memory maps the stored landmarks, if they belong to the video
+
+        Parameters:
+            key (np.ndarray):
+                size and modification time of the video
+            frames (int):
+                number of frames of the video
+
+        Returns:
+            np.memmap: the records, or None if there are no matching landmarks
+        """
+
+        if not os.path.isfile(self.__path):
+            return None
+
+        try:
+            records = np.load(self.__path, mmap_mode='r+')
+        # a file that can't be read is rebuilt
+        except (OSError, ValueError):
+            return None
+
+        if records.dtype != self.DTYPE or records.shape != (self.HEADER + frames,) \
+            or not np.array_equal(records['timestamp'][:self.HEADER], key):
+            return None
+
+        return records
@@ -0,0 +1,241 @@
+import glob
+import hashlib
+import json
+import os
+
+
+class Manifest:
+    """Class representing the manifest of the processed data of a participant
+
+    The manifest records for every output, such as '1-0-face', the inputs and
+    parameters it was computed from and the checksums of the files that were
+    written. It is used to skip outputs that are already up to date when the
+    data is processed again, for example after a crash.
+
+    The manifest is stored as 'manifest.jsonl' in the output directory of the
+    participant. Every entry is appended as a single line, such that multiple
+    processes can add entries to the same manifest. If an output is recorded
+    more than once, the last entry is the valid one.
+
+    Methods:
+        is_current(name, inputs)
+            checks whether an output is up to date
+        frames(name)
+            returns the number of frames recorded for an output
+        inputs(name)
+            returns the inputs recorded for an output
+        add(name, inputs, files, frames)
+            records an output that was just written
+        compact()
+            rewrites the manifest with only the valid entries
+    """
+
+    FILENAME = 'manifest.jsonl'
+
+
+
+    def __init__(self, directory: str):
+        """
+        Parameters:
+            directory (str): the output directory of the participant
+        """
+
+        self.__directory = directory
+        self.__path      = os.path.join(directory, self.FILENAME)
+
+        # the last entry of every output
+        self.__entries = {}
+        if os.path.isfile(self.__path):
+            with open(self.__path, 'r') as manifest_file:
+                for line in manifest_file:
+                    # a crash can leave an incomplete last line
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.__entries[entry['name']] = entry
+
+
+
+    def is_current(self, name: str, inputs: dict):
+        """Checks whether an output is up to date
+
+        An output is up to date if it was recorded with the same inputs and all
+        its files still exist with the recorded checksums
+
+        Parameters:
+            name (str):
+                name of the output, e.g. '1-0-face'
+            inputs (dict):
+                the inputs and parameters the output would be computed from
+
+        Returns:
+            bool: True if the output doesn't have to be computed again
+        """
+
+        entry = self.__entries.get(name)
+
+        if entry is None or entry['inputs'] != _json_roundtrip(inputs):
+            return False
+
+        return all([
+            os.path.isfile(os.path.join(self.__directory, file))
+            and file_checksum(os.path.join(self.__directory, file)) == checksum
+            for file, checksum in entry['files'].items()
+        ])
+
+
+
+    def frames(self, name: str):
+        """Returns the number of frames recorded for an output
+
+        Parameters:
+            name (str):
+                name of the output
+
+        Returns:
+            int: number of frames
+        """
+
+        return self.__entries[name]['frames']
+
+
+
+    def inputs(self, name: str):
+        """Returns the inputs recorded for an output
+
+        Parameters:
+            name (str):
+                name of the output
+
+        Returns:
+            dict: the inputs and parameters the output was computed from, or
+                None if the output isn't recorded
+        """
+
+        entry = self.__entries.get(name)
+
+        return None if entry is None else entry['inputs']
+
+
+
+    def add(self, name: str, inputs: dict, files: list, frames: int):
+        """Records an output that was just written
+
+        Parameters:
+            name (str):
+                name of the output, e.g. '1-0-face'
+            inputs (dict):
+                the inputs and parameters the output was computed from
+            files (list):
+                names of the files written for the output, relative to the
+                output directory
+            frames (int):
+                number of frames written
+        """
+
+        entry = {
+            'name': name,
+            'inputs': _json_roundtrip(inputs),
+            'files': {file: file_checksum(os.path.join(self.__directory, file)) for file in files},
+            'frames': frames
+        }
+        self.__entries[name] = entry
+
+        # a single write of a single line, such that entries of different
+        # processes don't get mixed up
+        with open(self.__path, 'a') as manifest_file:
+            manifest_file.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+
+    def compact(self):
+        """Rewrites the manifest with only the last entry of every output"""
+
+        temp_path = '{}.tmp'.format(self.__path)
+        with open(temp_path, 'w') as manifest_file:
+            for entry in self.__entries.values():
+                manifest_file.write(json.dumps(entry, sort_keys=True) + '\n')
+
+        os.replace(temp_path, self.__path)
+
+
+
+def file_checksum(path: str):
+    """Computes the SHA-256 checksum of a file
+
+    Parameters:
+        path (str):
+            path to the file
+
+    Returns:
+        str: the checksum as a hex string
+    """
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as checked_file:
+        for block in iter(lambda: checked_file.read(1 << 20), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+
+def video_fingerprint(video_path: str):
+    """Identifies the version of a video file
+
+    Hashing the whole video would take about as long as decoding a part of it,
+    so only the first and last MiB are hashed, together with the size and the
+    modification time
+
+    Parameters:
+        video_path (str):
+            path to the video file
+
+    Returns:
+        dict: the size, the modification time and the hash of the video
+    """
+
+    stat = os.stat(video_path)
+    sha  = hashlib.sha256()
+    with open(video_path, 'rb') as video_file:
+        sha.update(video_file.read(1 << 20))
+        video_file.seek(max(stat.st_size - (1 << 20), 0))
+        sha.update(video_file.read(1 << 20))
+
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'hash': sha.hexdigest()
+    }
+
+
+
+def code_version():
+    """Identifies the version of the data processing code
+
+    Returns:
+        str: SHA-256 hash over the source files of this package
+    """
+
+    sha = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), '*.py'))):
+        with open(path, 'rb') as source_file:
+            sha.update(source_file.read())
+
+    return sha.hexdigest()
+
+
+
+def _json_roundtrip(data: dict):
+    """Converts data to what it looks like after being stored as JSON
+
+    Parameters:
+        data (dict):
+            JSON serialisable data
+
+    Returns:
+        dict: the data with tuples turned into lists and so on
+    """
+
+    return json.loads(json.dumps(data, sort_keys=True))
@@ -0,0 +1,35 @@
+import threading
+
+
+# the models loaded in this process by their key, and the lock that keeps two
+# threads from loading the same model at once
+_models = {}
+_lock   = threading.Lock()
+
+
+
+def shared_model(key: tuple, factory):
+    """Returns a model that is loaded only once per process
+
+    Loading the detection and landmark models takes time and memory, so every
+    model is loaded the first time it is needed and then shared by everyone in
+    the same process, e.g. by all the VideoHandlers a worker process creates.
+
+    The models are not thread safe. Threads that run at the same time have to
+    use different keys, for example by adding the index of the thread to it.
+
+    Parameters:
+        key (tuple):
+            identifies the model and its settings
+        factory (callable):
+            creates the model if it isn't loaded yet
+
+    Returns:
+        the model
+    """
+
+    with _lock:
+        if key not in _models:
+            _models[key] = factory()
+
+        return _models[key]
@@ -0,0 +1,159 @@
+import os
+
+import numpy as np
+
+
+class NpyWriter:
+    """Class representing a .npy file that frames are written to one by one
+
+    The file is created with numpy.lib.format.open_memmap for the maximum number
+    of frames that can be written, and the frames are copied into the memory
+    map as soon as they are added, such that they never have to be held in
+    memory all at once. The header of the file is regularly updated with the
+    number of frames written so far, so a crash leaves a valid .npy file with
+    all the frames up to the last update. When the writer is closed, the header
+    is set to the final number of frames and the unused end of the file is cut
+    off.
+
+    It can be used as a context manager, which closes the writer on exit.
+
+    Methods:
+        append(frame)
+            writes a single frame to the file
+        extend(frames)
+            writes multiple frames to the file
+        close()
+            writes the final header and truncates the file
+    """
+
+    # number of frames after which the header is updated
+    FLUSH_INTERVAL = 256
+
+
+
+    def __init__(self, path: str, shape: tuple, capacity: int, dtype: type = np.uint8):
+        """
+        Parameters:
+            path (str):
+                path of the .npy file to write
+            shape (tuple):
+                the shape of a single frame
+            capacity (int):
+                the maximum number of frames that will be written, usually the
+                number of frames in the interval that is processed
+            dtype (type):
+                the data type of the frames
+                default: np.uint8
+        """
+
+        self.__path   = path
+        self.__shape  = tuple(shape)
+        self.__dtype  = np.dtype(dtype)
+        # number of frames written so far and when the header was last updated
+        self.__length  = 0
+        self.__flushed = 0
+
+        # the header is sized for the capacity, which has at least as many
+        # digits as any number of frames that is written later
+        self.__frames = np.lib.format.open_memmap(
+            path, mode='w+', dtype=self.__dtype, shape=(max(int(capacity), 0), *self.__shape)
+        )
+        self.__offset = self.__frames.offset
+
+        # nothing is written yet
+        self.__write_header()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+    def __len__(self):
+        return self.__length
+
+
+
+    def append(self, frame: np.ndarray):
+        """Writes a single frame to the file
+
+        Parameters:
+            frame (np.ndarray):
+                the frame to write, must be of the shape given to the writer
+        """
+
+        self.extend(np.expand_dims(frame, axis=0))
+
+
+
+    def extend(self, frames: np.ndarray):
+        """Writes multiple frames to the file
+
+        Parameters:
+            frames (np.ndarray):
+                the frames to write, of the shape (frames, *shape)
+        """
+
+        assert frames.shape[1:] == self.__shape
+        assert self.__length + frames.shape[0] <= self.__frames.shape[0], \
+            'more frames than the capacity of {}'.format(self.__frames.shape[0])
+
+        self.__frames[self.__length:self.__length+frames.shape[0]] = frames
+        self.__length += frames.shape[0]
+
+        if self.__length - self.__flushed >= self.FLUSH_INTERVAL:
+            self.__flush()
+
+
+
+    def close(self):
+        """Writes the header with the final number of frames and truncates the file"""
+
+        if self.__frames is None:
+            return
+
+        self.__flush()
+        # the memory map has to be closed before the file can be truncated
+        self.__frames = None
+        os.truncate(self.__path, self.__offset + self.__length * int(np.prod(self.__shape)) * self.__dtype.itemsize)
+
+
+
+    def __flush(self):
+        """Writes the frames to disk and updates the header"""
+
+        self.__frames.flush()
+        self.__write_header()
+        self.__flushed = self.__length
+
+
+
+    def __write_header(self):
+        """Writes the .npy header for the number of frames written so far
+
+        The header is padded with spaces to the size of the header written by
+        open_memmap, such that it can be rewritten in place without moving the
+        data
+        """
+
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+            np.lib.format.dtype_to_descr(self.__dtype),
+            (self.__length, *self.__shape)
+        )
+
+        with open(self.__path, 'r+b') as npy_file:
+            # keep the magic string and the header length of open_memmap, the
+            # length takes 2 bytes in version 1.0 and 4 bytes after that
+            magic = npy_file.read(len(np.lib.format.magic(1, 0)))
+            npy_file.seek(len(magic) + (2 if magic[-2] == 1 else 4))
+            padding = self.__offset - npy_file.tell()
+
+            assert len(header) < padding
+
+            npy_file.write((header.ljust(padding - 1) + '\n').encode('latin1'))
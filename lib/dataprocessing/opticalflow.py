@@ -1,47 +1,491 @@
+import multiprocessing
+
 import cv2
 import numpy as np
 
+
+# the optical flow backends by name, 'farneback' is the one used so far. DIS
+# is a lot faster, its presets trade accuracy for speed
+FLOW_BACKENDS = {
+    'farneback': None,
+    'dis-ultrafast': cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST,
+    'dis-fast': cv2.DISOPTICAL_FLOW_PRESET_FAST,
+    'dis-medium': cv2.DISOPTICAL_FLOW_PRESET_MEDIUM
+}
+
+# the formats the optical flow is stored in by name and their data type.
+# 'image' is the rgb image used so far, the other formats keep the raw flow
+# field with its x and y channel
+FLOW_FORMATS = {
+    'image': np.uint8,
+    'float16': np.float16,
+    'int8': np.int8
+}
+
+# steps per pixel of the 'int8' format, the same for every frame, such that the
+# flow is stored in steps of 1/8 pixel up to a motion of about 16 pixels
+FLOW_SCALE = 8
+
+# smallest number of frame pairs a worker of parallel_optical_flow computes in
+# one go, smaller chunks don't pay for the overhead
+MIN_CHUNK = 16
+# pairs in front of a chunk that are computed again to initialise its flow, if
+# the previous flow is the initial guess
+WARMUP = 4
+
+# the shared memory of the frames and the flow in a worker process
+_shared = {}
+
+
+
 class OpticalFlow:
     """Class representing a module to compute optical flow images
 
     This class uses opencv to compute the optical flow image between to consecutive
     frames.
 
+    The flow is computed either with Farneback's algorithm, whose parameters can
+    be tuned, or with the DIS optical flow at one of its presets, see
+    FLOW_BACKENDS. The backends are not thread safe, every thread needs its own
+    OpticalFlow.
+
+    The flow field and the buffers it is turned into an image with are
+    allocated once and reused for every frame pair of the same size. The image
+    is written into a given output, e.g. the next frame of a preallocated
+    array, or into a buffer that is overwritten by the next call. If the flow
+    of the previous pair is used as the initial guess, an OpticalFlow belongs
+    to a single sequence of frames.
+
+    Instead of the image, the flow field itself can be returned in one of the
+    FLOW_FORMATS. The image normalises the magnitude of every frame pair on its
+    own, the field keeps it and needs 2 instead of 3 values per pixel. Use
+    decode_flow and flow_image to look at the stored fields.
+
+    To compute the flow of whole sequences of frames on all cores, see
+    parallel_optical_flow.
+
     Methods:
-        optical_flow(prev, curr)
+        optical_flow(prev, curr, out)
             compute the optical flow between two images
+        flow(prev, curr)
+            compute the optical flow field between two images
+        reset()
+            forgets the flow of the previous pair
     """
 
 
-    def optical_flow(self, prev: np, curr: np):
+
+    def __init__(self, backend: str = 'farneback', pyr_scale: float = 0.5, levels: int = 3, winsize: int = 15,
+                 iterations: int = 3, poly_n: int = 5, poly_sigma: float = 1.2, initial_flow: bool = False,
+                 output: str = 'image'):
+        """
+        Parameters:
+            backend (str): the optical flow backend, one of the keys of
+                FLOW_BACKENDS
+                default: 'farneback'
+            pyr_scale (float): scale between two levels of the image pyramid,
+                only used by Farneback
+                default: 0.5
+            levels (int): number of pyramid levels, only used by Farneback.
+                OpenCV doesn't go below levels of 32 pixels, so a 64 pixel crop
+                has at most 2 levels
+                default: 3
+            winsize (int): size of the averaging window, only used by Farneback
+                default: 15
+            iterations (int): number of iterations on every pyramid level, only
+                used by Farneback
+                default: 3
+            poly_n (int): size of the neighbourhood of the polynomial expansion,
+                only used by Farneback
+                default: 5
+            poly_sigma (float): standard deviation of the Gaussian that smoothes
+                the polynomial expansion, only used by Farneback
+                default: 1.2
+            initial_flow (bool): if set, the flow of the previous pair is the
+                initial guess for the next one, which converges faster on
+                consecutive frames but changes the flow slightly
+                default: False
+            output (str): the format optical_flow returns, one of the keys of
+                FLOW_FORMATS
+                default: 'image'
+        """
+
+        assert backend in FLOW_BACKENDS
+        assert 0 < pyr_scale < 1
+        assert levels > 0
+        assert winsize > 0
+        assert iterations > 0
+        assert output in FLOW_FORMATS
+
+        self.__farneback = (pyr_scale, levels, winsize, iterations, poly_n, poly_sigma)
+
+        # the DIS instance keeps its buffers between calls
+        self.__dis = cv2.DISOpticalFlow_create(FLOW_BACKENDS[backend]) if backend != 'farneback' else None
+
+        self.__initial_flow = initial_flow
+        self.__output       = output
+        # the buffers, allocated for the size of the first frame pair
+        self.__shape = None
+        self.reset()
+
+
+
+    def reset(self):
+        """Forgets the flow of the previous pair, such that the next pair isn't
+        initialised with it"""
+
+        self.__has_flow = False
+
+
+
+    def optical_flow(self, prev: np, curr: np, out: np.ndarray = None):
         """computes the optical flow between two consecutive video frames
 
         It uses opencv to compute the difference between two images ecoded as the
         optical flow and represents this using an RBG images using the intensities
-        and color.
+        and color. With another output format the flow field is returned in
+        that format instead, see FLOW_FORMATS.
 
         Paramters:
             prev (np): previous frame as grayscale image
             curr (np): current frame as grayscale image
+            out (np, optional): contiguous array of the shape and data type of
+                the output the result is written into, see flow_shape
 
         Returns:
             np: optical flow rgb image of the same height and width as the input
-                images
+                images, or the (height, width, 2) flow field in the output
+                format. If out isn't given, it is a buffer that is overwritten
+                by the next call
+        """
+
+        flow = self.flow(prev, curr)
+
+        if out is None:
+            out = self.__image
+
+        if self.__output == 'float16':
+            np.copyto(out, flow, casting='same_kind')
+            return out
+
+        if self.__output == 'int8':
+            # quantise with the same scale for every frame pair
+            np.multiply(flow, FLOW_SCALE, out=self.__scaled)
+            np.rint(self.__scaled, out=self.__scaled)
+            np.clip(self.__scaled, -127, 127, out=self.__scaled)
+            np.copyto(out, self.__scaled, casting='unsafe')
+            return out
+
+        # split the channels into their buffers, cartToPolar would copy them
+        np.copyto(self.__x, flow[...,0])
+        np.copyto(self.__y, flow[...,1])
+        cv2.cartToPolar(self.__x, self.__y, magnitude=self.__mag, angle=self.__ang)
+
+        # interprete the angle and orientations from the optical flow as colors,
+        # with the same operations as flow_image
+        np.multiply(self.__ang, 180, out=self.__ang)
+        np.divide(self.__ang, np.pi, out=self.__ang)
+        np.divide(self.__ang, 2, out=self.__ang)
+        np.copyto(self.__hsv[...,0], self.__ang, casting='unsafe')
+        cv2.normalize(self.__mag, self.__mag, 0, 255, cv2.NORM_MINMAX)
+        np.copyto(self.__hsv[...,2], self.__mag, casting='unsafe')
+
+        return cv2.cvtColor(self.__hsv, cv2.COLOR_HSV2BGR, dst=out)
+
+
+
+    def flow(self, prev: np.ndarray, curr: np.ndarray):
+        """Computes the optical flow field between two consecutive video frames
+
+        Parameters:
+            prev (np.ndarray): previous frame as grayscale image
+            curr (np.ndarray): current frame as grayscale image
+
+        Returns:
+            np.ndarray: float32 array of the shape (height, width, 2) with the
+                motion of every pixel in x and y direction
         """
-        
-        # hsv matrix to store the optical flow values
-        hsv = np.zeros([*prev.shape,3], dtype=np.uint8)
-        hsv[...,1] = 255 # saturation
 
-        # compute the optical flow between the two
-        flow = cv2.calcOpticalFlowFarneback(prev, curr, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        if self.__shape != prev.shape:
+            self.__allocate(prev.shape)
+
+        # the previous flow is the initial guess
+        initial = self.__initial_flow and self.__has_flow
+        self.__has_flow = True
+
+        if self.__dis is not None:
+            # DIS starts from every field it is given, which is slower and not
+            # the same as starting from none
+            if initial:
+                return self.__dis.calc(prev, curr, self.__flow)
+            flow = self.__dis.calc(prev, curr, None)
+            if self.__initial_flow:
+                np.copyto(self.__flow, flow)
+            return flow
+
+        return cv2.calcOpticalFlowFarneback(
+            prev, curr, self.__flow, *self.__farneback,
+            cv2.OPTFLOW_USE_INITIAL_FLOW if initial else 0
+        )
+
+
+
+    def __allocate(self, shape: tuple):
+        """Allocates the buffers for frames of a size
+
+        Parameters:
+            shape (tuple): height and width of the frames
+        """
+
+        self.__shape = shape
+        # flow field, its channels and their polar coordinates
+        self.__flow = np.zeros([*shape, 2], dtype=np.float32)
+        self.__x    = np.empty(shape, dtype=np.float32)
+        self.__y    = np.empty(shape, dtype=np.float32)
+        self.__mag  = np.empty(shape, dtype=np.float32)
+        self.__ang  = np.empty(shape, dtype=np.float32)
+        # hsv matrix to store the optical flow values and the image
+        self.__hsv   = np.zeros([*shape, 3], dtype=np.uint8)
+        self.__hsv[...,1] = 255 # saturation
+        # the result in the output format
+        self.__scaled = np.empty([*shape, 2], dtype=np.float32)
+        self.__image  = np.empty(flow_shape(shape, self.__output), dtype=FLOW_FORMATS[self.__output])
+
+        self.__has_flow = False
+
+
+
+def flow_shape(shape: tuple, output: str = 'image'):
+    """Returns the shape of the optical flow of frames in an output format
+
+    Parameters:
+        shape (tuple): height and width of the frames
+        output (str): one of the keys of FLOW_FORMATS
+            default: 'image'
+
+    Returns:
+        tuple: (height, width, 3) for the image, (height, width, 2) for the
+            flow field
+    """
+
+    return (*shape, 3) if output == 'image' else (*shape, 2)
+
+
+
+def decode_flow(flow: np.ndarray):
+    """Converts a stored optical flow field back to pixels
+
+    Parameters:
+        flow (np.ndarray): flow fields of the shape (..., 2) in one of the
+            FLOW_FORMATS other than 'image', e.g. a memory mapped .npy file
+
+    Returns:
+        np.ndarray: float32 flow fields of the same shape in pixels
+    """
+
+    if flow.dtype == np.int8:
+        return flow.astype(np.float32) / FLOW_SCALE
+
+    return flow.astype(np.float32)
+
+
+
+def flow_image(flow: np.ndarray):
+    """Encodes an optical flow field as an rgb image
+
+    The direction of the motion is encoded as the hue and its magnitude, scaled
+    to the largest motion in the image, as the value in the HSV color space
+
+    Parameters:
+        flow (np.ndarray): the (height, width, 2) optical flow field, either
+            in pixels or as stored in one of the FLOW_FORMATS
+
+    Returns:
+        np.ndarray: optical flow rgb image of the shape (height, width, 3)
+    """
+
+    if flow.dtype != np.float32:
+        flow = decode_flow(flow)
+
+    # hsv matrix to store the optical flow values
+    hsv = np.zeros([*flow.shape[:2],3], dtype=np.uint8)
+    hsv[...,1] = 255 # saturation
+
+    # process the optical flow
+    mag, ang = cv2.cartToPolar(flow[...,0], flow[...,1])
+
+    # interprete the angle and orientations from the optical flow as colors
+    hsv[...,0] = ang*180/np.pi/2
+    hsv[...,2] = cv2.normalize(mag,None,0,255,cv2.NORM_MINMAX)
+
+    return cv2.cvtColor(hsv,cv2.COLOR_HSV2BGR)
+
+
+
+def parallel_optical_flow(sequences: list, workers: int = None, backend: str = 'farneback', output: str = 'image', **options):
+    """Computes the optical flow of sequences of frames in worker processes
+
+    Every pair of consecutive frames is independent, so the pairs of every
+    sequence are split into chunks that overlap by one frame and computed by a
+    pool of worker processes. The frames and the flow are kept in shared
+    memory, only the frame numbers of the chunks are sent to the workers.
+    OpenCV uses a single thread in every worker.
+
+    Needs Python 3.8 or later for the shared memory.
+
+    The result is the same as computing the flow pair by pair with a single
+    OpticalFlow. Only if the previous flow is the initial guess, every chunk
+    starts WARMUP pairs early to initialise its flow, which makes the flow at
+    the start of a chunk almost but not exactly the same.
+
+    Parameters:
+        sequences (list):
+            the sequences of frames, each a uint8 array of grayscale frames of
+            the shape (frames, height, width), all of the same size
+        workers (int):
+            number of worker processes
+            default: None (number of cores)
+        backend (str):
+            the optical flow backend, one of the keys of FLOW_BACKENDS
+            default: 'farneback'
+        output (str):
+            the format of the flow, one of the keys of FLOW_FORMATS
+            default: 'image'
+        options:
+            additional keyword arguments for the OpticalFlow, e.g. the
+            parameters of Farneback's algorithm
+
+    Returns:
+        list: for every sequence an array of the flow between its consecutive
+            frames, of the shape (frames-1, *flow_shape) and the data type of
+            the output format
+    """
+
+    # shared memory needs Python 3.8, which the rest of the package doesn't
+    from multiprocessing import shared_memory
+
+    workers = workers or multiprocessing.cpu_count()
+    assert workers > 0
+    assert backend in FLOW_BACKENDS
+    assert output in FLOW_FORMATS
+
+    sizes = [len(frames) for frames in sequences]
+    pairs = [max(size - 1, 0) for size in sizes]
+    shape = next((frames.shape[1:] for frames in sequences if len(frames) > 0), (0, 0))
+    dtype = np.dtype(FLOW_FORMATS[output])
+    flows = [np.empty([count, *flow_shape(shape, output)], dtype=dtype) for count in pairs]
+
+    if sum(pairs) == 0:
+        return flows
+
+    # offsets of the sequences in the shared frames and flow
+    frame_offsets = np.cumsum([0, *sizes])
+    flow_offsets  = np.cumsum([0, *pairs])
+
+    # chunks of pairs, spread evenly over the workers
+    chunk  = max(int(np.ceil(sum(pairs) / workers)), MIN_CHUNK)
+    chunks = [
+        (int(frame_offsets[i]), int(flow_offsets[i]), first, min(first + chunk, count))
+        for i, count in enumerate(pairs)
+        for first in range(0, count, chunk)
+    ]
+
+    # all the frames and all the flow, one sequence after the other
+    frames_shape = (int(frame_offsets[-1]), *shape)
+    flows_shape  = (int(flow_offsets[-1]), *flow_shape(shape, output))
+
+    frames_memory = shared_memory.SharedMemory(create=True, size=int(np.prod(frames_shape)))
+    flow_memory   = shared_memory.SharedMemory(create=True, size=int(np.prod(flows_shape)) * dtype.itemsize)
+
+    try:
+        frames = np.ndarray(frames_shape, dtype=np.uint8, buffer=frames_memory.buf)
+        flow   = np.ndarray(flows_shape, dtype=dtype, buffer=flow_memory.buf)
+        for i, sequence in enumerate(sequences):
+            if sizes[i] > 0:
+                frames[frame_offsets[i]:frame_offsets[i+1]] = sequence
+
+        layout = (frames_memory.name, frames_shape, flow_memory.name, flows_shape, dtype.str, backend, output, options)
+        with multiprocessing.Pool(min(workers, len(chunks)), initializer=_init_flow_worker, initargs=layout) as pool:
+            pool.map(_flow_chunk, chunks, chunksize=1)
+
+        # reassemble the flow of every sequence in order
+        for i in range(len(sequences)):
+            flows[i][...] = flow[flow_offsets[i]:flow_offsets[i+1]]
+
+    finally:
+        # the views have to be released before the memory is closed
+        frames = flow = None
+        frames_memory.close()
+        frames_memory.unlink()
+        flow_memory.close()
+        flow_memory.unlink()
+
+    return flows
+
+
+
+def _init_flow_worker(frames_name: str, frames_shape: tuple, flow_name: str, flows_shape: tuple, dtype: str,
+                      backend: str, output: str, options: dict):
+    """Attaches a worker process of parallel_optical_flow to the shared memory
+
+    Parameters:
+        frames_name (str):
+            name of the shared memory of the frames
+        frames_shape (tuple):
+            shape of all the frames
+        flow_name (str):
+            name of the shared memory of the flow
+        flows_shape (tuple):
+            shape of all the flow
+        dtype (str):
+            data type of the flow
+        backend (str):
+            the optical flow backend
+        output (str):
+            the format of the flow
+        options (dict):
+            additional keyword arguments for the OpticalFlow
+    """
+
+    from multiprocessing import shared_memory
+
+    cv2.setNumThreads(1)
+
+    frames_memory = shared_memory.SharedMemory(frames_name)
+    flow_memory   = shared_memory.SharedMemory(flow_name)
+
+    _shared.update({
+        'memory': (frames_memory, flow_memory),
+        'frames': np.ndarray(frames_shape, dtype=np.uint8, buffer=frames_memory.buf),
+        'flow': np.ndarray(flows_shape, dtype=np.dtype(dtype), buffer=flow_memory.buf),
+        'module': (backend, output, options)
+    })
+
+
+
+def _flow_chunk(chunk: tuple):
+    """Computes the optical flow of a chunk of frame pairs in a worker process
+
+    Parameters:
+        chunk (tuple):
+            offset of the sequence in the shared frames and flow and the first
+            and last (exclusive) pair of the chunk within the sequence
+    """
+
+    frame_offset, flow_offset, first, last = chunk
+    frames = _shared['frames']
+    flow   = _shared['flow']
+    backend, output, options = _shared['module']
 
-        # process the optical flow
-        mag, ang = cv2.cartToPolar(flow[...,0], flow[...,1])
+    optical_flow = OpticalFlow(backend, output=output, **options)
 
-        # interprete the angle and orientations from the optical flow as colors
-        hsv[...,0] = ang*180/np.pi/2
-        hsv[...,2] = cv2.normalize(mag,None,0,255,cv2.NORM_MINMAX)
-        of_image = cv2.cvtColor(hsv,cv2.COLOR_HSV2BGR)
+    # initialise the flow with the pairs in front of the chunk, which are
+    # computed by the previous chunk
+    if options.get('initial_flow', False):
+        for pair in range(max(first - WARMUP, 0), first):
+            optical_flow.flow(frames[frame_offset+pair], frames[frame_offset+pair+1])
 
-        return of_image
+    for pair in range(first, last):
+        optical_flow.optical_flow(
+            frames[frame_offset+pair], frames[frame_offset+pair+1], out=flow[flow_offset+pair]
+        )
@@ -0,0 +1,223 @@
+import queue
+import threading
+import time
+
+
+class FramePipeline:
+    """Class representing a pipeline that decodes and processes frames concurrently
+
+    A decoder thread reads the frames from an iterator and puts them into a
+    bounded queue, while one or more processing threads take the frames from the
+    queue and process them. OpenCV releases the GIL while decoding and running
+    the face detection, so the threads really run in parallel. The results are
+    handed back in the order of the frames.
+
+    Every processing thread has its own processor, such that the processors
+    don't have to be thread safe.
+
+    Methods:
+        run(frames, processors)
+            generator that yields the processed frames in order
+        stats()
+            returns the queue depths and stall times of the last run
+    """
+
+    # time in seconds after which a blocked thread checks if it should stop
+    POLL_INTERVAL = 0.1
+
+
+
+    def __init__(self, queue_size: int = 32):
+        """
+        Parameters:
+            queue_size (int):
+                maximum number of decoded frames waiting to be processed
+                default: 32
+        """
+
+        assert queue_size > 0
+
+        self.__queue_size = queue_size
+        self.__stats      = {}
+
+
+
+    def run(self, frames, processors: list):
+        """Generator that decodes and processes the frames concurrently
+
+        Parameters:
+            frames (iterable):
+                the frames to process. It is iterated in the decoder thread
+            processors (list):
+                one callable per processing thread, that is called with a single
+                frame and returns the processed result
+
+        Yields:
+            the result of the processor for every frame, in the order of the
+            frames
+        """
+
+        assert len(processors) > 0
+
+        decoded   = queue.Queue(self.__queue_size)
+        processed = queue.Queue()
+        stop      = threading.Event()
+
+        self.__stats = {
+            'frames': 0,
+            'queue_size': self.__queue_size,
+            'max_queue_depth': 0,
+            'mean_queue_depth': 0.0,
+            'decoder_stall': 0.0,
+            'processor_stall': [0.0] * len(processors),
+            'consumer_stall': 0.0
+        }
+
+        threads = [threading.Thread(target=self.__decode, args=(frames, decoded, len(processors), stop))]
+        threads += [
+            threading.Thread(target=self.__process, args=(processor, i, decoded, processed, stop))
+            for i, processor in enumerate(processors)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # results that arrived before their predecessors
+        pending  = {}
+        next_seq = 0
+        finished = 0
+
+        try:
+            while finished < len(processors):
+                start = time.perf_counter()
+                seq, result, error = processed.get()
+                self.__stats['consumer_stall'] += time.perf_counter() - start
+
+                if error is not None:
+                    raise error
+                # a processing thread is done
+                if seq is None:
+                    finished += 1
+                    continue
+
+                pending[seq] = result
+                # hand on all the results that are complete
+                while next_seq in pending:
+                    yield pending.pop(next_seq)
+                    next_seq += 1
+
+        finally:
+            # also stops the threads if the generator isn't consumed completely
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+
+
+    def stats(self):
+        """Returns statistics about the last run
+
+        Returns:
+            dict: the number of frames, the size of the queue, the maximum and
+                mean number of frames in the queue when a frame was added, the
+                seconds the decoder waited for space in the queue, the seconds
+                every processing thread waited for frames and the seconds the
+                consumer waited for results
+        """
+
+        return dict(self.__stats)
+
+
+
+    def __decode(self, frames, decoded: queue.Queue, processors: int, stop: threading.Event):
+        """Decoder thread, that puts the frames into the queue
+
+        Parameters:
+            frames (iterable):
+                the frames to decode
+            decoded (queue.Queue):
+                queue for the decoded frames
+            processors (int):
+                number of processing threads, each gets a sentinel at the end
+            stop (threading.Event):
+                set if the pipeline should stop
+        """
+
+        try:
+            for seq, frame in enumerate(frames):
+                depth = decoded.qsize()
+                self.__stats['max_queue_depth']  = max(self.__stats['max_queue_depth'], depth)
+                self.__stats['mean_queue_depth'] += (depth - self.__stats['mean_queue_depth']) / (seq + 1)
+                self.__stats['frames'] = seq + 1
+
+                start = time.perf_counter()
+                if not self.__put(decoded, (seq, frame, None), stop):
+                    return
+                self.__stats['decoder_stall'] += time.perf_counter() - start
+
+        except Exception as error:
+            self.__put(decoded, (None, None, error), stop)
+
+        # tell every processing thread that there are no more frames
+        for _ in range(processors):
+            self.__put(decoded, (None, None, None), stop)
+
+
+
+    def __process(self, processor, index: int, decoded: queue.Queue, processed: queue.Queue, stop: threading.Event):
+        """Processing thread, that processes the frames from the queue
+
+        Parameters:
+            processor (callable):
+                function to process a single frame
+            index (int):
+                index of the thread for the statistics
+            decoded (queue.Queue):
+                queue with the decoded frames
+            processed (queue.Queue):
+                queue for the results
+            stop (threading.Event):
+                set if the pipeline should stop
+        """
+
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                seq, frame, error = decoded.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                self.__stats['processor_stall'][index] += time.perf_counter() - start
+                continue
+            self.__stats['processor_stall'][index] += time.perf_counter() - start
+
+            # pass errors of the decoder on
+            if error is not None:
+                processed.put((None, None, error))
+                return
+            # no more frames
+            if seq is None:
+                processed.put((None, None, None))
+                return
+
+            try:
+                processed.put((seq, processor(frame), None))
+            except Exception as exception:
+                processed.put((None, None, exception))
+                return
+
+
+
+    def __put(self, target: queue.Queue, item: tuple, stop: threading.Event):
+        """Puts an item into a bounded queue, unless the pipeline is stopped
+
+        Returns:
+            bool: whether the item was put into the queue
+        """
+
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=self.POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+
+        return False
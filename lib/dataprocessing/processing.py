@@ -0,0 +1,722 @@
+"""Functions that process the recorded experiment data into .npy files
+
+Variables:
+    METHODS
+        the processing methods, 'face', 'opticalflow' and every region of the
+        face in regions.REGIONS
+
+Functions:
+    process_participant(exp_data_path, output_path, methods, crop, lecture_video,
+                        workers, resume, frame_offsets)
+        processes the video of a single participant and writes one .npy file
+        per trial and method. The trials can be split between multiple
+        worker processes and trials that are up to date are skipped
+    process_participants(exp_data_paths, output_path, methods, crop,
+                         lecture_video, workers, resume, frame_offsets)
+        processes multiple participants in parallel using a process pool
+    derive_optical_flow(participant_path, resume, flow_backend, flow_options,
+                        flow_format, flow_workers)
+        computes the optical flow .npy files of a participant from its face
+        .npy files, without the video
+    derive_participants(participant_paths, workers, resume, flow_backend,
+                        flow_options, flow_format, flow_workers)
+        derives the optical flow of multiple participants in parallel using a
+        process pool
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import time
+import traceback
+
+import cv2
+import numpy as np
+
+from .experimentdata import ExperimentData
+from .frameindex import FrameIndex
+from .manifest import Manifest, code_version, file_checksum, video_fingerprint
+from .npywriter import NpyWriter
+from .opticalflow import FLOW_FORMATS, OpticalFlow, flow_shape, parallel_optical_flow
+from .regions import REGIONS
+from .util import getExperimentInfo
+from .video import VideoHandler, resolve_frame_step
+
+
+# the processing methods, every region of the face is a method of its own
+METHODS = ['face', 'opticalflow', *REGIONS]
+
+# handler options the frames of the methods depend on. The frames of every
+# method depend on the frame rate, the faces on the face detection, the optical
+# flow on the face detection and its own settings and the regions on the
+# landmarks. Options like pipeline_threads only change how fast the frames are
+# processed
+_FRAME_OPTIONS     = ['frame_step', 'target_fps']
+_DETECTION_OPTIONS = ['detector', 'detect_interval', 'drift_threshold']
+_FLOW_OPTIONS      = ['flow_backend', 'flow_options', 'flow_format']
+_LANDMARK_OPTIONS  = ['eye_from_face']
+
+# the face outputs the optical flow can be derived from, of the trials and of
+# the lecture video
+_FACE_OUTPUT = re.compile(r'(\d+-\d+-face(_\d+x\d+)?|face(_\d+x\d+)?_lecture_video)(_step\d+-\d+)?')
+
+
+def process_participant(exp_data_path: str, output_path: str, methods: list, crop, lecture_video: bool = False, workers: int = 1, resume: bool = True, frame_offsets: list = None, **handler_options):
+    """Processes the video of a single participant
+
+    Extracts the frames of all 25 trials, and optionally the lecture video,
+    with all the given methods in a single pass over the video and writes them
+    to '{n}-{i}-{method}.npy' files, and '{method}_lecture_video.npy' files,
+    in a directory named after the participant. For every trial the ground
+    truth is written to a .json file of the same name.
+
+    With more than one worker, the trials are sorted by time and split into
+    contiguous groups of about the same duration. Every group is processed by
+    its own worker process, which opens the video on its own. A worker starts
+    its first trial at the frame the FrameIndex gives for its timestamp, even
+    on videos with a variable frame rate, so the output is the same as with a
+    single worker.
+
+    Every output is recorded in the Manifest of the participant as soon as its
+    files are complete. If resume is set, outputs that were recorded with the
+    same video, parameters and code version and whose files are unchanged are
+    skipped, so after a crash only the missing outputs are computed. The
+    parameters of an output are only the options its method depends on, e.g.
+    the options of the optical flow don't change the face outputs.
+
+    If only every n-th frame is extracted, see the frame_step and target_fps
+    options of the VideoHandler, the frames in between are not decoded at
+    all. Every trial is extracted once for every frame offset into a file
+    named '{n}-{i}-{method}_step{step}-{offset}', the phases of the subsampled
+    time series, which raw_to_training_data.py groups by trial.
+
+    If a list of crop sizes is given, every size is cropped from the same face
+    box and landmarks in the same pass and written to its own file, with the
+    size after the method, e.g. '{n}-{i}-face_64x64'. A single crop size keeps
+    the names without it.
+
+    Parameters:
+        exp_data_path (str):
+            path to the experiment data directory of the participant, that
+            contains the .json file and the video file
+        output_path (str):
+            directory in which the output directory of the participant is
+            created
+        methods (list):
+            list of methods, each one of METHODS
+        crop (int or list):
+            the crop size of the extracted images (squared), or a list of crop
+            sizes that are all extracted at once
+        lecture_video (bool):
+            if set, the lecture video part is processed as well, in the same
+            pass as the trials
+            default: False
+        workers (int):
+            number of worker processes the trials are split between
+            default: 1 (everything is processed in this process)
+        resume (bool):
+            if set, outputs that are up to date are not computed again
+            default: True
+        frame_offsets (list):
+            if only every n-th frame is extracted, the offsets of the first
+            extracted frame of every trial, each less than the frame step
+            default: None (only offset 0)
+        handler_options:
+            additional keyword arguments for the VideoHandler, such as
+            pipeline_threads, queue_size and batch_size
+
+    Returns:
+        dict, list: number of frames of every output file name, in the order
+            of the trials and methods, and the names of the outputs that were
+            skipped because they were up to date
+    """
+
+    # retrieve the files from the experiment directory
+    exp_json, video_path, participant = getExperimentInfo(exp_data_path)
+
+    assert os.path.exists(video_path) and os.path.isfile(video_path) \
+        and os.path.splitext(video_path)[1] == '.mp4'
+    assert os.path.exists(exp_json) and os.path.isfile(exp_json) \
+        and os.path.splitext(exp_json)[1] == '.json'
+    assert workers > 0
+
+    crops = [crop] if isinstance(crop, int) else list(crop)
+    assert len(crops) > 0 and len(set(crops)) == len(crops)
+
+    exp_data = ExperimentData(exp_json)
+
+    # create the output directory for this participant
+    participant_path = os.path.join(output_path, participant)
+    os.makedirs(participant_path, exist_ok=True)
+
+    # collect the trials of every difficulty level together with the name of
+    # their output files and their ground truth
+    trials = [
+        (trial, '{}-{}-{{method}}'.format(n, i))
+        for n in range(1,6)
+        for i, trial in enumerate(exp_data.get_trials(n))
+    ]
+    intervals     = [(trial['start'], trial['end']) for trial, _ in trials]
+    names         = [name for _, name in trials]
+    ground_truths = [{'n': trial['n'], 'score': trial['score']} for trial, _ in trials]
+
+    # the lecture video is decoded in the same pass as the trials, it has no
+    # ground truth
+    if lecture_video:
+        intervals.append(exp_data.get_video_lecture_timestamps())
+        names.append('{method}_lecture_video')
+        ground_truths.append(None)
+
+    # only every step-th frame is extracted, once for every offset
+    step    = resolve_frame_step(video_path, handler_options.get('frame_step', 1), handler_options.get('target_fps'))
+    offsets = frame_offsets or [0]
+    assert all([0 <= offset < step for offset in offsets]) and len(set(offsets)) == len(offsets)
+
+    if step > 1:
+        intervals     = [(*interval, offset) for interval in intervals for offset in offsets]
+        names         = ['{}_step{}-{}'.format(name, step, offset) for name in names for offset in offsets]
+        ground_truths = [ground_truth for ground_truth in ground_truths for _ in offsets]
+
+    # everything the outputs depend on, apart from the interval, the method,
+    # its options and the crop size
+    parameters = {
+        'video': video_fingerprint(video_path),
+        'code': code_version()
+    }
+
+    manifest = Manifest(participant_path)
+    # drop the outdated entries of earlier runs before the workers append to it
+    manifest.compact()
+
+    # the methods that have to be computed for every interval
+    jobs    = []
+    skipped = []
+    for interval, name, ground_truth in zip(intervals, names, ground_truths):
+        inputs = dict(parameters, start=interval[0].isoformat(), end=interval[1].isoformat())
+        # the offset of the first frame if only every step-th frame is extracted
+        if len(interval) > 2:
+            inputs['offset'] = interval[2]
+
+        stale = []
+        for method in methods:
+            for size in crops:
+                output = _output_name(name, method, size, crops)
+                if resume and manifest.is_current(output, _output_inputs(inputs, method, size, handler_options)):
+                    skipped.append(output)
+                else:
+                    stale.append((method, size))
+
+        if stale:
+            jobs.append((interval, name, stale, ground_truth, inputs))
+
+    if not jobs:
+        counts = {}
+
+    elif workers == 1:
+        counts = _write_intervals(video_path, jobs, participant_path, crops, handler_options)
+
+    else:
+        # build the frame index once, instead of in every worker at the same time
+        FrameIndex(video_path)
+
+        groups = _split_intervals([job[0] for job in jobs], workers)
+        tasks  = [
+            (
+                video_path,
+                [jobs[i] for i in group],
+                participant_path,
+                crops,
+                handler_options
+            )
+            for group in groups
+        ]
+
+        # split the cores between the workers
+        threads = max(1, os.cpu_count() // len(groups))
+        with multiprocessing.Pool(len(groups), initializer=_init_worker, initargs=(threads,)) as pool:
+            group_counts = pool.starmap(_write_intervals, tasks)
+
+        counts = {name: count for group in group_counts for name, count in group.items()}
+
+    # the frames of the skipped outputs are taken from the manifest
+    counts.update({name: manifest.frames(name) for name in skipped})
+
+    # restore the order of the intervals
+    frame_counts = {
+        _output_name(name, method, size, crops): counts[_output_name(name, method, size, crops)]
+        for name in names
+        for method in methods
+        for size in crops
+    }
+
+    return frame_counts, skipped
+
+
+
+def process_participants(exp_data_paths: list, output_path: str, methods: list, crop, lecture_video: bool = False, workers: int = None, resume: bool = True, frame_offsets: list = None, **handler_options):
+    """Processes the videos of multiple participants in parallel
+
+    The participants are distributed over a pool of worker processes. Every
+    worker creates its own VideoHandler, and with it its own face and eye
+    extractors. The number of threads OpenCV uses internally is limited in
+    every worker, such that all the workers together don't use more threads
+    than there are cores.
+
+    Generator that yields the result of every participant as soon as it is
+    finished, which is not necessarily the order they were given in.
+
+    Parameters:
+        exp_data_paths (list):
+            list of experiment data directories, one per participant
+        output_path (str):
+            directory in which the output directories of the participants are
+            created
+        methods (list):
+            list of methods, each one of METHODS
+        crop (int or list):
+            the crop size of the extracted images (squared), or a list of crop
+            sizes, see process_participant
+        lecture_video (bool):
+            if set, the lecture video part is processed as well, see
+            process_participant
+            default: False
+        workers (int):
+            number of worker processes
+            default: None (number of cores)
+        resume (bool):
+            if set, outputs that are up to date are not computed again
+            default: True
+        frame_offsets (list):
+            the offsets of the first extracted frame of every trial if only
+            every n-th frame is extracted, see process_participant
+            default: None (only offset 0)
+        handler_options:
+            additional keyword arguments for the VideoHandler of every
+            participant
+
+    Yields:
+        str, dict, list, float, str: the experiment data directory, the frame
+            counts and the skipped outputs returned by process_participant, the
+            time it took in seconds and the traceback if the processing failed
+            (None otherwise). The frame counts and the skipped outputs are None
+            if the processing failed
+    """
+
+    workers = workers or os.cpu_count()
+    # split the cores between the workers
+    threads = max(1, os.cpu_count() // workers)
+
+    tasks = [(path, output_path, methods, crop, lecture_video, 1, resume, frame_offsets, handler_options) for path in exp_data_paths]
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        for result in pool.imap_unordered(_process_participant_task, tasks):
+            yield result
+
+
+
+def derive_optical_flow(participant_path: str, resume: bool = True, flow_backend: str = 'farneback', flow_options: dict = None, flow_format: str = 'image', flow_workers: int = 1):
+    """Computes the optical flow of a participant from its face .npy files
+
+    The optical flow is computed between consecutive face images, so it can be
+    derived from the '{n}-{i}-face.npy' files of an earlier run without
+    decoding the video and detecting the faces again. Every face file is
+    memory mapped and its flow is written to the matching
+    '{n}-{i}-opticalflow.npy' file, together with a copy of the ground truth
+    .json file. The lecture video is derived the same way.
+
+    The frames are the same as the ones process_participant computes for the
+    'opticalflow' method with the same options. If the face output is up to
+    date in the manifest, the optical flow is recorded with the inputs of the
+    face output, such that process_participant skips it. Otherwise it is
+    recorded with the checksum of the face file.
+
+    With more than one flow worker, the frame pairs of every face file are
+    split between worker processes, see parallel_optical_flow.
+
+    Parameters:
+        participant_path (str):
+            the output directory of the participant, that contains the face
+            .npy files
+        resume (bool):
+            if set, optical flow outputs that are up to date are not computed
+            again
+            default: True
+        flow_backend (str):
+            the optical flow backend, one of the keys of
+            opticalflow.FLOW_BACKENDS
+            default: 'farneback'
+        flow_options (dict):
+            the parameters of Farneback's algorithm and whether the previous
+            flow is the initial guess, see OpticalFlow
+            default: None (the default parameters)
+        flow_format (str):
+            the format of the optical flow frames, one of the keys of
+            opticalflow.FLOW_FORMATS
+            default: 'image'
+        flow_workers (int):
+            number of worker processes the optical flow of a face file is
+            computed by
+            default: 1 (the flow is computed in this process)
+
+    Returns:
+        dict, list: number of frames of every optical flow output, in the
+            order of the face outputs, and the names of the outputs that were
+            skipped because they were up to date
+    """
+
+    flow_options = flow_options or {}
+    assert os.path.isdir(participant_path)
+    assert flow_format in FLOW_FORMATS
+    assert flow_workers > 0
+
+    manifest = Manifest(participant_path)
+    manifest.compact()
+
+    # the name of every face output with '{method}' in place of the method,
+    # like the names of process_participant
+    names = sorted([
+        os.path.splitext(file)[0].replace('face', '{method}', 1)
+        for file in os.listdir(participant_path)
+        if os.path.splitext(file)[1] == '.npy' and _FACE_OUTPUT.fullmatch(os.path.splitext(file)[0])
+    ])
+
+    # the options of the optical flow, as they are passed to the VideoHandler
+    options = {'flow_backend': flow_backend, 'flow_options': flow_options, 'flow_format': flow_format}
+
+    frame_counts = {}
+    skipped      = []
+    for name in names:
+        face   = name.format(method='face')
+        output = name.format(method='opticalflow')
+
+        # the inputs of the face if it is up to date, with the options of the
+        # optical flow
+        inputs = manifest.inputs(face)
+        if inputs is not None and manifest.is_current(face, inputs):
+            inputs = dict(inputs, method='opticalflow', options=dict(inputs['options'], **options))
+        else:
+            inputs = {
+                'face': file_checksum(os.path.join(participant_path, '{}.npy'.format(face))),
+                'options': options,
+                'code': code_version(),
+                'method': 'opticalflow'
+            }
+
+        if resume and manifest.is_current(output, inputs):
+            skipped.append(output)
+            frame_counts[output] = manifest.frames(output)
+            continue
+
+        faces = np.load(os.path.join(participant_path, '{}.npy'.format(face)), mmap_mode='r')
+        files = ['{}.npy'.format(output)]
+
+        with NpyWriter(
+            os.path.join(participant_path, files[0]),
+            flow_shape(faces.shape[1:], flow_format),
+            max(len(faces) - 1, 0),
+            FLOW_FORMATS[flow_format]
+        ) as writer:
+            if flow_workers > 1:
+                # the pairs of the faces are split between the worker processes
+                for flow in parallel_optical_flow([faces], flow_workers, flow_backend, flow_format, **flow_options)[0]:
+                    writer.append(flow)
+            else:
+                optical_flow = OpticalFlow(flow_backend, output=flow_format, **flow_options)
+                # the first face has no predecessor
+                for i in range(1, len(faces)):
+                    writer.append(optical_flow.optical_flow(faces[i-1], faces[i]))
+
+        # the ground truth of the trial is the one of the face
+        if os.path.isfile(os.path.join(participant_path, '{}.json'.format(face))):
+            files.append('{}.json'.format(output))
+            shutil.copyfile(
+                os.path.join(participant_path, '{}.json'.format(face)),
+                os.path.join(participant_path, files[-1])
+            )
+
+        frame_counts[output] = max(len(faces) - 1, 0)
+        manifest.add(output, inputs, files, frame_counts[output])
+
+    return frame_counts, skipped
+
+
+
+def derive_participants(participant_paths: list, workers: int = None, resume: bool = True, **flow_settings):
+    """Derives the optical flow of multiple participants in parallel
+
+    The participants are distributed over a pool of worker processes, that run
+    derive_optical_flow. OpenCV uses a single thread in every worker.
+
+    With more than one flow worker, the optical flow of every participant is
+    computed by a pool of its own instead, which the workers of a pool can't
+    start. The participants are derived one after another then.
+
+    Generator that yields the result of every participant as soon as it is
+    finished, which is not necessarily the order they were given in.
+
+    Parameters:
+        participant_paths (list):
+            list of output directories, one per participant, that contain the
+            face .npy files
+        workers (int):
+            number of worker processes
+            default: None (number of cores)
+        resume (bool):
+            if set, outputs that are up to date are not computed again
+            default: True
+        flow_settings:
+            flow_backend, flow_options, flow_format and flow_workers, see
+            derive_optical_flow
+
+    Yields:
+        str, dict, list, float, str: the participant directory, the frame
+            counts and the skipped outputs returned by derive_optical_flow,
+            the time it took in seconds and the traceback if it failed (None
+            otherwise). The frame counts and the skipped outputs are None if it
+            failed
+    """
+
+    workers = workers or os.cpu_count()
+
+    tasks = [(path, resume, flow_settings) for path in participant_paths]
+
+    # the pairs of every participant are split between the flow workers
+    if flow_settings.get('flow_workers', 1) > 1:
+        for task in tasks:
+            yield _derive_participant_task(task)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(1,)) as pool:
+        for result in pool.imap_unordered(_derive_participant_task, tasks):
+            yield result
+
+
+
+def _write_intervals(video_path: str, jobs: list, participant_path: str, crops: list, handler_options: dict):
+    """Processes intervals of a video and writes them to .npy files
+
+    The video is opened by its own VideoHandler and decoded once for all the
+    intervals. As soon as an interval is complete, its files are closed, its
+    ground truth is written and it is recorded in the manifest of the
+    participant.
+
+    Parameters:
+        video_path (str):
+            path to the video file
+        jobs (list):
+            one (interval, name, outputs, ground_truth, inputs) tuple per
+            interval. The interval is a (start, end) tuple of datetime
+            objects, the name of the output files has a '{method}'
+            placeholder for the method, the outputs are the (method, crop)
+            pairs that are computed for the interval, the ground truth is
+            written to a .json file next to every output unless it is None and
+            the inputs are recorded in the manifest together with the method,
+            its options and the crop size, see _output_inputs
+        participant_path (str):
+            directory the files are written to
+        crops (list):
+            the crop sizes of the extracted images (squared)
+        handler_options (dict):
+            keyword arguments for the VideoHandler
+
+    Returns:
+        dict: number of frames written for every output file name
+    """
+
+    video_handler = VideoHandler(video_path, **handler_options)
+    manifest      = Manifest(participant_path)
+    methods       = [method for method in METHODS if any([method == output[0] for job in jobs for output in job[2]])]
+
+    # write the frames of every interval, method and crop size straight into
+    # its memory mapped .npy file while the video is decoded once for all of
+    # them
+    writers = [
+        {
+            (method, size): NpyWriter(
+                os.path.join(participant_path, '{}.npy'.format(_output_name(name, method, size, crops))),
+                video_handler.frame_shape(method, size),
+                video_handler.count_frames(*interval),
+                video_handler.frame_dtype(method)
+            )
+            for method, size in interval_outputs
+        }
+        for interval, name, interval_outputs, _, _ in jobs
+    ]
+
+    frame_counts = {}
+
+    def complete(i):
+        _, name, _, ground_truth, inputs = jobs[i]
+
+        for (method, size), writer in writers[i].items():
+            output = _output_name(name, method, size, crops)
+            files  = ['{}.npy'.format(output)]
+            writer.close()
+
+            # save the gt data of the trial as a json file next to the frames
+            if ground_truth is not None:
+                files.append('{}.json'.format(output))
+                with open(os.path.join(participant_path, files[-1]), 'w') as json_file:
+                    json.dump(ground_truth, json_file)
+
+            frame_counts[output] = len(writer)
+            manifest.add(output, _output_inputs(inputs, method, size, handler_options), files, len(writer))
+
+    video_handler.write_interval_frames([job[0] for job in jobs], crops, methods, writers, complete)
+
+    return frame_counts
+
+
+
+def _output_name(name: str, method: str, crop: int, crops: list):
+    """Returns the name of the output of a method and crop size
+
+    Parameters:
+        name (str):
+            name of the output files with a '{method}' placeholder
+        method (str):
+            the method of the output
+        crop (int):
+            the crop size of the output
+        crops (list):
+            all the crop sizes that are extracted
+
+    Returns:
+        str: the name with the method, followed by the crop size if multiple
+            sizes are extracted, e.g. '1-0-face_64x64'
+    """
+
+    # a single crop size keeps the names of earlier runs
+    if len(crops) > 1:
+        method = '{}_{}x{}'.format(method, crop, crop)
+
+    return name.format(method=method)
+
+
+
+def _output_inputs(inputs: dict, method: str, crop: int, handler_options: dict):
+    """Returns the inputs of an output, as they are recorded in the manifest
+
+    Parameters:
+        inputs (dict):
+            the inputs of the interval, the same for all its outputs
+        method (str):
+            the method of the output
+        crop (int):
+            the crop size of the output
+        handler_options (dict):
+            keyword arguments for the VideoHandler
+
+    Returns:
+        dict: the inputs with the method, the crop size and the handler options
+            the frames of the method depend on
+    """
+
+    keys = list(_FRAME_OPTIONS)
+    # the regions are only cropped from the box of the face detection if the
+    # landmarks are searched in it
+    if method in ['face', 'opticalflow'] or handler_options.get('eye_from_face'):
+        keys += _DETECTION_OPTIONS
+    if method == 'opticalflow':
+        keys += _FLOW_OPTIONS
+    if method in REGIONS:
+        keys += _LANDMARK_OPTIONS
+
+    options = {key: handler_options[key] for key in keys if key in handler_options}
+
+    return dict(inputs, method=method, crop=crop, options=options)
+
+
+
+def _split_intervals(intervals: list, groups: int):
+    """Splits intervals into contiguous groups of about the same duration
+
+    Parameters:
+        intervals (list):
+            list of (start, end) tuples of datetime objects
+        groups (int):
+            maximum number of groups
+
+    Returns:
+        list: list of groups, each a list of indices into the intervals. The
+            groups are sorted by time and none of them is empty
+    """
+
+    # indices of the intervals sorted by their start
+    order     = sorted(range(len(intervals)), key=lambda i: intervals[i][0])
+    durations = [(intervals[i][1] - intervals[i][0]).total_seconds() for i in order]
+    groups    = max(1, min(groups, len(order)))
+    target    = sum(durations) / groups
+
+    split  = [[]]
+    filled = 0
+    for k, (i, duration) in enumerate(zip(order, durations)):
+        # start a new group once the current one is full, or if every one of
+        # the remaining intervals is needed to fill the remaining groups
+        if split[-1] and len(split) < groups \
+            and (filled >= target * len(split) or len(order) - k <= groups - len(split)):
+            split.append([])
+        split[-1].append(i)
+        filled += duration
+
+    return split
+
+
+
+def _init_worker(threads: int):
+    """Limits the number of threads OpenCV uses in a worker process
+
+    Parameters:
+        threads (int):
+            number of threads OpenCV may use
+    """
+
+    cv2.setNumThreads(threads)
+
+
+
+def _process_participant_task(task: tuple):
+    """Runs process_participant in a worker process and catches any failure
+
+    Parameters:
+        task (tuple):
+            the arguments for process_participant, the last one being the
+            dictionary of handler options
+
+    Returns:
+        str, dict, float, str: see process_participants
+    """
+
+    *arguments, handler_options = task
+
+    start = time.perf_counter()
+    try:
+        frame_counts, skipped = process_participant(*arguments, **handler_options)
+        return task[0], frame_counts, skipped, time.perf_counter() - start, None
+    except Exception:
+        return task[0], None, None, time.perf_counter() - start, traceback.format_exc()
+
+
+
+def _derive_participant_task(task: tuple):
+    """Runs derive_optical_flow in a worker process and catches any failure
+
+    Parameters:
+        task (tuple):
+            the arguments for derive_optical_flow, the last one being the
+            dictionary of flow settings
+
+    Returns:
+        str, dict, list, float, str: see derive_participants
+    """
+
+    *arguments, flow_settings = task
+
+    start = time.perf_counter()
+    try:
+        frame_counts, skipped = derive_optical_flow(*arguments, **flow_settings)
+        return task[0], frame_counts, skipped, time.perf_counter() - start, None
+    except Exception:
+        return task[0], None, None, time.perf_counter() - start, traceback.format_exc()
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+
+
+# the regions that can be cropped from the 68 facial landmarks by name. Every
+# region is given by the landmarks it spans and the size of the squared crop
+# relative to the width of the landmarks. 'eye' is the right eye of the
+# participant, which is on the left of the image
+REGIONS = {
+    'eye': ((36, 39), 1.5),
+    'lefteye': ((42, 45), 1.5),
+    'mouth': ((48, 54), 1.2),
+    'landmarkface': (tuple(range(68)), 1.1)
+}
+
+
+
+def crop_region(frame: np.ndarray, landmarks: np.ndarray, region: str, crop: int):
+    """Crops a squared image of a region of the face
+
+    The crop is centered on the landmarks of the region and its size is a
+    multiple of their width, see REGIONS
+
+    Parameters:
+        frame (np.ndarray):
+            the video frame
+        landmarks (np.ndarray):
+            the 68 facial landmarks of the face in the frame
+        region (str):
+            name of the region, one of the keys of REGIONS
+        crop (int):
+            final crop size for the region image
+
+    Returns:
+        np.ndarray: the image of the region of size (crop, crop, 3)
+    """
+
+    indices, scale = REGIONS[region]
+    points = landmarks[list(indices)]
+
+    left, top     = points.min(axis=0)
+    right, bottom = points.max(axis=0)
+
+    # compute the x center of the region
+    middle_x = int((right - left)/2)
+    center_x = int(left + middle_x)
+    # compute the y center of the region
+    middle_y = int((bottom - top)/2)
+    center_y = int(top + middle_y)
+
+    # extract the region from the frame, the crop is square so its size only
+    # depends on the width
+    region_img = frame[
+        max(int(center_y-middle_x*scale), 0):int(center_y+middle_x*scale),
+        max(int(center_x-middle_x*scale), 0):int(center_x+middle_x*scale),
+        ...
+    ]
+
+    return cv2.resize(region_img, (crop, crop))
@@ -5,8 +5,16 @@ import cv2
 import numpy as np
 
 from .eyeextract import EyeExtractor
-from .faceextract import FaceExtractor
-from .opticalflow import OpticalFlow
+from .faceboxes import FaceBoxes
+from .faceextract import FaceExtractor, crop_face
+from .facetrack import FaceTracker
+from .framebuffer import FrameBuffer
+from .frameindex import FrameIndex
+from .landmarks import FaceLandmarks
+from .models import shared_model
+from .opticalflow import FLOW_BACKENDS, FLOW_FORMATS, OpticalFlow, flow_shape, parallel_optical_flow
+from .pipeline import FramePipeline
+from .regions import REGIONS, crop_region
 
 class VideoHandler:
     """
@@ -15,6 +23,9 @@ class VideoHandler:
 
     It keeps a reference to the video which can be accessed when needed
 
+    The face detection and facial landmark models are only loaded once a method
+    needs them, and are shared by all the handlers of a process
+
     Methods:
         set_video(video_path)
             opens a new video
@@ -26,31 +37,178 @@ class VideoHandler:
             frames
         get_eye_frames(start, end, crop)
             retrieves the frames between two timestamps, cropped to the right
-            eye, and computes the optical flow between consecutive
-            frames
+            eye
+        get_region_frames(start, end, crop, region)
+            retrieves the frames between two timestamps, cropped to a region
+            of the face given by the facial landmarks, see regions.REGIONS
+        get_landmarks(start, end)
+            returns the facial landmarks of the frames between two timestamps
+        get_interval_frames(intervals, crop, method)
+            retrieves the frames for multiple intervals in a single decoding
+            pass over the video
+        write_interval_frames(intervals, crop, methods, outputs)
+            processes multiple intervals with one or more methods in a single
+            decoding pass and appends the frames to an output per interval and
+            method
+        iter_frames(start, end, method, crop, chunk, offset)
+            generator that yields the frames between two timestamps in chunks
+            of a fixed size
+        count_frames(start, end, offset)
+            returns the number of frames between two timestamps that are
+            extracted
+        frame_shape(method, crop)
+            returns the shape of a single frame for a processing method
+        frame_dtype(method)
+            returns the data type of the frames of a processing method
+        get_pipeline_stats()
+            returns the queue depths and stall times of the last pipelined run
+        get_tracking_stats()
+            returns the number of frames and face detections if the face is
+            tracked
     """
 
 
 
-    def __init__(self, video_path: str):
+    def __init__(self, video_path: str, pipeline_threads: int = 0, queue_size: int = 32, batch_size: int = 1,
+                 detect_interval: int = 1, drift_threshold: float = 8.0, cache_faces: bool = False,
+                 detector: str = 'ssd', eye_from_face: bool = False, cache_landmarks: bool = False,
+                 flow_backend: str = 'farneback', flow_options: dict = None, flow_format: str = 'image',
+                 flow_workers: int = 1, frame_step: int = 1, target_fps: float = None):
         """
         Parameters:
             video_path (str): path to the video file recorded in the experiment
+            pipeline_threads (int): if larger than 0, the video is decoded in
+                its own thread while this many threads extract the faces and
+                eyes from the decoded frames
+                default: 0 (decoding and extraction run one after the other)
+            queue_size (int): maximum number of decoded frames waiting for the
+                extraction threads if pipeline_threads is set. With a batch
+                size larger than 1 it is the number of batches
+                default: 32
+            batch_size (int): number of frames the face detection network is
+                run on in a single forward pass
+                default: 1
+            detect_interval (int): if larger than 1, the face is detected only
+                in every detect_interval-th extracted frame and tracked in
+                between, also across the frame step, see FaceTracker. The face
+                is tracked in the order of the frames, so it can't be combined
+                with more than one pipeline thread
+                default: 1 (the face is detected in every frame)
+            drift_threshold (float): mean grey value difference inside the face
+                box between two frames, above which a tracked face is detected
+                again
+                default: 8.0
+            cache_faces (bool): if set, the bounding box of the face in every
+                processed frame is stored next to the video, see FaceBoxes.
+                Frames whose box is known are only cropped, without running the
+                face detection again
+                default: False
+            detector (str): the face detection backend, one of the keys of
+                facedetect.DETECTORS
+                default: 'ssd'
+            eye_from_face (bool): if set, the facial landmarks for the eye and
+                the other regions are searched within the box found by the face
+                detection backend, instead of running dlib's face detector on
+                the whole frame. It is a lot faster and uses the stored and
+                tracked boxes, but the crops can differ slightly, see
+                EyeExtractor
+                default: False (as before)
+            cache_landmarks (bool): if set, the facial landmarks of every
+                processed frame are stored next to the video, see
+                FaceLandmarks. The regions of frames whose landmarks are known
+                are only cropped, without searching the face and landmarks
+                again
+                default: False
+            flow_backend (str): the optical flow backend, one of the keys of
+                opticalflow.FLOW_BACKENDS
+                default: 'farneback'
+            flow_options (dict): the parameters of Farneback's algorithm and
+                whether the previous flow is the initial guess, see OpticalFlow
+                default: None (the parameters used so far)
+            flow_format (str): the format of the optical flow frames, one of
+                the keys of opticalflow.FLOW_FORMATS. 'image' are the rgb
+                images, 'float16' and 'int8' the raw flow fields with an x and
+                y channel, see OpticalFlow
+                default: 'image'
+            flow_workers (int): if larger than 1, get_interval_frames and the
+                methods based on it extract the faces first and compute the
+                optical flow between them in this many worker processes, see
+                opticalflow.parallel_optical_flow. write_interval_frames
+                hands every frame on as soon as it is processed, so it always
+                computes the flow frame by frame and ignores this option
+                default: 1 (the flow is computed frame by frame)
+            frame_step (int): if larger than 1, only every frame_step-th frame
+                of an interval is extracted. The frames in between are grabbed
+                but neither decoded into an image nor searched for a face. An
+                interval can be given with an offset of its first frame, see
+                get_interval_frames. The optical flow is computed between the
+                extracted frames
+                default: 1 (every frame is extracted)
+            target_fps (float): if given, the frame step is chosen such that
+                about this many frames per second of the video are extracted,
+                instead of frame_step, see resolve_frame_step
+                default: None
         """
+        assert batch_size > 0
+        assert detect_interval > 0
+        assert detect_interval == 1 or pipeline_threads <= 1
+        assert flow_backend in FLOW_BACKENDS
+        assert flow_format in FLOW_FORMATS
+        assert flow_workers > 0
+        assert frame_step > 0
+        assert target_fps is None or target_fps > 0
+
         # store the creating time which is the starting time of the video
         self.__video_start = self.__read_timestamp_from_filename(os.path.basename(video_path))
 
         # video capture stream
         self.__cap = cv2.VideoCapture(video_path)
-
-        # eye extraction
-        self.__ee = EyeExtractor()
-
-        # face extraction
-        self.__fe = FaceExtractor()
-
-        # optical flow module
-        self.__of = OpticalFlow()
+        self.__video_path = video_path
+
+        # index of the frame timestamps, built when it is first needed
+        self.__index = None
+
+        # the face and eye extractors are loaded when they are first needed
+        # and shared with the other handlers of the process, see shared_model.
+        # Only the face tracker belongs to this handler, since it follows the
+        # face through this video
+        self.__detector        = detector
+        self.__detect_interval = detect_interval
+        self.__drift_threshold = drift_threshold
+        self.__tracker         = None
+
+        # the stored face boxes of the video, loaded when they are first needed,
+        # and the detector they are stored for
+        self.__cache_faces = cache_faces
+        self.__boxes       = None
+        self.__boxes_key   = detector if detect_interval == 1 \
+            else '{} tracked interval={} drift={}'.format(detector, detect_interval, drift_threshold)
+
+        # whether the eye is searched in the box of the face detection
+        self.__eye_from_face = eye_from_face
+
+        # the stored facial landmarks of the video, loaded when they are first
+        # needed
+        self.__cache_landmarks = cache_landmarks
+        self.__landmarks       = None
+
+        # the optical flow modules are created for every range, since they
+        # keep the flow of the previous pair
+        self.__flow_backend = flow_backend
+        self.__flow_options = flow_options or {}
+        self.__flow_format  = flow_format
+        self.__flow_workers = flow_workers
+
+        # only every frame_step-th frame of an interval is extracted, with a
+        # target frame rate the step depends on the video
+        self.__frame_rate = (frame_step, target_fps)
+        self.__frame_step = resolve_frame_step(video_path, *self.__frame_rate)
+
+        # every extraction thread of the pipeline needs its own extractors,
+        # since the detection models are not thread safe
+        self.__pipeline   = FramePipeline(queue_size) if pipeline_threads > 0 else None
+        self.__batch_size = batch_size
+        self.__threads    = max(pipeline_threads, 1)
 
 
 
@@ -66,6 +224,16 @@ class VideoHandler:
             self.__cap.release()
         # open the new video
         self.__cap.open(video_path)
+        self.__video_path  = video_path
+        self.__video_start = self.__read_timestamp_from_filename(os.path.basename(video_path))
+        self.__index       = None
+        self.__boxes       = None
+        self.__landmarks   = None
+        self.__frame_step  = resolve_frame_step(video_path, *self.__frame_rate)
+
+        # the tracked face belongs to the old video, which may have had
+        # another frame step
+        self.__tracker     = None
 
 
 
@@ -88,49 +256,60 @@ class VideoHandler:
             ndarray: numpy array of the shape (frames, crop, crop)
         """
 
-        # calculate the timestamps for the boundaries
-        start_timestamp = ((start - self.__video_start).total_seconds() * 1000)
-        end_timestamp   = ((end   - self.__video_start).total_seconds() * 1000)
+        return self.get_interval_frames([(start, end)], crop, 'face')[0]
 
 
-        # get the framenumber for the last timestamp
-        self.__cap.set(cv2.CAP_PROP_POS_MSEC, end_timestamp)
-        end_frame = self.__cap.get(cv2.CAP_PROP_POS_FRAMES)
 
+    def get_optical_flow_frames(self, start: datetime, end: datetime, crop: int):
+        """Returns the frames cropped to the face but as optical flow images
 
-        # set the video to the beginning and get the frame number
-        self.__cap.set(cv2.CAP_PROP_POS_MSEC, start_timestamp)
-        frame_pos = self.__cap.get(cv2.CAP_PROP_POS_FRAMES)
+        Optical flow images encode the information about what has changed between
+        two frames with color and intensity using the HSV color space.
 
-        # numpy array of frames
-        frames = np.zeros([1,crop,crop], dtype=np.uint8)
+        Parameters:
+            start (datetime):
+                start timestamp
+            end (datetime):
+                end timestamp
+            crop (int):
+                size the face image should be cropped to (squared)
 
-        # iterate over all the frames
-        while(frame_pos <= end_frame):
-            success, frame = self.__cap.read()
-            # if the frame could be read
-            if(success):
-                found, face = self.__fe.extractFace(frame, crop)
-                # if a face was found
-                if(found):
-                    # convert the frame to grayscale
-                    face = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY).astype(np.uint8)
-                    # add it to all the frames
-                    frames = np.concatenate((frames, np.expand_dims(face, axis=0)), axis=0)
-                    # increment the frame number
+        Returns:
+            ndarray: numpy array of the shape (frames, crop, crop, 3)
+        """
 
-            frame_pos = frame_pos+1
+        return self.get_interval_frames([(start, end)], crop, 'opticalflow')[0]
 
-        # return all the frames minus the first 0 frame
-        return frames[1:,...]
 
+    def get_eye_frames(self, start: datetime, end: datetime, crop: int):
+        """Returns the frames cropped to the eye between two timestamps
 
+        Given the start timestamp and end timestamp as datetime objects, this
+        method will return a numpy array with all the frames inbetween, cropped
+        to the eye
 
-    def get_optical_flow_frames(self, start: datetime, end: datetime, crop: int):
-        """Returns the frames cropped to the face but as optical flow images
+        Parameters:
+            start (datetime):
+                start timestamp
+            end (datetime):
+                end timestamp
+            crop (int):
+                size the face image should be cropped to (squared)
+
+        Returns:
+            ndarray: numpy array of the shape (frames, crop, crop)
+        """
+
+        return self.get_interval_frames([(start, end)], crop, 'eye')[0]
 
-        Optical flow images encode the information about what has changed between
-        two frames with color and intensity using the HSV color space.
+
+
+    def get_region_frames(self, start: datetime, end: datetime, crop: int, region: str):
+        """Returns the frames cropped to a region of the face between two
+        timestamps
+
+        The region is cropped from the facial landmarks, like the eye in
+        get_eye_frames, which is the region 'eye'
 
         Parameters:
             start (datetime):
@@ -138,83 +317,828 @@ class VideoHandler:
             end (datetime):
                 end timestamp
             crop (int):
-                size the face image should be cropped to (squared)
+                size the region image should be cropped to (squared)
+            region (str):
+                name of the region, one of the keys of regions.REGIONS
 
         Returns:
-            ndarray: numpy array of the shape (frames, crop, crop, 3)
+            ndarray: numpy array of the shape (frames, crop, crop)
         """
 
-        # compute the grayscale frames for the given timespan
-        facial_frames = self.get_frames(start, end, crop)
+        return self.get_interval_frames([(start, end)], crop, region)[0]
 
-        # optical flow frames
-        of_frames = np.zeros([1, crop, crop, 3], dtype=np.uint8)
 
-        for i in range(1, len(facial_frames)):
-            # get the two frames to compute the optical flow for
-            prev = facial_frames[i-1]
-            curr = facial_frames[i]
 
-            # compute the optical flow image between the frames
-            of_image = self.__of.optical_flow(prev, curr)
+    def get_landmarks(self, start: datetime, end: datetime):
+        """Returns the facial landmarks of the frames between two timestamps
 
-            # add the frames to the matrix
-            of_frames = np.concatenate((of_frames, np.expand_dims(of_image, axis=0)), axis=0)
+        The landmarks are the ones the eye is cropped with. If they are stored,
+        see cache_landmarks, the video isn't decoded at all. Otherwise the
+        frames are searched for the landmarks, which are stored if
+        cache_landmarks is set.
 
+        Parameters:
+            start (datetime):
+                start timestamp
+            end (datetime):
+                end timestamp
 
-        return of_frames[1:,...]
+        Returns:
+            ndarray, ndarray: the timestamps of the frames with a face in
+                microseconds of the video, of the shape (frames,), and their
+                landmarks of the shape (frames, 68, 2) as int16
+        """
 
+        first, last = self.__frame_range(start, end)
 
-    def get_eye_frames(self, start: datetime, end: datetime, crop: int):
-        """Returns the frames cropped to the eye between two timestamps
+        if self.__cache_landmarks:
+            records = self.__landmark_store().records(first, last)[::self.__frame_step]
+            # all the frames were searched before
+            if (records['found'] >= 0).all():
+                found = records[records['found'] == 1]
+                return found['timestamp'].copy(), found['landmarks'].copy()
 
-        Given the start timestamp and end timestamp as datetime objects, this
-        method will return a numpy array with all the frames inbetween, cropped
-        to the eye
+        count      = self.count_frames(start, end)
+        positions  = FrameBuffer(count, (), np.int64)
+        landmarks  = FrameBuffer(count, (FaceLandmarks.POINTS, 2), np.int16)
+
+        for frame_pos, _, _, _, points in self.__process([(first, last)], [], ['landmarks']):
+            positions.append(frame_pos)
+            landmarks.append(points)
+
+        return self.__index.timestamps()[positions.data()], landmarks.data()
+
+
+
+    def get_interval_frames(self, intervals: list, crop: int, method: str):
+        """Returns the processed frames for multiple intervals in a single pass
+
+        The intervals are sorted by their starting time and the video is decoded
+        once from front to back. Every decoded frame is handed to all the
+        intervals it belongs to. Frames that are not part of any interval are
+        only grabbed and never converted to an image.
+
+        With more than one flow worker, the optical flow is computed in
+        parallel once the faces of all intervals were extracted.
+
+        Parameters:
+            intervals (list):
+                list of (start, end) tuples of datetime objects. If only every
+                frame_step-th frame is extracted, an interval can be given as
+                (start, end, offset), where the first extracted frame is offset
+                frames after the start, e.g. to extract the phases 0 to
+                frame_step-1 of a subsampled time series
+            crop (int):
+                size the images should be cropped to (squared)
+            method (str):
+                one of 'face', 'opticalflow' or a region of regions.REGIONS
+                like 'eye'
+
+        Returns:
+            list: one ndarray per interval, in the order the intervals were
+                given. The arrays have the same shape as the ones returned by
+                get_frames, get_eye_frames and get_optical_flow_frames
+        """
+
+        # the optical flow of the faces of all intervals is computed at once
+        if method == 'opticalflow' and self.__flow_workers > 1:
+            return parallel_optical_flow(
+                self.get_interval_frames(intervals, crop, 'face'),
+                self.__flow_workers, self.__flow_backend, self.__flow_format, **self.__flow_options
+            )
+
+        # frame numbers of the boundaries of every interval
+        ranges = [self.__frame_range(*interval) for interval in intervals]
+
+        # buffer of frames for every interval, sized to its frame range
+        buffers = [
+            FrameBuffer(-(-(last-first+1) // self.__frame_step), self.frame_shape(method, crop), self.frame_dtype(method))
+            for first, last in ranges
+        ]
+
+        for _, i, _, _, image in self.__process(ranges, [crop], [method]):
+            buffers[i].append(image)
+
+        return [buffer.data() for buffer in buffers]
+
+
+
+    def write_interval_frames(self, intervals: list, crop, methods: list, outputs: list, on_complete = None):
+        """Processes multiple intervals in a single pass and hands the frames on
+
+        Works like get_interval_frames, but instead of collecting the frames in
+        memory every frame is appended to the output of its interval as soon
+        as it is processed. That way the memory usage does not depend on the
+        length of the intervals.
+
+        Multiple methods can be processed at once. Every frame is decoded once,
+        the face and the facial landmarks are found at most once, all regions
+        are cropped from the same landmarks and the optical flow is computed
+        from the face images that were already extracted.
+
+        Multiple crop sizes can be written at once as well. Every size is
+        cropped from the same face box and landmarks of a frame, so the
+        resolutions of an interval show exactly the same frames.
+
+        The optical flow is computed frame by frame, flow_workers has no effect
+        here, see parallel_optical_flow for the flow of finished face files.
+
+        Parameters:
+            intervals (list):
+                list of (start, end) or (start, end, offset) tuples of datetime
+                objects and the offset, see get_interval_frames
+            crop (int or list):
+                size the images should be cropped to (squared), or a list of
+                sizes that are all cropped from every frame
+            methods (list):
+                list of methods, each one of 'face', 'opticalflow' or a region
+                of regions.REGIONS like 'eye'
+            outputs (list):
+                one dictionary per interval, that maps every method to its
+                output, for example a NpyWriter or a FrameBuffer. The output
+                must offer an append(frame) method that copies the frame, the
+                optical flow images are reused buffers. If crop is a list, the
+                keys are (method, crop) tuples instead. Methods that are missing
+                in the dictionary of an interval are not written for it
+            on_complete (callable, optional):
+                called with the index of an interval as soon as all of its
+                frames were handed to its outputs, which is before the whole
+                video is processed
+        """
+
+        assert len(intervals) == len(outputs)
+
+        # a single crop size keys the outputs by the method only
+        crops  = [crop] if isinstance(crop, int) else list(crop)
+        ranges = [self.__frame_range(*interval) for interval in intervals]
+
+        # intervals in the order they are completed
+        completion = sorted(range(len(ranges)), key=lambda i: ranges[i][1])
+        completed  = 0
+
+        for frame_pos, i, method, size, image in self.__process(ranges, crops, methods):
+            # all the intervals that ended before this frame are complete
+            while completed < len(completion) and ranges[completion[completed]][1] < frame_pos:
+                if on_complete is not None:
+                    on_complete(completion[completed])
+                completed += 1
+
+            key = method if isinstance(crop, int) else (method, size)
+            if key in outputs[i]:
+                outputs[i][key].append(image)
+
+        # the remaining intervals are complete once the video is processed
+        for i in completion[completed:]:
+            if on_complete is not None:
+                on_complete(i)
+
+
+
+    def iter_frames(self, start: datetime, end: datetime, method: str, crop: int, chunk: int = 256, offset: int = 0):
+        """Generator that yields the frames between two timestamps in chunks
+
+        Instead of returning all the frames at once, the frames are yielded in
+        chunks of a fixed size as soon as they are processed, such that only a
+        single chunk is held in memory at a time
 
         Parameters:
             start (datetime):
                 start timestamp
             end (datetime):
                 end timestamp
+            method (str):
+                one of 'face', 'opticalflow' or a region of regions.REGIONS
             crop (int):
-                size the face image should be cropped to (squared)
+                size the images should be cropped to (squared)
+            chunk (int):
+                number of frames per chunk
+                default: 256
+            offset (int):
+                offset of the first extracted frame if only every frame_step-th
+                frame is extracted, see get_interval_frames
+                default: 0
+
+        Yields:
+            ndarray: numpy array of the shape (chunk, crop, crop) or of the
+                frame shape of optical flow, see frame_shape. The last chunk holds
+                the remaining frames and can be shorter
+        """
+
+        assert chunk > 0
+
+        shape  = self.frame_shape(method, crop)
+        dtype  = self.frame_dtype(method)
+        frames = np.empty([chunk, *shape], dtype=dtype)
+        count  = 0
+
+        for _, _, _, _, image in self.__process([self.__frame_range(start, end, offset)], [crop], [method]):
+            frames[count] = image
+            count += 1
+            # hand on the full chunk and start a new one
+            if count == chunk:
+                yield frames
+                frames = np.empty([chunk, *shape], dtype=dtype)
+                count  = 0
+
+        # remaining frames
+        if count > 0:
+            yield frames[:count]
+
+
+
+    def count_frames(self, start: datetime, end: datetime, offset: int = 0):
+        """Returns the number of frames of the video between two timestamps
+
+        This is the upper bound of the number of frames any method returns for
+        the interval, since frames without a face or eye are dropped. If only
+        every frame_step-th frame is extracted, only those are counted
+
+        Parameters:
+            start (datetime):
+                start timestamp
+            end (datetime):
+                end timestamp
+            offset (int):
+                offset of the first extracted frame, see get_interval_frames
+                default: 0
 
         Returns:
-            ndarray: numpy array of the shape (frames, crop, crop)
+            int: number of frames in the interval
+        """
+
+        first, last = self.__frame_range(start, end, offset)
+
+        return max(-(-(last - first + 1) // self.__frame_step), 0)
+
+
+
+    def frame_shape(self, method: str, crop: int):
+        """Returns the shape of a single frame produced by a method
+
+        Parameters:
+            method (str):
+                one of 'face', 'opticalflow' or a region of regions.REGIONS
+            crop (int):
+                size the images are cropped to (squared)
+
+        Returns:
+            tuple: (crop, crop, 3) for optical flow images, (crop, crop, 2) for
+                optical flow fields, (crop, crop) otherwise
+        """
+
+        return flow_shape((crop, crop), self.__flow_format) if method == 'opticalflow' else (crop, crop)
+
+
+
+    def frame_dtype(self, method: str):
+        """Returns the data type of the frames produced by a method
+
+        Parameters:
+            method (str):
+                one of 'face', 'opticalflow' or a region of regions.REGIONS
+
+        Returns:
+            type: the data type of the flow format for optical flow, uint8
+                otherwise
+        """
+
+        return FLOW_FORMATS[self.__flow_format] if method == 'opticalflow' else np.uint8
+
+
+
+    def get_pipeline_stats(self):
+        """Returns statistics about the last run of the decoding pipeline
+
+        They can be used to tune the number of threads and the queue size. If
+        the decoder stalls a lot, the extraction threads can't keep up. If the
+        extraction threads stall a lot, decoding is the bottleneck.
+
+        Returns:
+            dict: the statistics returned by FramePipeline.stats, or None if the
+                handler doesn't use a pipeline
+        """
+
+        return self.__pipeline.stats() if self.__pipeline is not None else None
+
+
+
+    def get_tracking_stats(self):
+        """Returns how often the face was detected while it was tracked
+
+        Returns:
+            dict: the statistics returned by FaceTracker.stats since the video
+                was opened, or None if the face is detected in every frame
+        """
+
+        if self.__detect_interval == 1:
+            return None
+
+        return self.__tracker.stats() if self.__tracker is not None else {'frames': 0, 'detections': 0}
+
+
+
+    def __frame_range(self, start: datetime, end: datetime, offset: int = 0):
+        """Computes the frame numbers of the first and last frame of an interval
+
+        The boundaries are looked up in the frame index of the video with a
+        binary search over the timestamps of the frames, without seeking the
+        video. The index is built on the first call if it doesn't exist yet
+
+        Parameters:
+            start (datetime):
+                start timestamp
+            end (datetime):
+                end timestamp
+            offset (int):
+                number of frames the first extracted frame comes after the start
+                of the interval, less than the frame step
+                default: 0
+
+        Returns:
+            int, int: frame number of the first and the last frame (inclusive)
         """
 
         # calculate the timestamps for the boundaries
         start_timestamp = ((start - self.__video_start).total_seconds() * 1000)
         end_timestamp   = ((end   - self.__video_start).total_seconds() * 1000)
 
+        assert 0 <= offset < self.__frame_step
+
+        if self.__index is None:
+            self.__index = FrameIndex(self.__video_path)
+
+        return \
+            self.__index.frame_number(start_timestamp) + offset,\
+            self.__index.frame_number(end_timestamp)
 
-        # get the framenumber for the last timestamp
-        self.__cap.set(cv2.CAP_PROP_POS_MSEC, end_timestamp)
-        end_frame = self.__cap.get(cv2.CAP_PROP_POS_FRAMES)
 
 
-        # set the video to the beginning and get the frame number
-        self.__cap.set(cv2.CAP_PROP_POS_MSEC, start_timestamp)
-        frame_pos = self.__cap.get(cv2.CAP_PROP_POS_FRAMES)
+    def __decode(self, ranges: list):
+        """Decodes the video once over all the given frame ranges
 
-        # numpy array of frames
-        frames = np.zeros([1,crop,crop], dtype=np.uint8)
+        Generator that yields every frame that lies within at least one of the
+        ranges together with the indices of the ranges it belongs to. Frames in
+        between the ranges are grabbed but not decoded into an image. If only
+        every frame_step-th frame is extracted, a frame belongs to a range if
+        it is a multiple of the step after the first frame of the range, the
+        other frames are grabbed as well.
+
+        Parameters:
+            ranges (list):
+                list of (first, last) frame number tuples (inclusive)
+
+        Yields:
+            int, list, ndarray: the frame number, the indices of the ranges the
+                frame belongs to and the frame itself
+        """
+
+        if not ranges:
+            return
+
+        # ranges sorted by their first frame
+        order = sorted(range(len(ranges)), key=lambda i: ranges[i])
+        first = ranges[order[0]][0]
+        last  = max(end for _, end in ranges)
+
+        # set the video to the first frame needed
+        self.__seek(first)
+
+        # ranges the current frame belongs to
+        active   = []
+        upcoming = 0
+
+        for frame_pos in range(first, last+1):
+            # add the ranges that start at this frame
+            while upcoming < len(order) and ranges[order[upcoming]][0] <= frame_pos:
+                active.append(order[upcoming])
+                upcoming += 1
+            # drop the ranges that ended before this frame
+            active = [i for i in active if ranges[i][1] >= frame_pos]
+
+            # the ranges that extract this frame
+            members = active if self.__frame_step == 1 \
+                else [i for i in active if (frame_pos - ranges[i][0]) % self.__frame_step == 0]
+
+            # frame is not needed, skip it without decoding the image
+            if not members:
+                self.__cap.grab()
+                continue
 
-        # iterate over all the frames
-        while(frame_pos <= end_frame):
             success, frame = self.__cap.read()
             # if the frame could be read
             if(success):
-                # found, eye = self.__ee.get_eye(frame, 64)
-                found, eye = self.__ee.extractEye(frame, 64)
-                if(found):
-                    eye = cv2.cvtColor(eye, cv2.COLOR_BGR2GRAY).astype(np.uint8)
-                    frames = np.concatenate((frames, np.expand_dims(eye, axis=0)), axis=0)
+                yield frame_pos, members, frame
+
+
+
+    def __seek(self, frame_pos: int):
+        """Sets the video to a frame, such that the next grab returns it
+
+        Setting CAP_PROP_POS_FRAMES converts the frame number to a timestamp
+        with the nominal frame rate, so with a variable frame rate the video can
+        end up at another frame. The frame before the target is grabbed and
+        identified by its timestamp in the FrameIndex. If the video ended up
+        before the target it is grabbed forward, if it ended up after it or at
+        an unknown position, it is set further back and tried again, down to
+        opening the video again at its start.
+
+        Parameters:
+            frame_pos (int):
+                the number of the frame the next grab returns
+        """
+
+        if self.__index is None:
+            self.__index = FrameIndex(self.__video_path)
+        timestamps = self.__index.timestamps()
+
+        back = 1
+        while True:
+            target = max(frame_pos - back, 0)
+
+            # a newly opened video is at its first frame for sure
+            if target == 0:
+                self.__cap.release()
+                self.__cap = cv2.VideoCapture(self.__video_path)
+                position   = -1
+                break
+
+            self.__cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+
+            # the frame number of the grabbed frame, by its timestamp
+            if self.__cap.grab():
+                usec     = int(round(self.__cap.get(cv2.CAP_PROP_POS_MSEC) * 1000))
+                position = int(np.searchsorted(timestamps, usec))
+                if position < len(timestamps) and timestamps[position] == usec and position < frame_pos:
+                    break
+
+            back *= 2
+
+        # grab the frames up to the one before the target
+        for _ in range(frame_pos - 1 - position):
+            self.__cap.grab()
+
+
+
+    def __process(self, ranges: list, crops: list, methods: list):
+        """Processes the frames of multiple frame ranges in a single pass
+
+        Generator that decodes the frames of all the ranges and yields the
+        processed images of every method for every range a frame belongs to.
+        The face and the facial landmarks are found at most once per frame and
+        the optical flow is computed between consecutive face images of each
+        range.
+
+        Parameters:
+            ranges (list):
+                list of (first, last) frame number tuples (inclusive)
+            crops (list):
+                the sizes the images should be cropped to (squared), every
+                image is yielded once per size
+            methods (list):
+                list of methods, each one of 'face', 'opticalflow', a region of
+                regions.REGIONS or 'landmarks' for the (68, 2) facial landmarks
+                the regions are cropped from
+
+        Yields:
+            int, int, str, int, ndarray: the frame number, the index of the
+                range, the method, the crop size, which is None for the
+                landmarks, and the processed image. The optical flow images are
+                buffers that are overwritten by the next frame of the range, so
+                they have to be copied
+        """
+
+        # last face image and optical flow module of every range and crop size
+        previous = [{} for _ in ranges]
+        flows    = [{} for _ in ranges]
+
+        if self.__cache_faces and self.__boxes is None:
+            self.__boxes = FaceBoxes(self.__video_path, self.__boxes_key)
+        if self.__cache_landmarks:
+            self.__landmark_store()
+
+        # extract the faces and eyes of every batch of frames, either right
+        # after decoding it or concurrently in the extraction threads of the
+        # pipeline
+        batches = self.__batch(self.__decode(ranges))
+        if self.__pipeline is None:
+            extracted = (
+                item
+                for batch in batches
+                for item in self.__extract(0, batch, crops, methods)
+            )
+        else:
+            extracted = (
+                item
+                for results in self.__pipeline.run(
+                    batches,
+                    [
+                        lambda batch, thread=thread: self.__extract(thread, batch, crops, methods)
+                        for thread in range(self.__threads)
+                    ]
+                )
+                for item in results
+            )
+
+        for frame_pos, members, found_face, faces, landmarks, regions in extracted:
+            for i in members:
+                # frames without a face or eye are dropped
+                if found_face:
+                    for size, face in faces.items():
+                        if 'face' in methods:
+                            yield frame_pos, i, 'face', size, face
+                        if 'opticalflow' in methods:
+                            # the first face of a range has no predecessor
+                            if size in previous[i]:
+                                if size not in flows[i]:
+                                    flows[i][size] = self.__optical_flow()
+                                yield frame_pos, i, 'opticalflow', size, flows[i][size].optical_flow(previous[i][size], face)
+                            previous[i][size] = face
+                if landmarks is not None:
+                    for region, images in regions.items():
+                        for size, image in images.items():
+                            yield frame_pos, i, region, size, image
+                    if 'landmarks' in methods:
+                        yield frame_pos, i, 'landmarks', None, landmarks
+
+        # store the boxes and landmarks of the newly searched faces
+        if self.__boxes is not None:
+            self.__boxes.save()
+        if self.__landmarks is not None:
+            self.__landmarks.save()
+
+
+
+    def __batch(self, decoded):
+        """Groups the decoded frames into batches of the batch size
+
+        Parameters:
+            decoded (iterable):
+                the (frame number, ranges, frame) tuples returned by __decode
+
+        Yields:
+            list: up to batch size of the decoded tuples
+        """
+
+        batch = []
+        for item in decoded:
+            batch.append(item)
+            if len(batch) == self.__batch_size:
+                yield batch
+                batch = []
+
+        # the last batch may be smaller
+        if batch:
+            yield batch
+
+
+
+    def __face_extractor(self, thread: int):
+        """Returns the face extractor of an extraction thread
+
+        Parameters:
+            thread (int):
+                index of the extraction thread
+
+        Returns:
+            FaceExtractor: the shared face extractor of the thread, or the
+                FaceTracker of this handler if the face is tracked
+        """
+
+        extractor = shared_model(('face', self.__detector, thread), lambda: FaceExtractor(self.__detector))
+
+        if self.__detect_interval == 1:
+            return extractor
+
+        if self.__tracker is None:
+            self.__tracker = FaceTracker(extractor, self.__detect_interval, self.__drift_threshold, self.__frame_step)
+
+        return self.__tracker
+
+
+
+    def __eye_extractor(self, thread: int):
+        """Returns the eye extractor of an extraction thread
+
+        Parameters:
+            thread (int):
+                index of the extraction thread
+
+        Returns:
+            EyeExtractor: the shared eye extractor of the thread
+        """
+
+        return shared_model(('eye', thread), EyeExtractor)
+
+
+
+    def __optical_flow(self):
+        """Creates an optical flow module for a sequence of frames
+
+        Returns:
+            OpticalFlow: the optical flow module with the backend and options of
+                the handler
+        """
+
+        return OpticalFlow(self.__flow_backend, output=self.__flow_format, **self.__flow_options)
+
+
+
+    def __landmark_store(self):
+        """Returns the stored landmarks of the video, which are loaded on first
+        use
+
+        Returns:
+            FaceLandmarks: the landmarks of the video
+        """
+
+        if self.__landmarks is None:
+            if self.__index is None:
+                self.__index = FrameIndex(self.__video_path)
+            self.__landmarks = FaceLandmarks(
+                self.__video_path, self.__index.timestamps(),
+                self.__boxes_key if self.__eye_from_face else None
+            )
+
+        return self.__landmarks
+
+
+
+    def __extract(self, thread: int, batch: list, crops: list, methods: list):
+        """Extracts the face and the regions from a batch of frames as needed
+
+        Parameters:
+            thread (int):
+                index of the extraction thread, whose extractors are used
+            batch (list):
+                the (frame number, ranges, frame) tuples of the decoded frames
+            crops (list):
+                the sizes the images should be cropped to (squared)
+            methods (list):
+                the methods the frames are processed with, see __process
+
+        Returns:
+            list: for every frame a tuple of the frame number, the ranges,
+                whether a face was found and a dictionary with the face image of
+                every crop size, the facial landmarks or None if there was no
+                face and a dictionary with the images of every region by crop
+                size
+        """
+
+        # the optical flow is computed on the facial frames
+        faces   = 'face' in methods or 'opticalflow' in methods
+        regions = [method for method in methods if method in REGIONS]
+        marks   = len(regions) > 0 or 'landmarks' in methods
+
+        frames    = [frame for _, _, frame in batch]
+        positions = [frame_pos for frame_pos, _, _ in batch]
+
+        # the stored landmarks, the regions of these frames are only cropped
+        if marks and self.__landmarks is not None:
+            known, landmarks = self.__landmarks.lookup(positions)
+        else:
+            known, landmarks = np.zeros(len(frames), dtype=bool), [None] * len(frames)
+
+        # the boxes of the faces, if they are needed for the faces or the
+        # landmarks
+        boxes = self.__detect_faces(self.__face_extractor(thread), frames, positions) \
+            if faces or (marks and self.__eye_from_face and not known.all()) else None
+
+        found_faces = self.__extract_faces(frames, boxes, crops) if faces \
+            else [(False, None)] * len(frames)
+
+        if marks:
+            self.__find_landmarks(self.__eye_extractor(thread), frames, positions, boxes, known, landmarks)
+        # all the regions and crop sizes are cropped from the same landmarks
+        region_images = [
+            {
+                region: {size: self.__extract_region(frame, points, region, size) for size in crops}
+                for region in regions
+            } if points is not None else {}
+            for frame, points in zip(frames, landmarks)
+        ]
+
+        return [
+            (frame_pos, members, *face, points, images)
+            for (frame_pos, members, _), face, points, images in zip(batch, found_faces, landmarks, region_images)
+        ]
+
+
+
+    def __detect_faces(self, fe: FaceExtractor, frames: list, positions: list):
+        """Finds the faces in a batch of frames, or looks up their stored boxes
+
+        Parameters:
+            fe (FaceExtractor):
+                the face extractor or FaceTracker to use
+            frames (list):
+                the video frames
+            positions (list):
+                the frame numbers of the frames
+
+        Returns:
+            ndarray: one row (x1, y1, x2, y2, confidence) per frame, see
+                FaceExtractor.detect_faces
+        """
+
+        if self.__boxes is None:
+            boxes = fe.detect_faces(frames, positions)
+        else:
+            # only detect the faces in the frames whose box isn't stored yet
+            known, boxes = self.__boxes.lookup(positions)
+            missing = np.flatnonzero(~known)
+            if len(missing) > 0:
+                boxes[missing] = fe.detect_faces([frames[i] for i in missing], [positions[i] for i in missing])
+                self.__boxes.add([positions[i] for i in missing], boxes[missing])
 
-            frame_pos += 1
+        return boxes
 
-        return frames[1:,...]
+
+
+    def __extract_faces(self, frames: list, boxes: np.ndarray, crops: list):
+        """Crops the faces from a batch of frames as grayscale images
+
+        Every crop size is resized from the same box of the face, the image is
+        converted to grayscale after resizing, such that every size is the same
+        as the one of a run with that size only
+
+        Parameters:
+            frames (list):
+                the video frames
+            boxes (np.ndarray):
+                the boxes of the faces returned by __detect_faces
+            crops (list):
+                the sizes the face images should be cropped to (squared)
+
+        Returns:
+            list: for every frame whether a face was found and a dictionary that
+                maps every crop size to the grayscale face image of shape
+                (crop, crop), or None
+        """
+
+        # convert the frames to grayscale if a face was found
+        return [
+            (True, {
+                size: cv2.cvtColor(crop_face(frame, box, size), cv2.COLOR_BGR2GRAY).astype(np.uint8)
+                for size in crops
+            }) if box[4] > 0 else (False, None)
+            for frame, box in zip(frames, boxes)
+        ]
+
+
+
+    def __find_landmarks(self, ee: EyeExtractor, frames: list, positions: list, boxes: np.ndarray, known: np.ndarray, landmarks: list):
+        """Searches the facial landmarks of the frames whose landmarks are not
+        known yet, and stores them if cache_landmarks is set
+
+        Parameters:
+            ee (EyeExtractor):
+                the eye extractor to use
+            frames (list):
+                the video frames
+            positions (list):
+                the frame numbers of the frames
+            boxes (np.ndarray):
+                the boxes of the faces returned by __detect_faces, only used if
+                eye_from_face is set
+            known (np.ndarray):
+                whether the landmarks of every frame are known
+            landmarks (list):
+                the known landmarks of every frame, the missing ones are filled
+                in
+        """
+
+        missing = np.flatnonzero(~known)
+
+        for i in missing:
+            if not self.__eye_from_face:
+                landmarks[i] = ee.find_landmarks(frames[i])
+            # without a face there is no eye to search for
+            elif boxes[i][4] > 0:
+                landmarks[i] = ee.find_landmarks(frames[i], boxes[i])
+
+        if self.__landmarks is not None and len(missing) > 0:
+            self.__landmarks.add([positions[i] for i in missing], [landmarks[i] for i in missing])
+
+
+
+    def __extract_region(self, frame: np.ndarray, landmarks: np.ndarray, region: str, crop: int):
+        """Crops a region of the face from a frame as a grayscale image
+
+        Parameters:
+            frame (np.ndarray):
+                the video frame
+            landmarks (np.ndarray):
+                the facial landmarks of the frame
+            region (str):
+                name of the region, one of the keys of regions.REGIONS
+            crop (int):
+                size the region image should be cropped to (squared)
+
+        Returns:
+            np.ndarray: the grayscale image of the region of shape (crop, crop)
+        """
+
+        return cv2.cvtColor(crop_region(frame, landmarks, region, crop), cv2.COLOR_BGR2GRAY).astype(np.uint8)
 
 
 
@@ -234,3 +1158,31 @@ class VideoHandler:
             os.path.splitext(filename.replace('_', '-'))[0].split('-')
         ]
         return datetime.datetime(*timestamp)
+
+
+
+def resolve_frame_step(video_path: str, frame_step: int = 1, target_fps: float = None):
+    """Returns the step between the frames that are extracted from a video
+
+    Parameters:
+        video_path (str):
+            path to the video file
+        frame_step (int):
+            the step if no target frame rate is given
+            default: 1
+        target_fps (float):
+            number of frames per second that should be extracted. The step is
+            the frame rate of the video divided by it, rounded, and at least 1
+            default: None (frame_step is used)
+
+    Returns:
+        int: only every step-th frame is extracted
+    """
+
+    if target_fps is None:
+        return frame_step
+
+    fps = cv2.VideoCapture(video_path).get(cv2.CAP_PROP_FPS)
+    assert fps > 0, 'the frame rate of {} is unknown'.format(video_path)
+
+    return max(int(round(fps / target_fps)), 1)
@@ -15,12 +15,12 @@ Functions:
     twoclass_CLitW_network()
         Same network architecture as in CLitW_network() but with only two neurons
         on the output layer
-    of_network()
+    of_network(channels)
         A network proposed origially by Peng et al. in 2017 in their work
         "Dual Temporal Scale Convolutional Neural Network for Micro-Expression
         Recognition". It was originally used to classify micro-expressions using
         optical flow images and is adapted by us to perform cognitive load
-        estimation on optical flow images
+        estimation on optical flow images or raw optical flow fields
     score_regression_network()
         The same network porposed by Fridman et al. in 2018 in their work
         "Cognitive Load Estimation in the Wild", but adapted for score regression.
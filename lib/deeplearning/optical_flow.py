@@ -6,7 +6,7 @@ from keras.layers import Dense
 
 from keras import optimizers
 
-def of_network():
+def of_network(channels: int = 3):
     """The neural network as proposed in 'Dual Temporal Scale Convolutional
     Neural Network for Micro-Expression Recognition' by Peng et al.
 
@@ -14,7 +14,13 @@ def of_network():
     CASME I and CASME II but we try to adapt it to Cognitive Load Estimation
     from facial movement.
 
-    Input layer has the shape batch_sizex64x128x128x3
+    Input layer has the shape batch_sizex64x128x128x3 for optical flow images or
+    batch_sizex64x128x128x2 for the raw optical flow fields
+
+    Parameters:
+        channels (int): number of channels of the input, 3 for the rgb optical
+            flow images, 2 for the x and y channel of optical flow fields
+            default: 3
 
     Returns:
         keras model: the model object storing the information about the network
@@ -24,7 +30,7 @@ def of_network():
     model = Sequential()
 
     model.add(ZeroPadding3D(padding=(2, 1, 1)))
-    model.add(Conv3D(16, kernel_size=(8,3,3), activation='relu', strides=(4,2,2), input_shape=(64,128,128,3)))
+    model.add(Conv3D(16, kernel_size=(8,3,3), activation='relu', strides=(4,2,2), input_shape=(64,128,128,channels)))
 
     model.add(MaxPooling3D(pool_size=(1, 2, 2), strides=(1,2,2)))
 
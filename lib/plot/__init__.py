@@ -23,6 +23,9 @@ Functions:
     barchart(labels, data, data_label, y_label):
         plots grouped barcharts for different datasets that contain values for
         a multi-user basis. One group per user with one bar per dataset
+    flow_plot(frames, columns, step):
+        plots optical flow images or raw optical flow fields in a grid, the
+        fields are rendered as rgb images only for the plotted frames
     score_heatmap(scores):
         plots a heatmap defined by scores. Can be used to plot the number of times
         a certain score was achieved for which difficulty of the n-back task
@@ -32,6 +35,7 @@ from .axisplot import loss_axisplot
 from .axisplot import accuracy_axisplot
 from .axisplot import acc_distribution_plot
 from .barchart import barchart
+from .flowplot import flow_plot
 from .heatmap import score_heatmap
 
 from .resultshandler import ResultsHandler
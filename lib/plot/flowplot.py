@@ -0,0 +1,46 @@
+import math
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def flow_plot(frames: np.ndarray, columns: int = 8, step: int = 1):
+    """ Plots optical flow frames as rgb images in a grid
+
+    The frames can be optical flow images or the raw optical flow fields stored
+    as float16 or int8. Fields are rendered as images only here, frame by frame,
+    such that a memory mapped .npy file is only read for the frames that are
+    plotted
+
+    This function used matplotlib and sets the state for the pyplot object.
+    This means this function has side-effects
+
+    frames (np.ndarray):
+        optical flow frames of the shape (n, height, width, 3) for images or
+        (n, height, width, 2) for flow fields
+    columns (int):
+        number of frames per row
+        default: 8
+    step (int):
+        only every step-th frame is plotted
+        default: 1
+    """
+
+    # only needed to render the flow fields
+    from ..dataprocessing.opticalflow import flow_image
+
+    indices = range(0, frames.shape[0], step)
+    rows    = max(math.ceil(len(indices) / columns), 1)
+
+    fig, axes = plt.subplots(rows, columns, squeeze=False, figsize=(columns*1.5, rows*1.5))
+
+    for ax in axes.flat:
+        ax.axis('off')
+
+    for ax, index in zip(axes.flat, indices):
+        frame = frames[index]
+        # the fields are rendered like the optical flow images
+        image = flow_image(frame) if frame.shape[-1] == 2 else frame
+        # opencv images are bgr
+        ax.imshow(image[...,::-1])
+        ax.set_title(str(index), fontsize=8)
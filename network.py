@@ -20,7 +20,9 @@ There are 4 different networks available
         Scale Convolutional Neural Network for Micro-Expression Recognition", this
         network was intended to be used for micro-expression classification. we
         adapted the network to use it for Cognitive Load Estimation from timeseries
-        of facial optical flow images
+        of facial optical flow images. The features can also be raw optical flow
+        fields with two channels in pixels, see raw_to_training_data.py, the
+        input layer is sized to the channels of the features
     twoclass_clitw
         Same network as clitw but with only two neurons on the output layer for
         a 2 class classification task
@@ -134,9 +136,12 @@ datahandler = deepl.DataHandler(
                 regression=True if network == 'score' else False
 )
 
+# channels of the features, optical flow images have 3 and flow fields 2
+channels = datahandler.train_data()[0].shape[-1]
+
 networks = {
     'clitw': deepl.CLitW_network,
-    'opticalflow': deepl.of_network,
+    'opticalflow': lambda: deepl.of_network(channels),
     'twoclass_clitw': deepl.twoclass_CLitW_network,
     'score': deepl.score_regression_network
 }
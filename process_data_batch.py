@@ -0,0 +1,219 @@
+""" This script processes the recorded video data of multiple participants in
+parallel
+
+It does the same as the process_data_raw.py script, but for a whole directory of
+participants. Every subdirectory that contains a video file is treated as the
+experiment data directory of one participant. The participants are distributed
+over a pool of worker processes, each of which owns its own video handler and face
+and eye extractors. The number of threads OpenCV uses internally is limited per
+worker, such that the workers don't compete for the cores.
+
+The progress is reported for every participant as soon as it is finished. If the
+processing of a participant fails, the error is reported and the remaining
+participants are processed anyway. Trials that are up to date according to the
+manifest of a participant are skipped, see process_data_raw.py.
+
+...
+
+Arguments:
+
+    ExperimentDataRoot:
+        path to the directory that contains one experiment data directory per
+        participant
+    --methods, -m (optional, str):
+        comma separated list of processing methods, each one of 'eye', 'face',
+        'landmarkface', 'lefteye', 'mouth' and 'opticalflow', see
+        process_data_raw.py
+        default: 'face'
+    --output, -o (optional, str):
+        directory to store the output files in. One directory per participant
+        is created in it
+        default: '.'
+    --crop, -c (optional, str):
+        the crop size of the extracted images (squared), or a comma separated
+        list of crop sizes, e.g. 32,64,128. All the sizes are cropped from the
+        same face box and landmarks in a single pass and every size is written
+        to its own files, named with the size after the method, e.g.
+        '{n}-{i}-face_64x64.npy'. With a single size the names don't change.
+        raw_to_training_data.py --crop selects the files of one size
+        default: 64
+    --workers, -w (optional, int):
+        number of worker processes
+        default: number of cores
+    --pipeline-threads, -pt (optional, int):
+        if set, the video is decoded in its own thread while this many threads
+        extract the faces and eyes from the decoded frames
+        default: 0 (no pipeline)
+    --queue-size, -qs (optional, int):
+        maximum number of decoded frames waiting for the extraction threads
+        default: 32
+    --batch-size, -bs (optional, int):
+        number of frames the face detection network is run on at once
+        default: 1
+    --detector, -d (optional, str):
+        the face detection backend, one of 'ssd' (the SSD network at 300x300),
+        'ssd-small' (the SSD network at 150x150), 'haar' (OpenCV's Haar
+        cascade) and 'hog' (dlib's HOG detector). Use the detectors benchmark
+        to compare them on a recorded video
+        default: 'ssd'
+    --detect-interval, -di (optional, int):
+        if larger than 1, the face is detected only in every n-th frame and
+        tracked in between. It is detected earlier if it moved noticeably.
+        Can't be combined with more than one pipeline thread
+        default: 1 (the face is detected in every frame)
+    --drift-threshold, -dt (optional, float):
+        mean grey value difference inside the face between two frames, above
+        which a tracked face is detected again
+        default: 8.0
+    --cache-faces, -cf (optional, flag):
+        if this flag is set, the bounding box of the face in every processed
+        frame is stored next to the video. Later runs, e.g. with another crop
+        size or method, only crop the stored boxes instead of detecting the
+        faces again
+    --eye-from-face, -ef (optional, flag):
+        if this flag is set, the facial landmarks for the eye are searched in
+        the box of the face detector, instead of running dlib's face detector
+        on the whole frame. It is a lot faster, but the eye crops can differ
+        slightly
+    --cache-landmarks, -cl (optional, flag):
+        if this flag is set, the facial landmarks of every processed frame are
+        stored next to the video. Later runs, e.g. with another crop size, crop
+        the eye from the stored landmarks instead of searching them again
+    --flow-backend, -fb (optional, str):
+        the optical flow backend, either 'farneback' or the DIS optical flow at
+        one of its presets 'dis-ultrafast', 'dis-fast' and 'dis-medium', which
+        are a lot faster but less accurate. Use the flow benchmark to compare
+        them
+        default: 'farneback'
+    --flow-levels, --flow-winsize, --flow-iterations (optional, int):
+        number of pyramid levels, size of the averaging window and number of
+        iterations of Farneback's algorithm. Fewer levels and iterations and a
+        smaller window are faster
+        default: 3, 15, 3
+    --flow-initial (optional, flag):
+        if this flag is set, the optical flow of the previous frame pair is the
+        initial guess for the next one, which converges faster but changes the
+        flow slightly
+    --flow-format, -ff (optional, str):
+        the format the optical flow is stored in. 'image' are rgb images whose
+        brightness is normalised per frame, 'float16' and 'int8' store the flow
+        field itself with an x and y channel, keeping its magnitude. 'int8' is
+        quantised to 1/8 pixel, see opticalflow.FLOW_SCALE, and takes 2 bytes
+        per pixel instead of 3, 'float16' takes 4
+        default: 'image'
+    --frame-step, -fs (optional, int):
+        if larger than 1, only every n-th frame of a trial is extracted, the
+        frames in between are skipped without decoding them or detecting the
+        face, which makes the extraction about n times faster. The files are
+        named '{n}-{i}-{method}_step{step}-{offset}'
+        default: 1 (every frame)
+    --target-fps (optional, float):
+        instead of --frame-step, about this many frames per second are
+        extracted. The step is the frame rate of the video divided by it
+    --frame-offsets, -fo (optional, str):
+        comma separated list of offsets of the first extracted frame of a trial,
+        each less than the frame step. Every offset is a file of its own, e.g.
+        '0,1,2,3' with a frame step of 4 gives 4 phases, which
+        raw_to_training_data.py --subsample 4 uses as the phases of every
+        trial. The phases are taken by the frame number in the video, so they
+        only match the ones raw_to_training_data.py builds from the files of
+        every frame if a face was found in every frame
+        default: '0'
+    --lecture-video (optional, flag):
+        if this flag is set, the data of the lecture video part of the
+        experiment is extracted as well, in the same pass over the video as the
+        trials
+    --force (optional, flag):
+        if this flag is set, all the trials are computed again, even if they are
+        up to date
+"""
+
+
+
+import argparse
+import os
+
+import lib.dataprocessing as dp
+
+
+# the worker processes may import this script, so only the main process runs it
+if __name__ == '__main__':
+
+    # Argument Parsing
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ExperimentDataRoot',
+                         help='The directory that holds one experiment data\
+                               directory per participant')
+    parser.add_argument('--methods', '-m',
+                         default='face',
+                         help='Comma separated list of methods that are processed\
+                               in a single pass, e.g. face,eye,opticalflow')
+    parser.add_argument('--output', '-o',
+                         default='.',
+                         help='Directory to store the output in')
+    parser.add_argument('--workers', '-w',
+                         default=os.cpu_count(),
+                         help='Number of worker processes')
+    dp.add_processing_arguments(parser)
+    arguments = parser.parse_args()
+
+
+    # Argument Processing
+    methods       = arguments.methods.split(',')
+    root_path     = os.path.abspath(arguments.ExperimentDataRoot)
+    output_path   = os.path.abspath(arguments.output)
+    cropsizes     = dp.crop_sizes(arguments)
+    workers       = int(arguments.workers)
+    lecture_video = arguments.lecture_video
+    resume        = not arguments.force
+    frame_offsets = dp.frame_offsets(arguments)
+
+    # options for the video handler
+    handler_options = dp.handler_options(arguments)
+
+
+    # Assertion Checks
+    assert os.path.exists(root_path) and os.path.isdir(root_path)
+    assert os.path.exists(output_path) and os.path.isdir(output_path)
+
+    assert len(methods) > 0 and len(set(methods)) == len(methods)
+    assert all([method in dp.METHODS for method in methods])
+    assert workers > 0
+
+    # every directory with a video in it is the data of one participant
+    exp_data_paths = sorted([
+        os.path.join(root_path, directory)
+        for directory in os.listdir(root_path)
+        if os.path.isdir(os.path.join(root_path, directory))
+        and any([os.path.splitext(file)[1] == '.mp4' for file in os.listdir(os.path.join(root_path, directory))])
+    ])
+
+
+    print('')
+    print('Processing Methods: {}'.format(', '.join(methods)))
+    print('Experiment Data: {}'.format(root_path))
+    print('Participants: {}'.format(len(exp_data_paths)))
+    print('Output Path: {}'.format(output_path))
+    print('Cropsize: {}'.format(', '.join([str(size) for size in cropsizes])))
+    print('Workers: {}'.format(workers))
+    print('Video Part: {}'.format('N-Back and Lecture Video' if lecture_video else 'N-Back'))
+    print('')
+
+    failed = []
+    results = dp.process_participants(exp_data_paths, output_path, methods, cropsizes, lecture_video, workers, resume, frame_offsets, **handler_options)
+    for done, (exp_data_path, frame_counts, skipped, duration, error) in enumerate(results, start=1):
+        participant = dp.util.getParticipantID(exp_data_path)
+
+        if error is None:
+            print('[{}/{}] {}: {} files ({} up to date), {} frames in {:.1f}s'.format(
+                done, len(exp_data_paths), participant,
+                len(frame_counts), len(skipped), sum(frame_counts.values()), duration))
+        else:
+            failed.append(participant)
+            print('[{}/{}] {}: FAILED after {:.1f}s'.format(done, len(exp_data_paths), participant, duration))
+            print(error)
+
+    print('')
+    print('Output written to {}'.format(output_path))
+    if failed:
+        print('Failed participants: {}'.format(', '.join(failed)))
@@ -6,156 +6,229 @@ It extracts the timestamps of the trials and loads these chunks of videos from t
 recorded video data. These chunks are then processed frame by frame and stored into
 a numpy array and saved into .npy files. On top of that the ground truth labels are
 stored in a seperate .npy files.
+All the trials are extracted in a single pass over the video, which is decoded
+once from front to back. The frames are written to the .npy files as soon as they
+are processed, so the memory usage does not grow with the length of the video.
 The script creates two seperate files for each of the 25 trials, a .npy file for the
 frame data and a .json file for the ground truth labels.
-
-There are three ways to process the video data
+Multiple methods can be processed in the same run, in which case each frame is
+decoded once, the face and the facial landmarks are found once, all regions are
+cropped from the same landmarks and the optical flow is computed from the face
+images that were already extracted.
+Every written file is recorded in a manifest in the output directory of the
+participant, together with the video, the parameters and the code version it was
+computed from. When the script is run again, the trials that are up to date are
+skipped, so after a crash only the missing trials are computed.
+
+The method is given as the positional ProcessingMethod, or with --methods as
+a comma separated list of methods that are processed in the same pass. The
+methods are
     face
         frame by frame the face is extracted and saved as a greyscale image
-    eye
-        frame by frame the right eye is extracted and saved as a greyscale image
     opticalflow
         frame by frame the face is extracted and for consecutive frames, the
         optical flow estimation is computed to create an rgb image the encodes
-        the movement between two images using the HSV color space
+        the movement between two images using the HSV color space, or stored
+        as the raw flow field, see --flow-format
+    eye, lefteye, mouth, landmarkface
+        the region methods, frame by frame the right eye, the left eye, the
+        mouth or the face is cropped from the facial landmarks and saved as a
+        greyscale image. All the regions of a frame are cropped from the same
+        landmarks
 
 ...
 
 Arguments:
 
-    ProcessesMethod:
-        'eye', 'face', 'opticalflow'
+    ProcessesMethod (optional):
+        'eye', 'face', 'landmarkface', 'lefteye', 'mouth', 'opticalflow'
+        can be omitted if --methods is given
     ExperimentData
         path to the directory that contains all the experiment data. The .json
         file and the video file
+    --methods, -m (optional, str):
+        comma separated list of processing methods that are all processed in
+        a single pass over the video, e.g. 'face,eye,opticalflow'. Replaces the
+        ProcessingMethod argument
     --output, -o (optional, str):
         directory to store the output files in
         default: '.'
-    --crop, -c (optional, int):
-        the crop size of the extracted images (squared)
+    --crop, -c (optional, str):
+        the crop size of the extracted images (squared), or a comma separated
+        list of crop sizes, e.g. 32,64,128. All the sizes are cropped from the
+        same face box and landmarks in a single pass and every size is written
+        to its own files, named with the size after the method, e.g.
+        '{n}-{i}-face_64x64.npy'. With a single size the names don't change.
+        raw_to_training_data.py --crop selects the files of one size
         default: 64
+    --workers, -w (optional, int):
+        number of worker processes the trials are split between. Each worker
+        decodes its own part of the video. The output is the same as with a
+        single worker
+        default: 1
+    --pipeline-threads, -pt (optional, int):
+        if set, the video is decoded in its own thread while this many threads
+        extract the faces and eyes from the decoded frames
+        default: 0 (no pipeline)
+    --queue-size, -qs (optional, int):
+        maximum number of decoded frames waiting for the extraction threads
+        default: 32
+    --batch-size, -bs (optional, int):
+        number of frames the face detection network is run on at once
+        default: 1
+    --detector, -d (optional, str):
+        the face detection backend, one of 'ssd' (the SSD network at 300x300),
+        'ssd-small' (the SSD network at 150x150), 'haar' (OpenCV's Haar
+        cascade) and 'hog' (dlib's HOG detector). Use the detectors benchmark
+        to compare them on a recorded video
+        default: 'ssd'
+    --detect-interval, -di (optional, int):
+        if larger than 1, the face is detected only in every n-th frame and
+        tracked in between. It is detected earlier if it moved noticeably.
+        Can't be combined with more than one pipeline thread
+        default: 1 (the face is detected in every frame)
+    --drift-threshold, -dt (optional, float):
+        mean grey value difference inside the face between two frames, above
+        which a tracked face is detected again
+        default: 8.0
+    --cache-faces, -cf (optional, flag):
+        if this flag is set, the bounding box of the face in every processed
+        frame is stored next to the video. Later runs, e.g. with another crop
+        size or method, only crop the stored boxes instead of detecting the
+        faces again
+    --eye-from-face, -ef (optional, flag):
+        if this flag is set, the facial landmarks for the eye are searched in
+        the box of the face detector, instead of running dlib's face detector
+        on the whole frame. It is a lot faster, but the eye crops can differ
+        slightly
+    --cache-landmarks, -cl (optional, flag):
+        if this flag is set, the facial landmarks of every processed frame are
+        stored next to the video. Later runs, e.g. with another crop size, crop
+        the eye from the stored landmarks instead of searching them again
+    --flow-backend, -fb (optional, str):
+        the optical flow backend, either 'farneback' or the DIS optical flow at
+        one of its presets 'dis-ultrafast', 'dis-fast' and 'dis-medium', which
+        are a lot faster but less accurate. Use the flow benchmark to compare
+        them
+        default: 'farneback'
+    --flow-levels, --flow-winsize, --flow-iterations (optional, int):
+        number of pyramid levels, size of the averaging window and number of
+        iterations of Farneback's algorithm. Fewer levels and iterations and a
+        smaller window are faster
+        default: 3, 15, 3
+    --flow-initial (optional, flag):
+        if this flag is set, the optical flow of the previous frame pair is the
+        initial guess for the next one, which converges faster but changes the
+        flow slightly
+    --flow-format, -ff (optional, str):
+        the format the optical flow is stored in. 'image' are rgb images whose
+        brightness is normalised per frame, 'float16' and 'int8' store the flow
+        field itself with an x and y channel, keeping its magnitude. 'int8' is
+        quantised to 1/8 pixel, see opticalflow.FLOW_SCALE, and takes 2 bytes
+        per pixel instead of 3, 'float16' takes 4
+        default: 'image'
+    --frame-step, -fs (optional, int):
+        if larger than 1, only every n-th frame of a trial is extracted, the
+        frames in between are skipped without decoding them or detecting the
+        face, which makes the extraction about n times faster. The files are
+        named '{n}-{i}-{method}_step{step}-{offset}'
+        default: 1 (every frame)
+    --target-fps (optional, float):
+        instead of --frame-step, about this many frames per second are
+        extracted. The step is the frame rate of the video divided by it
+    --frame-offsets, -fo (optional, str):
+        comma separated list of offsets of the first extracted frame of a trial,
+        each less than the frame step. Every offset is a file of its own, e.g.
+        '0,1,2,3' with a frame step of 4 gives 4 phases, which
+        raw_to_training_data.py --subsample 4 uses as the phases of every
+        trial. The phases are taken by the frame number in the video, so they
+        only match the ones raw_to_training_data.py builds from the files of
+        every frame if a face was found in every frame
+        default: '0'
     --lecture-video (optional, flag):
-        if this flag is set, instead of the trials the data is extracted for the
-        lecture video part of the experiment. This part does not contain ground
-        truth data
+        if this flag is set, the data of the lecture video part of the
+        experiment is extracted as well, in the same pass over the video as the
+        trials, into '{method}_lecture_video.npy' files. This part does not
+        contain ground truth data
+    --force (optional, flag):
+        if this flag is set, all the trials are computed again, even if they are
+        up to date
 """
 
 
 
 import argparse
-import json
 import os
 
-import numpy as np
-
 import lib.dataprocessing as dp
 
 
 # Argument Parsing
 parser = argparse.ArgumentParser()
 parser.add_argument('ProcessingMethod',
-                     choices=['eye', 'face', 'opticalflow'],
+                     nargs='?',
+                     choices=sorted(dp.METHODS),
                      help='Which method to choose for processing the data')
 parser.add_argument('ExperimentData',
                      help='The directory that holds all the data recorded at the\
                            N-Back experiment')
+parser.add_argument('--methods', '-m',
+                     help='Comma separated list of methods that are processed\
+                           in a single pass, e.g. face,eye,opticalflow')
 parser.add_argument('--output', '-o',
                      default='.',
                      help='Directory to store the output in')
-parser.add_argument('--crop', '-c',
-                     default=64,
-                     help='The crop size for the frames')
-parser.add_argument('--lecture-video', '-lv',
-                     default=False,
-                     action='store_true',
-                     help='If set the frames for the lecture video are extracted')
+parser.add_argument('--workers', '-w',
+                     default=1,
+                     help='Number of worker processes to split the trials between')
+dp.add_processing_arguments(parser)
 arguments = parser.parse_args()
 
 
 # Argument Processing
-method        = arguments.ProcessingMethod
+methods       = arguments.methods.split(',') \
+                    if arguments.methods \
+                    else [arguments.ProcessingMethod]
 exp_data_path = os.path.abspath(arguments.ExperimentData)
 output_path   = os.path.abspath(arguments.output)
-cropsize      = int(arguments.crop)
+cropsizes     = dp.crop_sizes(arguments)
+workers       = int(arguments.workers)
 lecture_video = arguments.lecture_video
+resume        = not arguments.force
+frame_offsets = dp.frame_offsets(arguments)
+
+# options for the video handler
+handler_options = dp.handler_options(arguments)
 
 
 # Assertion Checks
 assert os.path.exists(exp_data_path) and os.path.isdir(exp_data_path)
 assert os.path.exists(output_path) and os.path.isdir(output_path)
 
-assert cropsize > 0
+assert (arguments.ProcessingMethod is None) != (arguments.methods is None)
+assert len(methods) > 0 and len(set(methods)) == len(methods)
+assert all([method in dp.METHODS for method in methods])
+assert workers > 0
 
 # retrieve the files from the experiment directory
 exp_json, video_path, participant = dp.util.getExperimentInfo(exp_data_path)
 
-assert os.path.exists(video_path) and os.path.isfile(video_path) \
-    and os.path.splitext(video_path)[1] == '.mp4'
-assert os.path.exists(exp_json) and os.path.isfile(exp_json) \
-    and os.path.splitext(exp_json)[1] == '.json'
-
 
 print('')
-print('Processing Method: {}'.format(method))
+print('Processing Methods: {}'.format(', '.join(methods)))
 print('Experiment Data: {}'.format(exp_json))
 print('Video: {}'.format(video_path))
 print('Output Path: {}'.format(output_path))
-print('Cropsize: {}'.format(cropsize))
+print('Cropsize: {}'.format(', '.join([str(size) for size in cropsizes])))
 print('Participant: {}'.format(participant))
-print('Video Part: {}'.format('Lecture Video' if lecture_video else 'N-Back'))
+print('Workers: {}'.format(workers))
+print('Video Part: {}'.format('N-Back and Lecture Video' if lecture_video else 'N-Back'))
 print('')
 
-# create the data processing objects
-exp_data      = dp.ExperimentData(exp_json)
-video_handler = dp.VideoHandler(video_path)
-
-# choose the right processing function accoding to the method
-method_functions = {
-    'face': video_handler.get_frames,
-    'eye': video_handler.get_eye_frames,
-    'opticalflow': video_handler.get_optical_flow_frames
-}
-process_frames = method_functions[method]
-
-# create the output directory for this participant
-os.makedirs(os.path.join(output_path, participant), exist_ok=True)
-
-if not lecture_video:
-
-    print('Processing N-levels...')
-    # go over every difficulty level
-    for n in range(1,6):
-        print('N={}'.format(n))
-        # get the trial timestampts and score
-        trials = exp_data.get_trials(n)
-
-        # iterate over every trial for this difficulty
-        for i, trial in enumerate(trials):
-            print('  Trial {}'.format(i+1))
-            # get the frames
-            frames = process_frames(trial['start'], trial['end'], cropsize)
-
-            # format the output path and filename
-            out = os.path.join(output_path, participant, '{}-{}-{}'.format(n,i, method))
-            # save the frames
-            np.save('{}.npy'.format(out), frames)
-            # save the gt data as a json file
-            with open('{}.json'.format(out), 'w') as json_file:
-                json.dump({
-                    'n': n,
-                    'score': trial['score']
-                }, json_file)
-
-else:
-
-    print('Processing Lecture Video')
-
-    # get the timestamps for the lecture video
-    start, end = exp_data.get_video_lecture_timestamps()
-    # process the frames
-    frames = process_frames(start, end, cropsize)
-    # format the output path and filename
-    out = os.path.join(output_path, participant, '{}_lecture_video'.format(method))
-    np.save('{}.npy'.format(out), frames)
+print('Processing {}...'.format('N-levels and Lecture Video' if lecture_video else 'N-levels'))
+frame_counts, skipped = dp.process_participant(exp_data_path, output_path, methods, cropsizes, lecture_video, workers, resume, frame_offsets, **handler_options)
+
+for name, count in frame_counts.items():
+    print('  {} ({} frames{})'.format(name, count, ', up to date' if name in skipped else ''))
 
 print('Output written to {}'.format(os.path.join(output_path, participant)))
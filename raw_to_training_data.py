@@ -6,6 +6,12 @@ want to process the data of multiple participants
 This scripts couples the frames into chunks of a certain windowsize (default is 60)
 and can subsample them if needed.
 
+Optical flow stored as raw flow fields (see --flow-format of process_data_raw.py)
+keeps its two channels, such that it can be fed to the opticalflow network. The
+fields are written as float16 in pixels, the int8 fields are stored in 1/8
+pixels and are decoded, such that the scale of the training data doesn't depend
+on the format the flow was stored in.
+
 The data can be grouped as a balanced dataset for a single person, where 4 trials
 of each difficulty level are used for the training set and 1 for the validation
 set. This provides a perfectly balanced dataset to train a model for a single
@@ -19,6 +25,16 @@ Arguments:
     RawDataDir
         The directory containing all the output files (.npy and .json) generated
         by the process_data_raw.py script
+    --method, -m (optional, str)
+        The processing method whose '{n}-{i}-{method}' files are used, e.g.
+        'face' or 'opticalflow'. process_data_raw.py writes the files of all the
+        methods of a run into the same directory
+        default: the only method in RawDataDir
+    --crop, -c (optional, int)
+        The crop size whose '{n}-{i}-{method}_{crop}x{crop}' files are used, if
+        process_data_raw.py extracted multiple crop sizes into the same
+        directory
+        default: the only crop size of the method in RawDataDir
     --single-person-balanced, -spb (optional, flag)
         If set, the data is split into a training and validation set for this
         single person. The out will be 4 files, training plus validation data and
@@ -37,26 +53,41 @@ Arguments:
         default: 60
     --subsample, -ss (optional, int)
         Subsampling rate that should be used. If set to x>1, every x-th frame
-        will be used for a window
+        will be used for a window. If the frames were extracted with a frame
+        step of x (see --frame-step of process_data_raw.py), the
+        '{n}-{i}-{method}_step{x}-{offset}' files of a trial are its phases and
+        are used instead of subsampling the files of every frame
         default: 1
     --output, -o (optional, str)
         The output directory
         default: '.'
+
+The output files are named '{participant}_{window}@{subsample}_{crop}x{crop}_'
+followed by the method, the format of optical flow fields, e.g. 'float16', the
+ground truth and '_twoclass', such that the data of different methods, crop
+sizes and flow formats can be written to the same directory.
 """
 
 
 import argparse
 import json
 import os
+import re
 
 import numpy as np
 
-from lib.dataprocessing import DataHandler
+from lib.dataprocessing import DataHandler, decode_flow
 
 parser = argparse.ArgumentParser()
 parser.add_argument('RawDataDir',
                      help='Directory where the frame .npy files and the ground\
                      truth .json files are stored')
+parser.add_argument('--method', '-m',
+                     help='The processing method whose files are used, e.g.\
+                           face or opticalflow')
+parser.add_argument('--crop', '-c',
+                     help='The crop size whose files are used, if multiple\
+                           crop sizes were extracted')
 parser.add_argument('--single-person-balanced', '-spb',
                      action='store_true',
                      help='If this flag is set, one balanced dataset with training and \
@@ -99,10 +130,33 @@ assert os.path.exists(output_path) and os.path.isdir(output_path)
 assert windowsize > 0
 assert subsample > 0
 
+# the methods of the trial files, without the lecture video
+trial_methods = sorted(set([
+    match.group(1)
+    for match in [re.fullmatch(r'\d+-\d+-([a-z]+)(_\d+x\d+)?(_step\d+-\d+)?\.npy', file) for file in os.listdir(exp_data_path)]
+    if match
+]))
+# without --method the directory must hold the files of a single method
+method = arguments.method if arguments.method else trial_methods[0] if len(trial_methods) == 1 else None
+assert method in trial_methods, 'Select one of the methods {} with --method'.format(', '.join(trial_methods))
+
+# the crop sizes in the names of the files of the method, the size is only part
+# of the names if multiple sizes were extracted at once
+crop_names = sorted(set([
+    match.group(1) or ''
+    for match in [re.fullmatch(r'\d+-\d+-{}(_\d+x\d+)?(_step\d+-\d+)?\.npy'.format(method), file) for file in os.listdir(exp_data_path)]
+    if match
+]))
+# without --crop the method must have files of a single crop size
+crop_name = '_{0}x{0}'.format(int(arguments.crop)) if arguments.crop else crop_names[0] if len(crop_names) == 1 else None
+assert crop_name in crop_names, 'Select one of the crop sizes {} with --crop'.format(', '.join([name[1:] for name in crop_names if name]))
+
 participant = os.path.basename(exp_data_path)
 
 print('')
 print('Raw Data: {}'.format(exp_data_path))
+print('Method: {}'.format(method))
+print('Crop: {}'.format(crop_name[1:] if crop_name else 'single size'))
 print('Ground Truth: {}'.format(ground_truth))
 print('Output Path: {}'.format(output_path))
 print('Windowsize: {}'.format(windowsize))
@@ -112,33 +166,63 @@ print('Single Person Balanced: {}'.format(spb))
 print('Two Class: {}'.format(twoclass))
 print('')
 
-# list all the files containing the frames
-frame_files = sorted([os.path.join(exp_data_path, file)
-                for file
-                in os.listdir(exp_data_path)
-                if os.path.splitext(os.path.join(exp_data_path, file))[1] == '.npy'
-              ])
-
-# list all the files containing the ground truth values
-gt_files    = sorted([os.path.join(exp_data_path, file)
-                for file
-                in os.listdir(exp_data_path)
-                if os.path.splitext(os.path.join(exp_data_path, file))[1] == '.json'
-              ])
-
-# get the shape of a single frame
-shape = np.load(frame_files[0]).shape[1:]
-
-# suffix to add to the output files
-suffix = ground_truth
+# the files of the trials, '{n}-{i}-{method}.npy', or the phases of the trials,
+# '{n}-{i}-{method}_step{step}-{offset}.npy', if only every step-th frame was
+# extracted, see --frame-step of process_data_raw.py. The method is followed by
+# the crop size if multiple sizes were extracted
+trial_files = [
+    (match.group(1), int(match.group(2) or 1), int(match.group(3) or 0), os.path.join(exp_data_path, match.group(0)))
+    for match in [
+        re.fullmatch(r'(\d+-\d+)-{}{}(?:_step(\d+)-(\d+))?\.npy'.format(method, crop_name), file)
+        for file in os.listdir(exp_data_path)
+    ]
+    if match
+]
+
+# the phases extracted with the frame step of the subsampling are used as they
+# are, otherwise the files of every frame are subsampled
+steps = sorted(set([step for _, step, _, _ in trial_files]))
+step  = subsample if subsample in steps else 1
+assert step in steps, 'The frames were extracted with a frame step of {}, use it as --subsample'.format(steps[0])
+
+# the files of every trial, one per phase in the order of their offsets
+trials      = sorted(set([trial for trial, file_step, _, _ in trial_files if file_step == step]))
+frame_files = [
+    [file for _, _, _, file in sorted([entry for entry in trial_files if entry[0] == trial and entry[1] == step])]
+    for trial in trials
+]
+
+# the files containing the ground truth values, every phase has the same
+gt_files    = ['{}.json'.format(os.path.splitext(files[0])[0]) for files in frame_files]
+
+# get the shape and data type of a single frame, optical flow fields are
+# float16 or int8. All the files have to hold the same frames
+frames_info = [np.load(file, mmap_mode='r') for files in frame_files for file in files]
+assert len(set([(info.shape[1:], info.dtype) for info in frames_info])) == 1
+shape       = frames_info[0].shape[1:]
+dtype       = frames_info[0].dtype
+# int8 flow fields are in 1/FLOW_SCALE pixels, they are decoded to pixels like
+# the float16 fields
+decode      = dtype == np.int8
+if decode:
+    dtype = np.float16
+# grayscale frames get a channel axis, images and optical flow fields already
+# have one and are fed to the network as they are
+channels    = (1,) if len(shape) == 2 else ()
+
+# suffix to add to the output files, the method and the format of optical flow
+# fields keep the data of different runs apart, the crop size is part of the
+# name already
+suffix = method if frames_info[0].dtype == np.uint8 else '{}_{}'.format(method, frames_info[0].dtype)
+suffix = '{}_{}'.format(suffix, ground_truth)
 
 # remove classes 2-3 if twoclass is set
 if twoclass:
-    frame_files = [file
-                    for file
+    frame_files = [files
+                    for files
                     in frame_files
-                    if os.path.basename(file)[0] != '3'
-                    # or os.path.basename(file)[0] == '5'
+                    if os.path.basename(files[0])[0] != '3'
+                    # or os.path.basename(files[0])[0] == '5'
                   ]
     gt_files = [file
                     for file
@@ -153,18 +237,18 @@ if twoclass:
 if not spb:
 
     # initialize the data handler
-    data_handler = DataHandler((windowsize, *shape, 1), subsample)
+    data_handler = DataHandler((windowsize, *shape, *channels), subsample, dtype)
 
     # iterate over all the data
     for frames, gt in zip(frame_files, gt_files):
-        # make sure the two files belong to each other
-        assert os.path.splitext(os.path.basename(frames))[0] == os.path.splitext(os.path.basename(gt))[0]
-
         # open the gt file
         with open(gt, 'r') as gt_file:
             gt_data = json.load(gt_file)
-            # load the frames
-            frame_data = np.load(frames)
+            # memory map the frames of every phase, they are read window by
+            # window
+            frame_data = [np.load(file, mmap_mode='r') for file in frames]
+            if decode:
+                frame_data = [decode_flow(phase) for phase in frame_data]
 
             # set the ground truth accordingly
             if ground_truth == 'n' and twoclass:
@@ -173,8 +257,12 @@ if not spb:
             else:
                 gt = gt_data[ground_truth]
 
-            # add the frames to the datahandler
-            data_handler.add_frames(frame_data, gt)
+            # add the frames to the datahandler, the phases extracted with a
+            # frame step are subsampled already
+            if step > 1:
+                data_handler.add_phases(frame_data, gt)
+            else:
+                data_handler.add_frames(frame_data[0], gt)
 
 
     print("Writing data to disk...")
@@ -189,18 +277,18 @@ if not spb:
 # data to be used in single person training
 else:
     # seperate datahandler for training and validation data
-    train_data_handler = DataHandler((windowsize, *shape, 1), subsample)
-    valid_data_handler = DataHandler((windowsize, *shape, 1), subsample)
+    train_data_handler = DataHandler((windowsize, *shape, *channels), subsample, dtype)
+    valid_data_handler = DataHandler((windowsize, *shape, *channels), subsample, dtype)
 
     for i, (frames, gt) in enumerate(zip(frame_files, gt_files)):
-        # make sure the two files belong to each other
-        assert os.path.splitext(os.path.basename(frames))[0] == os.path.splitext(os.path.basename(gt))[0]
-
         # open the gt file
         with open(gt, 'r') as gt_file:
             gt_data = json.load(gt_file)
-            # load the frames
-            frame_data = np.load(frames)
+            # memory map the frames of every phase, they are read window by
+            # window
+            frame_data = [np.load(file, mmap_mode='r') for file in frames]
+            if decode:
+                frame_data = [decode_flow(phase) for phase in frame_data]
 
             # load the ground truth data from the json file
             # if the ground truth metric is n and the two class option
@@ -216,11 +304,17 @@ else:
             # validation set
             # last one of each difficulty is used for validation
             if (i+1)%5==0:
-                valid_data_handler.add_frames(frame_data, gt)
+                data_handler = valid_data_handler
             # training set
             # trials 0-3 are used for training
             else:
-                train_data_handler.add_frames(frame_data, gt)
+                data_handler = train_data_handler
+
+            # the phases extracted with a frame step are subsampled already
+            if step > 1:
+                data_handler.add_phases(frame_data, gt)
+            else:
+                data_handler.add_frames(frame_data[0], gt)
 
 
     print("Writing data to disk...")
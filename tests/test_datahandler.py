@@ -0,0 +1,51 @@
+import numpy as np
+
+from lib.dataprocessing.datahandler import DataHandler
+
+
+def frames(count: int):
+    return np.arange(count * 2 * 2, dtype=np.uint8).reshape(count, 2, 2)
+
+
+
+def test_frames_are_split_into_windows():
+    handler = DataHandler((4, 2, 2))
+    handler.add_frames(frames(10), 3)
+
+    data, labels = handler.get_data()
+
+    assert data.shape == (2, 4, 2, 2)
+    assert np.array_equal(data.reshape(8, 2, 2), frames(8))
+    assert np.array_equal(labels, [3, 3])
+
+
+
+def test_iterable_of_chunks_equals_single_array():
+    expected = DataHandler((4, 2, 2), subsample=3)
+    expected.add_frames(frames(50), 1)
+
+    chunked = DataHandler((4, 2, 2), subsample=3)
+    chunked.add_frames((chunk for chunk in np.array_split(frames(50), [1, 7, 8, 30])), 1)
+
+    for a, b in zip(expected.get_data(), chunked.get_data()):
+        assert np.array_equal(a, b)
+
+
+
+def test_grayscale_frames_get_a_channel_axis():
+    handler = DataHandler((4, 2, 2, 1))
+    handler.add_frames(frames(4), 2)
+
+    assert handler.get_data()[0].shape == (1, 4, 2, 2, 1)
+
+
+
+def test_phases_equal_subsampled_frames():
+    expected = DataHandler((4, 2, 2), subsample=3)
+    expected.add_frames(frames(40), 5)
+
+    phased = DataHandler((4, 2, 2), subsample=3)
+    phased.add_phases([frames(40)[offset::3] for offset in range(3)], 5)
+
+    for a, b in zip(expected.get_data(), phased.get_data()):
+        assert np.array_equal(a, b)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from lib.dataprocessing.framebuffer import FrameBuffer
+
+
+def test_data_returns_the_appended_frames():
+    frames = np.arange(5 * 4 * 3, dtype=np.uint8).reshape(5, 4, 3)
+
+    buffer = FrameBuffer(8, (4, 3))
+    for frame in frames:
+        buffer.append(frame)
+
+    assert len(buffer) == 5
+    assert np.array_equal(buffer.data(), frames)
+
+
+
+def test_buffer_grows_beyond_its_capacity():
+    frames = np.random.RandomState(0).randint(0, 255, (10, 2, 2)).astype(np.uint8)
+
+    buffer = FrameBuffer(3, (2, 2))
+    for frame in frames:
+        buffer.append(frame)
+
+    assert np.array_equal(buffer.data(), frames)
+
+
+
+def test_appended_frames_are_copied():
+    frame  = np.zeros((2, 2), dtype=np.uint8)
+    buffer = FrameBuffer(2, (2, 2))
+
+    buffer.append(frame)
+    frame[...] = 1
+    buffer.append(frame)
+
+    assert np.array_equal(buffer.data()[:, 0, 0], [0, 1])
+
+
+
+def test_empty_buffer_has_no_frames():
+    buffer = FrameBuffer(0, (2, 2), np.float16)
+
+    assert buffer.data().shape == (0, 2, 2)
+    assert buffer.data().dtype == np.float16
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+from lib.dataprocessing.frameindex import FrameIndex
+
+
+def video_with_index(directory, timestamps):
+    """Creates a file standing in for a video, with a stored index of it"""
+
+    video_path = os.path.join(str(directory), 'video.mp4')
+    with open(video_path, 'wb') as video_file:
+        video_file.write(b'not a video')
+
+    stat = os.stat(video_path)
+    np.save('{}.frameindex.npy'.format(video_path), np.array([stat.st_size, stat.st_mtime_ns, *timestamps], dtype=np.int64))
+
+    return video_path
+
+
+
+def test_stored_index_is_used(tmp_path):
+    video_path = video_with_index(tmp_path, [0, 40000, 80000])
+
+    index = FrameIndex(video_path)
+
+    assert len(index) == 3
+    assert np.array_equal(index.timestamps(), [0, 40000, 80000])
+
+
+
+def test_index_of_a_changed_video_is_rebuilt(tmp_path):
+    video_path = video_with_index(tmp_path, [0, 40000, 80000])
+    stat       = os.stat(video_path)
+    os.utime(video_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    # the file can't be decoded, so the rebuilt index has no frames
+    index = FrameIndex(video_path)
+    assert len(index) == 0
+
+    stored = np.load('{}.frameindex.npy'.format(video_path))
+    assert np.array_equal(stored, [stat.st_size, stat.st_mtime_ns + 10**9])
+
+
+
+def test_frame_number_returns_the_nearest_frame(tmp_path):
+    # a variable frame rate, the third frame comes late
+    index = FrameIndex(video_with_index(tmp_path, [0, 40000, 100000, 133000]))
+
+    assert index.frame_number(0) == 0
+    assert index.frame_number(19.9) == 0
+    assert index.frame_number(20) == 1
+    assert index.frame_number(69) == 1
+    assert index.frame_number(71) == 2
+    assert index.frame_number(120) == 3
+    assert index.frame_number(10000) == 3
+    assert index.frame_number(-5) == 0
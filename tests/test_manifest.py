@@ -0,0 +1,94 @@
+import os
+
+from lib.dataprocessing.manifest import Manifest
+from lib.dataprocessing.processing import _output_inputs
+
+
+def write_output(directory, name, content):
+    with open(os.path.join(str(directory), '{}.npy'.format(name)), 'wb') as output_file:
+        output_file.write(content)
+
+    return ['{}.npy'.format(name)]
+
+
+
+def test_recorded_output_is_current(tmp_path):
+    files = write_output(tmp_path, '1-0-face', b'frames')
+    Manifest(str(tmp_path)).add('1-0-face', {'crop': 64, 'range': (0, 10)}, files, 10)
+
+    manifest = Manifest(str(tmp_path))
+
+    # tuples are stored as lists
+    assert manifest.is_current('1-0-face', {'crop': 64, 'range': (0, 10)})
+    assert not manifest.is_current('1-0-face', {'crop': 32, 'range': (0, 10)})
+    assert not manifest.is_current('1-1-face', {'crop': 64, 'range': (0, 10)})
+    assert manifest.frames('1-0-face') == 10
+    assert manifest.inputs('1-1-face') is None
+
+
+
+def test_last_entry_wins(tmp_path):
+    files = write_output(tmp_path, '1-0-face', b'frames')
+    Manifest(str(tmp_path)).add('1-0-face', {'crop': 32}, files, 10)
+    Manifest(str(tmp_path)).add('1-0-face', {'crop': 64}, files, 12)
+
+    manifest = Manifest(str(tmp_path))
+    assert manifest.is_current('1-0-face', {'crop': 64})
+    assert not manifest.is_current('1-0-face', {'crop': 32})
+    assert manifest.frames('1-0-face') == 12
+
+    # compacting keeps only the last entry
+    manifest.compact()
+    with open(os.path.join(str(tmp_path), Manifest.FILENAME)) as manifest_file:
+        assert len(manifest_file.readlines()) == 1
+    assert Manifest(str(tmp_path)).is_current('1-0-face', {'crop': 64})
+
+
+
+def test_changed_file_is_not_current(tmp_path):
+    files = write_output(tmp_path, '1-0-face', b'frames')
+    Manifest(str(tmp_path)).add('1-0-face', {}, files, 10)
+
+    write_output(tmp_path, '1-0-face', b'other frames')
+    assert not Manifest(str(tmp_path)).is_current('1-0-face', {})
+
+    os.remove(os.path.join(str(tmp_path), files[0]))
+    assert not Manifest(str(tmp_path)).is_current('1-0-face', {})
+
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    files = write_output(tmp_path, '1-0-face', b'frames')
+    Manifest(str(tmp_path)).add('1-0-face', {}, files, 10)
+
+    # a crash while the next entry was appended
+    with open(os.path.join(str(tmp_path), Manifest.FILENAME), 'a') as manifest_file:
+        manifest_file.write('{"name": "1-1-face", "inpu')
+
+    manifest = Manifest(str(tmp_path))
+    assert manifest.is_current('1-0-face', {})
+    assert manifest.inputs('1-1-face') is None
+
+
+
+def test_outputs_only_depend_on_the_options_of_their_method():
+    options = {'detector': 'ssd', 'flow_format': 'image', 'eye_from_face': False, 'frame_step': 1}
+    changed = {
+        'flow_format': dict(options, flow_format='int8'),
+        'eye_from_face': dict(options, eye_from_face=True),
+        'detector': dict(options, detector='haar')
+    }
+    stale = {
+        option: [
+            method
+            for method in ['face', 'opticalflow', 'eye']
+            if _output_inputs({}, method, 64, options) != _output_inputs({}, method, 64, other)
+        ]
+        for option, other in changed.items()
+    }
+
+    assert stale == {
+        'flow_format': ['opticalflow'],
+        'eye_from_face': ['eye'],
+        'detector': ['face', 'opticalflow']
+    }
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+
+from lib.dataprocessing.npywriter import NpyWriter
+
+
+def test_closed_file_holds_the_written_frames(tmp_path):
+    path   = os.path.join(str(tmp_path), 'frames.npy')
+    frames = np.random.RandomState(0).randint(0, 255, (5, 3, 4)).astype(np.uint8)
+
+    with NpyWriter(path, (3, 4), 20) as writer:
+        writer.append(frames[0])
+        writer.extend(frames[1:])
+
+    assert len(writer) == 5
+    assert np.array_equal(np.load(path), frames)
+
+
+
+def test_file_is_truncated_on_close(tmp_path):
+    path = os.path.join(str(tmp_path), 'frames.npy')
+
+    with NpyWriter(path, (2, 2), 1000, np.float16) as writer:
+        writer.extend(np.ones((3, 2, 2), dtype=np.float16))
+
+    loaded = np.load(path, mmap_mode='r')
+    assert loaded.shape == (3, 2, 2) and loaded.dtype == np.float16
+    assert os.path.getsize(path) == loaded.offset + 3 * 2 * 2 * 2
+
+
+
+def test_header_is_rewritten_while_writing(tmp_path, monkeypatch):
+    path = os.path.join(str(tmp_path), 'frames.npy')
+    monkeypatch.setattr(NpyWriter, 'FLUSH_INTERVAL', 2)
+
+    writer = NpyWriter(path, (2,), 10)
+    # nothing is written yet
+    assert np.load(path).shape == (0, 2)
+
+    writer.extend(np.arange(6, dtype=np.uint8).reshape(3, 2))
+    # the header holds the frames written up to the last update, as after a
+    # crash
+    assert np.array_equal(np.load(path, mmap_mode='r'), np.arange(6).reshape(3, 2))
+
+    writer.close()
+    assert np.array_equal(np.load(path), np.arange(6).reshape(3, 2))
+
+
+
+def test_more_frames_than_the_capacity_are_rejected(tmp_path):
+    path = os.path.join(str(tmp_path), 'frames.npy')
+
+    with NpyWriter(path, (2,), 1) as writer:
+        writer.append(np.zeros(2, dtype=np.uint8))
+        with pytest.raises(AssertionError):
+            writer.append(np.zeros(2, dtype=np.uint8))
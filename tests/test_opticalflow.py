@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from lib.dataprocessing.opticalflow import OpticalFlow, parallel_optical_flow
+
+
+def faces(count: int, seed: int):
+    """Returns moving noise, such that the flow between the frames is not zero"""
+
+    noise = np.random.RandomState(seed).randint(0, 255, (32, 48)).astype(np.uint8)
+
+    return np.stack([np.roll(noise, (i, 2 * i), axis=(0, 1))[:24, :24] for i in range(count)])
+
+
+
+def serial_optical_flow(frames: np.ndarray, output: str):
+    optical_flow = OpticalFlow(output=output)
+
+    return [optical_flow.optical_flow(frames[i-1], frames[i]).copy() for i in range(1, len(frames))]
+
+
+
+@pytest.mark.parametrize('output', ['image', 'float16', 'int8'])
+def test_parallel_equals_serial(output):
+    sequences = [faces(40, 0), faces(1, 1), faces(25, 2)]
+
+    flows = parallel_optical_flow(sequences, 2, output=output)
+
+    assert [len(flow) for flow in flows] == [39, 0, 24]
+    for frames, flow in zip(sequences, flows):
+        for parallel, serial in zip(flow, serial_optical_flow(frames, output)):
+            assert np.array_equal(parallel, serial)